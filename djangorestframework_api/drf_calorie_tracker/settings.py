@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -43,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tracker.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -76,16 +80,168 @@ WSGI_APPLICATION = 'drf_calorie_tracker.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+#
+# DB_ENGINE picks the backend: 'sqlite' (the default) or 'postgresql', which
+# needs psycopg and reads DB_NAME, DB_USER, DB_PASSWORD, DB_HOST and DB_PORT.
+# Connections are reused for DB_CONN_MAX_AGE seconds (0 closes them after each
+# request, 'none' keeps them open) and checked before reuse.
+#
+# SQLite connections get one of SQLITE_PROFILES, chosen by DB_SQLITE_PROFILE.
+# 'tuned' lets readers run alongside a writer (WAL), waits for the write lock
+# instead of failing with "database is locked", and takes that lock when a
+# transaction begins so read-then-write transactions cannot deadlock.
+# `manage.py benchmark_concurrent_writes` compares the profiles.
+
+SQLITE_PROFILES = {
+    'default': {},
+    'tuned': {
+        'transaction_mode': 'IMMEDIATE',
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'mmap_size': 256 * 2 ** 20,
+            'temp_store': 'MEMORY',
+        },
+    },
 }
 
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = os.getenv('DB_CONN_MAX_AGE', '60')
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'tracker.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME') or BASE_DIR / 'db.sqlite3',
+            'OPTIONS': SQLITE_PROFILES[os.getenv('DB_SQLITE_PROFILE', 'tuned')],
+        }
+    }
+elif DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'calorie_tracker'),
+            'USER': os.getenv('DB_USER', ''),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', ''),
+            'PORT': os.getenv('DB_PORT', ''),
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"DB_ENGINE must be 'sqlite' or 'postgresql', not {DB_ENGINE!r}")
+
+DATABASES['default'].update({
+    'CONN_MAX_AGE': None if DB_CONN_MAX_AGE.lower() == 'none' else int(DB_CONN_MAX_AGE),
+    'CONN_HEALTH_CHECKS': True,
+})
+
 AUTH_USER_MODEL = 'tracker.UserProfile'
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Least recently used entries are culled once MAX_ENTRIES is reached.
+    'ai_responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ai-responses',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# AI21 client. API_HOST points the client at another server, e.g. a local fake
+# for load tests. MAX_CONCURRENCY bounds in-flight model calls per process.
+AI = {
+    'API_HOST': os.getenv('AI21_API_HOST') or None,
+    'TIMEOUT': float(os.getenv('AI21_TIMEOUT', 30)),
+    'MAX_CONCURRENCY': int(os.getenv('AI21_MAX_CONCURRENCY', 16)),
+    'MAX_CONNECTIONS': 32,
+}
+
+# ai_advice lists the day's foods by calories until its prompt reaches
+# ADVICE_MAX_CHARS characters (about a quarter as many tokens) and sums up
+# the rest of each meal type in one line.
+AI_PROMPTS = {
+    'ADVICE_MAX_CHARS': 4000,
+}
+
+# Users authenticated by JWT are cached for TIMEOUT seconds in CACHE and
+# dropped when saved, deleted or one of their tokens is blacklisted. With a
+# per-process cache, changes made in another worker show up after TIMEOUT.
+# None turns the cache off.
+AUTH_CACHE = {
+    'CACHE': 'default',
+    'TIMEOUT': 60,
+}
+
+# Token bucket limits on the AI endpoints, as (capacity, period): a burst of
+# up to capacity requests, refilled at capacity per period seconds. Each
+# endpoint has a bucket per user and one shared by all users, and GLOBAL is
+# shared by every AI endpoint; None turns a bucket off. Buckets live in each
+# process with LocalStorage, or in CACHE with CacheStorage to share them
+# between workers. Over the limit, requests get 429 with Retry-After.
+RATE_LIMITS = {
+    'ENABLED': True,
+    'STORAGE': 'tracker.ratelimit.LocalStorage',
+    'CACHE': 'default',
+    'MAX_BUCKETS': 100000,
+    'ENDPOINTS': {
+        'calculate_nutritional_value': {'user': (20, 60), 'endpoint': (600, 60)},
+        'ai_advice': {'user': (5, 60), 'endpoint': (120, 60)},
+    },
+    'GLOBAL': (600, 60),
+}
+
+# Queued ai_advice jobs, run by `manage.py process_advice_jobs`. Jobs for the
+# same user, meal type and day within COALESCE_WINDOW seconds are merged, new
+# jobs are refused past MAX_PENDING, and failures retry after RETRY_BACKOFF *
+# 2 ** (attempt - 1) seconds. A running job is re-queued once its LEASE expires.
+AI_JOBS = {
+    'WORKERS': 4,
+    'MAX_PENDING': 1000,
+    'QUEUE_FULL_RETRY_AFTER': 30,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_BACKOFF': 2,
+    'COALESCE_WINDOW': 60,
+    'LEASE': 120,
+    'POLL_INTERVAL': 0.5,
+}
+
+# AI answers are cached per normalized description. Set PERSISTENT_CACHE to a
+# DatabaseCache alias (see `manage.py createcachetable`) to keep them across
+# restarts and share them between workers.
+AI_CACHE = {
+    'CACHE': 'ai_responses',
+    'PERSISTENT_CACHE': None,
+    'TIMEOUT': 60 * 60 * 24 * 7,
+}
+
+# When a food item's nutrients change, its meals' stored portions and the daily
+# summaries are rewritten CHUNK_SIZE meals per transaction: right after the edit
+# commits, or by `manage.py process_portion_updates` when DEFER is set.
+PORTION_UPDATES = {
+    'DEFER': False,
+    'CHUNK_SIZE': 2000,
+    'POLL_INTERVAL': 1.0,
+}
+
+# Per-route latency, query counts and AI21 call durations are kept in each
+# process and served on /metrics to ALLOWED_IPS. Requests slower than
+# SLOW_REQUEST_SECONDS are logged to tracker.slow_requests with their
+# LOGGED_QUERIES slowest statements; None turns the log off.
+METRICS = {
+    'ENABLED': True,
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+    'SLOW_REQUEST_SECONDS': 1.0,
+    'LOGGED_QUERIES': 10,
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -133,13 +289,64 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS':
     'rest_framework.pagination.PageNumberPagination',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'tracker.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': [
         'rest_framework.filters.SearchFilter',
     ],
 }
 
+# Food search. SQLiteFTSBackend falls back to the in-process index when the
+# database has no FTS5 table. Search returns at most MAX_RESULTS matches.
+FOOD_SEARCH = {
+    'BACKEND': 'tracker.search.SQLiteFTSBackend',
+    'MAX_RESULTS': 500,
+}
+
+# Typeahead on /fooditems/autocomplete/ from a per-process prefix index. It is
+# rebuilt in the background every REFRESH_INTERVAL seconds, or sooner once
+# MAX_OVERLAY index entries were patched in.
+AUTOCOMPLETE = {
+    'LIMIT': 10,
+    'MAX_LIMIT': 25,
+    'MAX_OVERLAY': 50000,
+    'REFRESH_INTERVAL': 300,
+}
+
+# /fooditems/snapshot/ serves the whole catalog as a gzip'd NDJSON file from
+# DIRECTORY, rewritten at most every MIN_INTERVAL seconds while the catalog
+# changes; clients catch up from its version with /fooditems/changes/, which
+# returns LIMIT changes per page by default and at most MAX_LIMIT.
+CATALOG_SYNC = {
+    'DIRECTORY': os.getenv('CATALOG_SNAPSHOT_DIR') or BASE_DIR / 'catalog_snapshots',
+    'MIN_INTERVAL': 300,
+    'COMPRESSION': 6,
+    'LIMIT': 1000,
+    'MAX_LIMIT': 5000,
+}
+
+# /fooditems/frequent/ ranks each user's foods per meal type by use count, a
+# use counting twice as much as one from HALF_LIFE_DAYS earlier. Run
+# `manage.py rebuild_food_usage` after changing HALF_LIFE_DAYS.
+FREQUENT_FOODS = {
+    'HALF_LIFE_DAYS': 30,
+    'LIMIT': 10,
+    'MAX_LIMIT': 50,
+}
+
+# /usermeals/trends/ covers the last DEFAULT_DAYS days unless given a range,
+# and at most MAX_DAYS. A day is on target when its calories are within
+# TOLERANCE of the user's target. Results are cached for TIMEOUT seconds in
+# CACHE and dropped when the user's meals or targets change; None turns the
+# cache off.
+TRENDS = {
+    'CACHE': 'default',
+    'TIMEOUT': 3600,
+    'DEFAULT_DAYS': 90,
+    'MAX_DAYS': 5 * 366,
+    'TOLERANCE': 0.1,
+}
+
 from datetime import timedelta
 
 SIMPLE_JWT = {
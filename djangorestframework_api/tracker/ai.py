@@ -0,0 +1,171 @@
+import asyncio
+import contextlib
+import contextvars
+import os
+import threading
+import weakref
+
+import httpx
+from ai21 import AI21Client, AsyncAI21Client
+from ai21.models.chat import ChatMessage
+from django.conf import settings
+from django.utils import timezone
+from dotenv import load_dotenv
+
+from .ai_parsing import nutrition_parser
+from .metrics import observe_upstream
+from .prompts import advice_intake, advice_prompt, nutrition_prompt
+
+AI_MODEL = "jamba-instruct-preview"
+
+
+_client = None
+_client_lock = threading.Lock()
+
+# Async clients hold connections bound to the event loop that opened them.
+# Under ASGI the process runs one long-lived loop, which keeps its client.
+# Under WSGI every request runs on a loop of its own, so ai_client_scope()
+# gives the request a client that is closed when it ends.
+_async_clients = weakref.WeakKeyDictionary()
+_scoped_clients = contextvars.ContextVar('scoped_ai_clients', default=None)
+_limiter = None
+
+
+class ConcurrencyLimiter:
+    """
+    Bounds in-flight model calls across every event loop and thread of the
+    process, which an asyncio.Semaphore, bound to one loop, cannot. Waiters
+    poll rather than block so they never stall their loop.
+    """
+
+    MAX_POLL_INTERVAL = 0.05
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    async def __aenter__(self):
+        interval = 0.001
+        while not self._semaphore.acquire(blocking=False):
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, self.MAX_POLL_INTERVAL)
+
+    async def __aexit__(self, *exc_info):
+        self._semaphore.release()
+
+
+def _client_options():
+    load_dotenv()
+    return {
+        'api_key': os.getenv("AI21_API_KEY"),
+        'api_host': settings.AI['API_HOST'],
+        'timeout_sec': settings.AI['TIMEOUT'],
+    }
+
+
+def get_ai_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = AI21Client(**_client_options())
+    return _client
+
+
+def _new_async_client():
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=settings.AI['MAX_CONNECTIONS']),
+        timeout=settings.AI['TIMEOUT'],
+    )
+    return AsyncAI21Client(http_client=http_client, **_client_options()), http_client
+
+
+def get_concurrency_limiter():
+    global _limiter
+    with _client_lock:
+        if _limiter is None or _limiter.limit != settings.AI['MAX_CONCURRENCY']:
+            _limiter = ConcurrencyLimiter(settings.AI['MAX_CONCURRENCY'])
+    return _limiter
+
+
+def get_async_ai_client():
+    """(client, limiter): the client of the current ai_client_scope() or event loop, and the process limiter."""
+    scoped = _scoped_clients.get()
+    if scoped is not None:
+        if not scoped:
+            scoped.append(_new_async_client())
+        return scoped[0][0], get_concurrency_limiter()
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        _async_clients[loop] = _new_async_client()
+    return _async_clients[loop][0], get_concurrency_limiter()
+
+
+@contextlib.asynccontextmanager
+async def ai_client_scope():
+    """Give the AI calls in the block a client of their own, opened on first use and closed on exit."""
+    scoped = []
+    token = _scoped_clients.set(scoped)
+    try:
+        yield
+    finally:
+        _scoped_clients.reset(token)
+        for _, http_client in scoped:
+            await http_client.aclose()
+
+
+def _chat_request(prompt):
+    messages = [
+        ChatMessage(role="user", content=prompt)
+    ]
+    return dict(
+        model=AI_MODEL,
+        messages=messages,
+        top_p=0.8,  # Налаштування для гнучкості відповідей
+        temperature=0.1  # Трохи знижено для більшої точності
+    )
+
+
+def _answer(response):
+    full_response = response.dict()
+    return full_response["choices"][0]["message"]["content"]
+
+
+def complete(client, prompt):
+    with observe_upstream('ai21'):
+        response = client.chat.completions.create(**_chat_request(prompt))
+    return _answer(response)
+
+
+async def acomplete(prompt):
+    """
+    Ask the model without blocking the event loop. Waiting for a free slot
+    counts towards the timeout, which raises TimeoutError.
+    """
+    client, limiter = get_async_ai_client()
+
+    async def call():
+        async with limiter:
+            with observe_upstream('ai21'):
+                response = await client.chat.completions.create(**_chat_request(prompt))
+            return _answer(response)
+
+    return await asyncio.wait_for(call(), settings.AI['TIMEOUT'])
+
+
+def parse_nutritional_values(assistant_content):
+    """Per-100-unit values from the model's answer, or {} if it holds no usable values."""
+    return nutrition_parser.parse(assistant_content)
+
+
+def estimate_nutritional_value(description):
+    return parse_nutritional_values(complete(get_ai_client(), nutrition_prompt(description)))
+
+
+async def aestimate_nutritional_value(description):
+    return parse_nutritional_values(await acomplete(nutrition_prompt(description)))
+
+
+def advise(user, meal_type, tz=None):
+    now = timezone.localtime(timezone=tz)
+    rows = list(advice_intake(user, meal_type, now))
+    return complete(get_ai_client(), advice_prompt(user, meal_type, rows, now))
@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import re
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+UNIT_ALIASES = {
+    'g': 'g', 'gr': 'g', 'gram': 'g', 'grams': 'g', 'gramm': 'g', 'gramme': 'g', 'grammes': 'g',
+    'kg': 'kg', 'kilo': 'kg', 'kilos': 'kg', 'kilogram': 'kg', 'kilograms': 'kg',
+    'ml': 'ml', 'milliliter': 'ml', 'milliliters': 'ml', 'millilitre': 'ml', 'millilitres': 'ml',
+    'l': 'l', 'liter': 'l', 'liters': 'l', 'litre': 'l', 'litres': 'l',
+    'pc': 'pcs', 'pcs': 'pcs', 'piece': 'pcs', 'pieces': 'pcs',
+    'tbsp': 'tbsp', 'tablespoon': 'tbsp', 'tablespoons': 'tbsp',
+    'tsp': 'tsp', 'teaspoon': 'tsp', 'teaspoons': 'tsp',
+    'oz': 'oz', 'ounce': 'oz', 'ounces': 'oz',
+    'cup': 'cup', 'cups': 'cup',
+}
+
+QUANTITY_RE = re.compile(
+    r'(\d+(?:[.,]\d+)?)\s*(%s)\b' % '|'.join(sorted(UNIT_ALIASES, key=len, reverse=True))
+)
+SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_description(description):
+    """Fold case, whitespace, decimal commas and unit spellings so equivalent dishes share a key."""
+    text = SPACE_RE.sub(' ', str(description).casefold()).strip(' .!;')
+    return QUANTITY_RE.sub(
+        lambda match: match.group(1).replace(',', '.') + UNIT_ALIASES[match.group(2)], text
+    )
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """
+    Caches AI answers per normalized prompt input. Lookups go to the fast
+    cache first and then to the optional persistent one; concurrent misses
+    for the same key share a single upstream call.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._ainflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def tiers(self):
+        config = settings.AI_CACHE
+        aliases = [config['CACHE'], config.get('PERSISTENT_CACHE')]
+        return [caches[alias] for alias in aliases if alias]
+
+    def make_key(self, text):
+        digest = hashlib.sha256(normalize_description(text).encode()).hexdigest()
+        return f'{self.namespace}:{digest}'
+
+    def _lookup(self, key):
+        for position, cache in enumerate(self.tiers):
+            value = cache.get(key)
+            if value is not None:
+                for faster in self.tiers[:position]:
+                    faster.set(key, value, settings.AI_CACHE['TIMEOUT'])
+                return value
+        return None
+
+    def _store(self, key, value):
+        for cache in self.tiers:
+            cache.set(key, value, settings.AI_CACHE['TIMEOUT'])
+
+    async def _alookup(self, key):
+        tiers = self.tiers
+        for position, cache in enumerate(tiers):
+            value = await cache.aget(key)
+            if value is not None:
+                for faster in tiers[:position]:
+                    await faster.aset(key, value, settings.AI_CACHE['TIMEOUT'])
+                return value
+        return None
+
+    async def _astore(self, key, value):
+        for cache in self.tiers:
+            await cache.aset(key, value, settings.AI_CACHE['TIMEOUT'])
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get_or_compute(self, text, compute):
+        """
+        Return ``(value, cached)``. ``compute(text)`` runs only on a miss and
+        falsy results are not stored, so failed answers are retried.
+        """
+        key = self.make_key(text)
+        value = self._lookup(key)
+        if value is not None:
+            self._count('hits')
+            return value, True
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            flight.event.wait()
+            self._count('coalesced')
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, True
+
+        try:
+            self._count('misses')
+            flight.value = compute(text)
+            if flight.value:
+                self._store(key, flight.value)
+            return flight.value, False
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.event.set()
+
+    async def aget_or_compute(self, text, compute):
+        """Async counterpart of get_or_compute; ``compute`` is a coroutine function."""
+        key = self.make_key(text)
+        value = await self._alookup(key)
+        if value is not None:
+            self._count('hits')
+            return value, True
+
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        future = self._ainflight.get(flight_key)
+        if future is not None:
+            self._count('coalesced')
+            return await asyncio.shield(future), True
+
+        future = self._ainflight[flight_key] = loop.create_future()
+        try:
+            self._count('misses')
+            value = await compute(text)
+            if value:
+                await self._astore(key, value)
+            future.set_result(value)
+            return value, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            # Mark the exception as retrieved in case nobody else was waiting.
+            future.exception()
+            raise
+        finally:
+            del self._ainflight[flight_key]
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced}
+
+
+nutrition_cache = ResponseCache('nutrition')
@@ -0,0 +1,218 @@
+"""
+Parsing of the model's nutrition answers. An answer is read as JSON first,
+the whole text or the outermost {...} in it, and otherwise by one pass of a
+scanner for "name: number unit" pairs, so fenced, chatty or slightly
+malformed answers still parse. Values are converted to kcal and grams,
+checked against what food can contain and scaled to 100 units of the dish.
+
+Kept free of Django imports, like catalog_parsing.
+"""
+import json
+import math
+import re
+import threading
+from functools import lru_cache
+
+FIELDS = ('calories', 'protein', 'fat', 'carbohydrates', 'weight')
+MACROS = ('protein', 'fat', 'carbohydrates')
+
+# Names the model uses for each field, lowercase with spaces as written.
+ALIASES = {
+    'calories': ('calories', 'calorie', 'total calories', 'energy', 'kcal'),
+    'protein': ('protein', 'proteins', 'total protein'),
+    'fat': ('fat', 'fats', 'total fat'),
+    'carbohydrates': ('carbohydrates', 'carbohydrate', 'total carbohydrates', 'carbs', 'carb'),
+    'weight': ('weight', 'total weight', 'weight of dish', 'weight of the dish', 'total weight of the dish'),
+}
+FIELD_BY_NAME = {
+    re.sub(r'[^a-z]', '', alias): field for field, aliases in ALIASES.items() for alias in aliases
+}
+
+# Factors to kcal, grams, or millilitres taken as grams for the dish weight.
+ENERGY_UNITS = {'kcal': 1, 'cal': 1, 'calories': 1, 'kj': 1 / 4.184}
+MASS_UNITS = {'g': 1, 'gram': 1, 'grams': 1, 'mg': 0.001, 'kg': 1000, 'oz': 28.3495}
+VOLUME_UNITS = {'ml': 1, 'l': 1000}
+UNITS = {
+    'calories': ENERGY_UNITS,
+    'protein': MASS_UNITS,
+    'fat': MASS_UNITS,
+    'carbohydrates': MASS_UNITS,
+    'weight': {**MASS_UNITS, **VOLUME_UNITS},
+}
+ALL_UNITS = sorted({unit for units in UNITS.values() for unit in units}, key=len, reverse=True)
+
+# Limits per 100 units of the dish: pure fat has 900 kcal and no food holds
+# more than 100 g of macronutrients, give or take rounding.
+MAX_CALORIES = 950
+MAX_MACROS = 105
+
+# Thousands may be grouped with commas, as in 1,250.
+NUMBER = r'[-+]?(?:\d{1,3}(?:,\d{3})+(?:\.\d*)?|\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?'
+UNIT = r'(?:{})(?![a-z])'.format('|'.join(ALL_UNITS))
+
+FIELD_RE = re.compile(
+    r'(?<![a-z])(?P<name>{names})(?:[ _]*\(?(?P<name_unit>{unit})\)?)?["\'*]*\s*[:=]\s*["\']?\s*'
+    r'(?P<number>{number})\s*(?P<unit>{unit})?'.format(
+        names='|'.join(
+            alias.replace(' ', '[ _]') for alias in sorted(
+                (alias for aliases in ALIASES.values() for alias in aliases), key=len, reverse=True,
+            )
+        ),
+        unit=UNIT,
+        number=NUMBER,
+    ),
+    re.IGNORECASE,
+)
+VALUE_RE = re.compile(r'\s*(?P<number>{number})\s*(?P<unit>{unit})?'.format(number=NUMBER, unit=UNIT), re.IGNORECASE)
+KEY_UNIT_RE = re.compile(r'^(?P<name>.*?)[ _]*\(?(?P<unit>{unit})?\)?$'.format(unit=UNIT), re.IGNORECASE)
+
+
+class ParseError(ValueError):
+    """An answer without usable values; ``reason`` labels the parse metric."""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def to_number(text):
+    return float(text.replace(',', ''))
+
+
+@lru_cache(maxsize=1024)
+def field_for_key(key):
+    """(field, unit named in the key or None) for a JSON key, or (None, None)."""
+    match = KEY_UNIT_RE.match(key.strip().lower())
+    field = FIELD_BY_NAME.get(re.sub(r'[^a-z]', '', match.group('name')))
+    if field is not None:
+        return field, match.group('unit')
+    return FIELD_BY_NAME.get(re.sub(r'[^a-z]', '', key.lower())), None
+
+
+def json_value(value):
+    """(number, unit or None) of a JSON value: a number, "12.5 g" or {"value": 12.5, "unit": "g"}."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value), None
+    if isinstance(value, str):
+        match = VALUE_RE.fullmatch(value.strip())
+        if match:
+            return to_number(match.group('number')), match.group('unit')
+        return None
+    if isinstance(value, dict):
+        number = value.get('value', value.get('amount'))
+        if isinstance(number, (int, float)) and not isinstance(number, bool):
+            unit = value.get('unit')
+            return float(number), unit if isinstance(unit, str) else None
+    return None
+
+
+def collect(data, found):
+    """Fill ``found`` with the fields of a JSON object, looking into nested objects for missing ones."""
+    nested = []
+    for key, value in data.items():
+        field, key_unit = field_for_key(key) if isinstance(key, str) else (None, None)
+        if field is not None and field not in found:
+            parsed = json_value(value)
+            if parsed is not None:
+                found[field] = (parsed[0], parsed[1] or key_unit)
+                continue
+        if isinstance(value, dict):
+            nested.append(value)
+    for value in nested:
+        if len(found) == len(FIELDS):
+            break
+        collect(value, found)
+    return found
+
+
+def load_json(text):
+    """The JSON object in ``text``: all of it, or from its first '{' to its last '}'."""
+    for candidate in (text, text[text.find('{'):text.rfind('}') + 1]):
+        if not candidate:
+            continue
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            return data
+    return None
+
+
+def scan(text):
+    """The first value of each field found in ``text``, in one pass."""
+    found = {}
+    for match in FIELD_RE.finditer(text):
+        field = FIELD_BY_NAME[re.sub(r'[^a-z]', '', match.group('name').lower())]
+        if field not in found:
+            found[field] = (to_number(match.group('number')), match.group('unit') or match.group('name_unit'))
+    return found
+
+
+def normalize(found):
+    """Per-100-unit values from {field: (number, unit)}; raises ParseError if they make no sense."""
+    if len(found) < len(FIELDS):
+        raise ParseError('missing')
+    values = {}
+    for field, (number, unit) in found.items():
+        if unit is not None:
+            factor = UNITS[field].get(unit.lower())
+            if factor is None:
+                raise ParseError('bad_unit')
+            number *= factor
+        if not math.isfinite(number) or number < 0:
+            raise ParseError('out_of_range')
+        values[field] = number
+
+    weight = values.pop('weight')
+    if weight <= 0:
+        raise ParseError('out_of_range')
+    values = {field: value * 100 / weight for field, value in values.items()}
+    if values['calories'] > MAX_CALORIES or sum(values[macro] for macro in MACROS) > MAX_MACROS:
+        raise ParseError('out_of_range')
+    return {
+        **{field: round(values[field], 2) for field in FIELDS if field != 'weight'},
+        'weight': 100,
+    }
+
+
+class NutritionParser:
+    """Parses answers and counts the results, which /metrics exports."""
+
+    RESULTS = ('json', 'scanned', 'missing', 'bad_unit', 'out_of_range')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = {}
+
+    def parse(self, text):
+        """Per-100-unit values of the answer ``text``, or {} if it holds no usable values."""
+        text = text or ''
+        data = load_json(text)
+        found = collect(data, {}) if data is not None else {}
+        result = 'json'
+        if len(found) < len(FIELDS):
+            # The model wrote something other than one JSON object with every field.
+            found = {**scan(text), **found}
+            result = 'scanned'
+        try:
+            values = normalize(found)
+        except ParseError as error:
+            values, result = {}, error.reason
+        with self._lock:
+            self._results[result] = self._results.get(result, 0) + 1
+        return values
+
+    def results(self):
+        """{result: count}, with every result present."""
+        with self._lock:
+            return {result: self._results.get(result, 0) for result in self.RESULTS}
+
+    def reset(self):
+        with self._lock:
+            self._results.clear()
+
+
+nutrition_parser = NutritionParser()
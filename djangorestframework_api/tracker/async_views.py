@@ -0,0 +1,102 @@
+import json
+import math
+from functools import wraps
+
+import httpx
+from ai21.errors import AI21APIError
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+
+from .ai import acomplete, aestimate_nutritional_value, ai_client_scope
+from .ai_cache import nutrition_cache
+from .authentication import CachedJWTAuthentication
+from .dates import get_timezone
+from .prompts import advice_intake, advice_prompt
+from .ratelimit import rate_limiter
+
+# The AI endpoints are plain async Django views rather than DRF actions, so
+# under ASGI a request waiting on the model does not hold a worker thread.
+# They still run under WSGI, each request on an event loop of its own.
+
+
+def unauthorized(authenticator, request, data):
+    response = JsonResponse(data, status=401)
+    response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+    return response
+
+
+def ai_endpoint(view):
+    @csrf_exempt
+    @wraps(view)
+    async def wrapper(request):
+        if request.method != 'POST':
+            return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+        authenticator = CachedJWTAuthentication()
+        try:
+            result = await sync_to_async(authenticator.authenticate)(request)
+        except AuthenticationFailed as error:
+            # The body DRF's exception handler would give, e.g. simplejwt's token_not_valid details.
+            detail = error.detail
+            return unauthorized(authenticator, request, detail if isinstance(detail, dict) else {'detail': detail})
+        if result is None:
+            return unauthorized(authenticator, request, {'detail': 'Authentication credentials were not provided.'})
+        user = result[0]
+
+        wait = await rate_limiter.acheck(view.__name__, user)
+        if wait:
+            retry_after = math.ceil(wait)
+            response = JsonResponse(
+                {'detail': f'Request was throttled. Expected available in {retry_after} seconds.'}, status=429,
+            )
+            response['Retry-After'] = str(retry_after)
+            return response
+
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            data = request.POST
+        if not isinstance(data, dict):
+            return JsonResponse({'detail': 'Expected a JSON object.'}, status=400)
+
+        try:
+            if isinstance(request, ASGIRequest):
+                return await view(request, user, data)
+            # Under WSGI the event loop ends with the request, and so must its client.
+            async with ai_client_scope():
+                return await view(request, user, data)
+        except TimeoutError:
+            return JsonResponse({'detail': 'The AI service took too long to answer.'}, status=504)
+        except (AI21APIError, httpx.HTTPError):
+            return JsonResponse({'detail': 'The AI service is unavailable.'}, status=502)
+
+    return wrapper
+
+
+@ai_endpoint
+async def calculate_nutritional_value(request, user, data):
+    description = data.get('description')
+
+    nutritional_data, cached = await nutrition_cache.aget_or_compute(description, aestimate_nutritional_value)
+
+    response = JsonResponse(nutritional_data)
+    response['X-Cache'] = 'HIT' if cached else 'MISS'
+    return response
+
+
+@ai_endpoint
+async def ai_advice(request, user, data):
+    meal_type = data.get('meal_type')
+    try:
+        now = timezone.localtime(timezone=get_timezone(data.get('tz')))
+    except ValueError as error:
+        return JsonResponse({'detail': str(error)}, status=400)
+
+    rows = [row async for row in advice_intake(user, meal_type, now)]
+
+    assistant_content = await acomplete(advice_prompt(user, meal_type, rows, now))
+    return JsonResponse(assistant_content, safe=False)
@@ -0,0 +1,83 @@
+"""
+JWT authentication that keeps recently seen users in AUTH_CACHE, so most
+requests need no user query. Entries are dropped when the user row is saved
+or deleted, which covers profile edits, password changes and deactivation,
+and when one of the user's tokens is blacklisted.
+
+Each entry carries the user's generation, a token replaced on every
+invalidation, so a user loaded before an invalidation and stored after it is
+never served. With a per-process cache, writes made by other workers are
+only seen once the entry expires after AUTH_CACHE['TIMEOUT'] seconds.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+def user_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def generation_key(user_id):
+    return f'auth-user-generation:{user_id}'
+
+
+def forget_users(user_ids):
+    """
+    Drop the cached users with ``user_ids``; call after changing them
+    without save(). They are dropped again once the current transaction
+    commits, since a request may cache the old row until then.
+    """
+    if settings.AUTH_CACHE['TIMEOUT'] is None:
+        return
+    user_ids = list(user_ids)
+    _forget(user_ids)
+    transaction.on_commit(lambda: _forget(user_ids))
+
+
+def _forget(user_ids):
+    config = settings.AUTH_CACHE
+    cache = caches[config['CACHE']]
+    # Outlives any entry stored before it, so those entries can never match again.
+    cache.set_many({generation_key(user_id): uuid.uuid4().hex for user_id in user_ids}, config['TIMEOUT'])
+    cache.delete_many([user_key(user_id) for user_id in user_ids])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        config = settings.AUTH_CACHE
+        if config['TIMEOUT'] is None:
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        cache = caches[config['CACHE']]
+        found = cache.get_many([user_key(user_id), generation_key(user_id)])
+        generation = found.get(generation_key(user_id))
+        entry = found.get(user_key(user_id))
+        if entry is not None and entry[0] == generation:
+            user = entry[1]
+            self.check_password_unchanged(user, validated_token)
+            return user
+
+        user = super().get_user(validated_token)
+        cache.set(user_key(user_id), (generation, user), config['TIMEOUT'])
+        return user
+
+    @staticmethod
+    def check_password_unchanged(user, validated_token):
+        # Inactive users are never cached; saving is_active drops the entry.
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
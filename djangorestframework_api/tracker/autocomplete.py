@@ -0,0 +1,325 @@
+"""
+Per-process prefix index behind /fooditems/autocomplete/. Name and producer
+tokens are folded (case and accents) and stored as a sorted vocabulary with
+one posting array per token, so a prefix is two bisects and a slice scan.
+
+Edits made in this process are patched into a small sorted overlay. A full
+rebuild from the database runs in a background thread once the overlay is
+large or the index is older than REFRESH_INTERVAL, which also picks up
+writes made by other processes and bulk imports.
+"""
+import logging
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+import numpy as np
+
+from django.conf import settings
+from django.db import connection
+
+from .models import FoodItem
+from .search import tokenize
+
+logger = logging.getLogger(__name__)
+
+NAME, PRODUCER = 0, 1
+
+# Sorts after every token that starts with a given prefix.
+PREFIX_END = '\U0010ffff'
+
+SCAN_CHUNK = 1024
+
+
+def fold(text):
+    text = text or ''
+    if text.isascii():
+        return text.casefold()
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def fold_tokens(text):
+    return tokenize(fold(text))
+
+
+class Snapshot:
+    """
+    Items live in parallel arrays indexed by slot. Slots of the items loaded
+    from the database are assigned in name order and each posting is
+    ``field * size + slot``, so sorted postings list name matches
+    alphabetically before producer matches. Every loaded slot also lists the
+    vocabulary positions of its tokens, which lets candidates be checked
+    against further prefixes without touching the rest of the catalog.
+
+    Edits replace ``alive`` and ``overlay`` rather than changing them, so
+    lookups can run without the index lock on whatever they read first.
+    """
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: (fold(row[1]), row[0]))
+        self.ids = array('q')
+        self.names = []
+        self.producers = []
+        self.calories = array('d')
+        self.slots = {}
+        self.size = len(rows) or 1
+        self.built = len(rows)
+
+        postings = defaultdict(lambda: array('i'))
+        item_tokens = []
+        for slot, (food_item_id, name, producer, calories) in enumerate(rows):
+            self._store(food_item_id, name, producer, calories)
+            tokens = []
+            for field, field_tokens in self.tokens(name, producer):
+                for token in field_tokens:
+                    postings[token].append(field * self.size + slot)
+                    tokens.append(token)
+            item_tokens.append(tokens)
+
+        self.vocabulary = sorted(postings)
+        starts = array('q', [0])
+        flat = array('i')
+        for token in self.vocabulary:
+            flat.extend(sorted(postings[token]))
+            starts.append(len(flat))
+        self.starts = np.frombuffer(starts, dtype=np.int64)
+        self.postings = np.frombuffer(flat, dtype=np.int32)
+
+        positions = {token: position for position, token in enumerate(self.vocabulary)}
+        item_starts = array('q', [0])
+        item_flat = array('i')
+        for tokens in item_tokens:
+            item_flat.extend(positions[token] for token in tokens)
+            item_starts.append(len(item_flat))
+        self.item_starts = np.frombuffer(item_starts, dtype=np.int64)
+        self.item_tokens = np.frombuffer(item_flat, dtype=np.int32)
+
+        self.alive = b'\x01' * len(rows)
+        # (token, field, folded name, slot) of items stored after the build, kept sorted.
+        self.overlay = []
+
+    @staticmethod
+    def tokens(name, producer):
+        name_tokens = set(fold_tokens(name))
+        return (NAME, name_tokens), (PRODUCER, set(fold_tokens(producer)) - name_tokens)
+
+    def _store(self, food_item_id, name, producer, calories):
+        slot = len(self.ids)
+        self.ids.append(food_item_id)
+        self.names.append(name)
+        self.producers.append(producer)
+        self.calories.append(calories)
+        self.slots[food_item_id] = slot
+        return slot
+
+    def apply(self, change):
+        """Replay a change recorded by AutocompleteIndex: (id,) to remove, else a full row."""
+        if len(change) == 1:
+            self.discard(*change)
+        else:
+            self.put(*change)
+
+    def put(self, food_item_id, name, producer, calories):
+        self.discard(food_item_id)
+        slot = self._store(food_item_id, name, producer, calories)
+        folded = fold(name)
+        overlay = list(self.overlay)
+        for field, tokens in self.tokens(name, producer):
+            for token in tokens:
+                insort(overlay, (token, field, folded, slot))
+        # alive grows before the overlay names the slot; lookups read them the other way round.
+        self.alive += b'\x01'
+        self.overlay = overlay
+
+    def discard(self, food_item_id):
+        slot = self.slots.pop(food_item_id, None)
+        if slot is not None:
+            self.alive = self.alive[:slot] + b'\x00' + self.alive[slot + 1:]
+
+    def _positions(self, prefix):
+        """The vocabulary positions of the tokens starting with ``prefix``, as a range."""
+        first = bisect_left(self.vocabulary, prefix)
+        return first, bisect_left(self.vocabulary, prefix + PREFIX_END, first)
+
+    def _entries(self, prefix):
+        """Start and stop in ``postings`` of the tokens starting with ``prefix``; they are contiguous."""
+        first, last = self._positions(prefix)
+        return int(self.starts[first]), int(self.starts[last])
+
+    @staticmethod
+    def _overlay(overlay, prefix):
+        return overlay[bisect_left(overlay, (prefix,)):bisect_left(overlay, (prefix + PREFIX_END,))]
+
+    def count(self, prefix, overlay):
+        start, stop = self._entries(prefix)
+        return stop - start + len(self._overlay(overlay, prefix))
+
+    def _has_token(self, slots, first, last):
+        """Which of the loaded ``slots`` have a token at a vocabulary position in [first, last)."""
+        begins = self.item_starts[slots]
+        lengths = self.item_starts[slots + 1] - begins
+        bounds = np.concatenate([[0], np.cumsum(lengths)])
+        offsets = np.arange(bounds[-1]) + np.repeat(begins - bounds[:-1], lengths)
+        tokens = self.item_tokens[offsets]
+        hits = np.concatenate([[0], np.cumsum((tokens >= first) & (tokens < last))])
+        return hits[bounds[1:]] > hits[bounds[:-1]]
+
+    def _matches(self, slot, terms):
+        tokens = [token for _, field_tokens in self.tokens(self.names[slot], self.producers[slot]) for token in field_tokens]
+        return all(any(token.startswith(term) for token in tokens) for term in terms)
+
+    @staticmethod
+    def _ranked(keys):
+        """Chunks of ``keys`` in ascending order, sorting only the first chunk unless more are needed."""
+        if len(keys) > SCAN_CHUNK:
+            head = np.sort(np.partition(keys, SCAN_CHUNK - 1)[:SCAN_CHUNK])
+            yield head
+            # Keys equal to the last are the same item under another token.
+            keys = keys[keys > head[-1]]
+        keys = np.sort(keys)
+        for start in range(0, len(keys), SCAN_CHUNK):
+            yield keys[start:start + SCAN_CHUNK]
+
+    def lookup(self, terms, limit):
+        """
+        The first ``limit`` live slots matching every prefix in ``terms``,
+        name matches before producer matches, each in name order. Matches of
+        the term with the fewest are ranked and the other terms checked on
+        them alone, so common terms stay cheap.
+        """
+        overlay = self.overlay
+        alive = np.frombuffer(self.alive, dtype=bool)
+        counts = {term: self.count(term, overlay) for term in terms}
+        driver = min(counts, key=counts.get)
+        others = [term for term in counts if term != driver]
+        ranges = [self._positions(term) for term in others]
+
+        start, stop = self._entries(driver)
+        keys = self.postings[start:stop]
+        keys = keys[alive[keys % self.size]]
+        found = []
+        seen = set()
+        for chunk in self._ranked(keys):
+            slots = chunk % self.size
+            keep = np.ones(len(chunk), dtype=bool)
+            for first, last in ranges:
+                keep &= self._has_token(slots, first, last)
+            for key in chunk[keep].tolist():
+                slot = key % self.size
+                if slot not in seen:
+                    seen.add(slot)
+                    found.append((key // self.size, slot))
+                    if len(found) == limit:
+                        break
+            if len(found) == limit:
+                break
+
+        edited = [
+            (field, folded, slot) for _, field, folded, slot in self._overlay(overlay, driver)
+            if alive[slot] and self._matches(slot, others)
+        ]
+        if not edited:
+            return [slot for _, slot in found]
+
+        # Edited items sort in among the loaded matches by the same key.
+        slots = []
+        for *_, slot in sorted([(field, fold(self.names[slot]), slot) for field, slot in found] + edited):
+            if slot not in slots:
+                slots.append(slot)
+        return slots[:limit]
+
+    def result(self, slot):
+        return {
+            'id': self.ids[slot],
+            'name': self.names[slot],
+            'producer': self.producers[slot],
+            'calories': self.calories[slot],
+        }
+
+
+class AutocompleteIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._built_at = 0.0
+        self._rebuilding = None
+        self._changes = []
+
+    def _load(self):
+        rows = FoodItem.objects.values_list('id', 'name', 'producer', 'calories')
+        return Snapshot(rows.iterator(chunk_size=10000))
+
+    def rebuild(self):
+        """Load the whole catalog now, in the calling thread."""
+        snapshot = self._load()
+        with self._lock:
+            self._snapshot = snapshot
+            self._built_at = time.monotonic()
+
+    def _rebuild_in_background(self):
+        try:
+            snapshot = self._load()
+        except Exception:
+            logger.exception('Rebuilding the autocomplete index failed')
+            with self._lock:
+                # Keep serving the old index and try again after REFRESH_INTERVAL.
+                self._built_at = time.monotonic()
+                self._changes = []
+                self._rebuilding = None
+            return
+        finally:
+            connection.close()
+        with self._lock:
+            # Changes seen while loading may or may not be in the snapshot;
+            # replaying them is harmless either way.
+            for change in self._changes:
+                snapshot.apply(change)
+            self._snapshot = snapshot
+            self._built_at = time.monotonic()
+            self._changes = []
+            self._rebuilding = None
+
+    def _maybe_refresh(self):
+        if self._rebuilding is not None:
+            return
+        config = settings.AUTOCOMPLETE
+        stale = config['REFRESH_INTERVAL'] is not None and time.monotonic() - self._built_at > config['REFRESH_INTERVAL']
+        if self._snapshot is None or stale or len(self._snapshot.overlay) > config['MAX_OVERLAY']:
+            self._rebuilding = threading.Thread(target=self._rebuild_in_background, daemon=True)
+            self._rebuilding.start()
+
+    def _record(self, change):
+        with self._lock:
+            if self._rebuilding is not None:
+                self._changes.append(change)
+            if self._snapshot is not None:
+                self._snapshot.apply(change)
+                self._maybe_refresh()
+
+    def index(self, food_item):
+        self._record((food_item.pk, food_item.name, food_item.producer, food_item.calories))
+
+    def remove(self, food_item_id):
+        self._record((food_item_id,))
+
+    def lookup(self, query, limit):
+        """
+        Up to ``limit`` items whose name or producer has a token starting
+        with each term of ``query``, or None while the index is first loading.
+        """
+        terms = fold_tokens(query)
+        if not terms:
+            return []
+        with self._lock:
+            self._maybe_refresh()
+            snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        return [snapshot.result(slot) for slot in snapshot.lookup(terms, limit)]
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,30 @@
+"""
+SQLite with two options the stock backend lacks in Django 5.0:
+
+- ``pragmas``: PRAGMA name -> value, set on every new connection.
+- ``transaction_mode``: how transactions begin, e.g. 'IMMEDIATE' to take the
+  write lock up front. A deferred transaction that reads before it writes
+  fails at once with "database is locked" when another connection wrote in
+  the meantime, without waiting for busy_timeout.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = params.pop('pragmas', {})
+        self.transaction_mode = params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
+        else:
+            super()._start_transaction_under_autocommit()
@@ -0,0 +1,231 @@
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from statistics import quantiles
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from .models import FoodItem, UserMeal, UserProfile
+from .targets import TARGET_FIELDS, calculate_targets_batch, profile_inputs
+
+FOOD_WORDS = [
+    'apple', 'banana', 'bread', 'butter', 'cheese', 'chicken', 'chocolate',
+    'cookie', 'cream', 'egg', 'fish', 'honey', 'juice', 'milk', 'oat',
+    'orange', 'pasta', 'pork', 'potato', 'rice', 'salad', 'salmon', 'sauce',
+    'soup', 'steak', 'sugar', 'tomato', 'tuna', 'wheat', 'yogurt',
+]
+PRODUCERS = [
+    'farmhouse', 'goldfield', 'greenvalley', 'homemade', 'nordic', 'organic',
+    'riverside', 'sunrise', 'tablycjakalorijnosti', 'village',
+]
+
+
+@contextmanager
+def isolated_database(name=None):
+    """
+    Run the block against a throwaway test database with the test client
+    enabled. ``name`` overrides the test database name, e.g. a file path to
+    keep SQLite off its in-memory default.
+    """
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    old_test = connection.settings_dict['TEST']
+    if name is not None:
+        connection.settings_dict['TEST'] = {**old_test, 'NAME': name}
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        connection.settings_dict['TEST'] = old_test
+        teardown_test_environment()
+
+
+def get_benchmark_user(username='benchmark'):
+    user, _ = UserProfile.objects.get_or_create(
+        username=username,
+        defaults=dict(gender='M', age=30, height=180, weight=80, activity_level='M', goal='M'),
+    )
+    return user
+
+
+def food_name(rng):
+    return ' '.join(rng.sample(FOOD_WORDS, rng.randint(1, 3))) + f' {rng.randint(1, 999)}'
+
+
+def create_food_items(owner, count, rng=None, batch_size=5000):
+    rng = rng or random.Random(0)
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        food_items = [
+            FoodItem(
+                owner=owner,
+                name=food_name(rng),
+                producer=rng.choice(PRODUCERS),
+                calories=rng.uniform(10, 600),
+                protein=rng.uniform(0, 40),
+                fat=rng.uniform(0, 40),
+                carbohydrates=rng.uniform(0, 80),
+                portion_size=100,
+            )
+            for _ in range(size)
+        ]
+        for food_item in food_items:
+            food_item.refresh_densities()
+        FoodItem.stamp_versions(food_items)
+        FoodItem.objects.bulk_create(food_items, batch_size=batch_size)
+        created += size
+    return created
+
+
+def create_users(count, prefix='user'):
+    return [get_benchmark_user(f'{prefix}{i}') for i in range(count)]
+
+
+def create_population(count, rng=None, prefix='person', password='benchmark-password', batch_size=5000):
+    """
+    ``count`` users with varied bodies, goals and targets who can all log in
+    with ``password``; hashing it once keeps seeding fast.
+    """
+    rng = rng or random.Random(0)
+    hashed = make_password(password)
+    profiles = [
+        UserProfile(
+            username=f'{prefix}{i}',
+            email=f'{prefix}{i}@example.com',
+            password=hashed,
+            gender=rng.choice('MF'),
+            age=rng.randint(18, 80),
+            height=rng.randint(150, 200),
+            weight=round(rng.uniform(45, 130), 1),
+            activity_level=rng.choice('SLMVE'),
+            goal=rng.choice('LMG'),
+        )
+        for i in range(count)
+    ]
+    targets = calculate_targets_batch(**profile_inputs(profiles))
+    for index, profile in enumerate(profiles):
+        for field in TARGET_FIELDS:
+            setattr(profile, field, float(targets[field][index]))
+    UserProfile.objects.bulk_create(profiles, batch_size=batch_size)
+    return list(UserProfile.objects.filter(username__startswith=prefix).order_by('id'))
+
+
+def create_meals(users, food_items, count, start, days, rng=None, batch_size=20000):
+    """
+    Insert ``count`` meals spread evenly over ``days`` days from ``start``.
+    Rows go in through executemany rather than bulk_create, which is far too
+    slow for millions of rows and would stamp every row with auto_now_add.
+    """
+    rng = rng or random.Random(0)
+    fields = [
+        'owner', 'food_item', 'datetime', 'meal_type', 'quantity',
+        'portion_calories', 'portion_fat', 'portion_carbohydrates', 'portion_proteins',
+    ]
+    columns = ', '.join(connection.ops.quote_name(UserMeal._meta.get_field(name).column) for name in fields)
+    sql = (
+        f'INSERT INTO {connection.ops.quote_name(UserMeal._meta.db_table)} ({columns}) '
+        f'VALUES ({", ".join(["%s"] * len(fields))})'
+    )
+    span = timedelta(days=days).total_seconds()
+    created = 0
+    with connection.cursor() as cursor:
+        while created < count:
+            size = min(batch_size, count - created)
+            rows = []
+            for i in range(created, created + size):
+                food_item = rng.choice(food_items)
+                quantity = rng.choice([50, 100, 150, 200, 250])
+                logged_at = start + timedelta(seconds=span * i / count)
+                rows.append((
+                    rng.choice(users).pk,
+                    food_item.pk,
+                    connection.ops.adapt_datetimefield_value(logged_at),
+                    rng.choice(UserMeal.MEAL_TYPES)[0],
+                    quantity,
+                    quantity * food_item.calories_per_unit,
+                    quantity * food_item.fat_per_unit,
+                    quantity * food_item.carbohydrates_per_unit,
+                    quantity * food_item.protein_per_unit,
+                ))
+            cursor.executemany(sql, rows)
+            created += size
+    return created
+
+
+def measure(fn, inputs):
+    """Call ``fn`` once per input and return (p50, p99) latency in ms."""
+    timings = []
+    for value in inputs:
+        start = time.perf_counter()
+        fn(value)
+        timings.append(time.perf_counter() - start)
+    return percentiles(timings)
+
+
+def percentiles(timings):
+    """(p50, p99) in ms of timings given in seconds."""
+    timings = [timing * 1000 for timing in timings]
+    if len(timings) < 2:
+        return timings[0], timings[0]
+    cuts = quantiles(timings, n=100, method='inclusive')
+    return cuts[49], cuts[98]
+
+
+class FakeAI21Server:
+    """
+    Local stand-in for the AI21 chat completions API that answers every
+    request with ``content`` after ``delay`` seconds. Point settings.AI
+    ['API_HOST'] at ``url`` to use it.
+    """
+
+    def __init__(self, content='Eat more vegetables.', delay=1.0):
+        self.content = content
+        self.delay = delay
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                server.requests += 1
+                time.sleep(server.delay)
+                body = json.dumps({
+                    'id': 'fake',
+                    'choices': [{
+                        'index': 0,
+                        'message': {'role': 'assistant', 'content': server.content},
+                        'finish_reason': 'stop',
+                    }],
+                    'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+                }).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.httpd.server_address[1]}'
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,184 @@
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from django.db import transaction
+
+from .catalog_parsing import parse_food_table
+from .models import FoodItem
+from .nutrition import DENSITY_FIELDS
+from .portion_updates import schedule_portion_update
+
+BASE_URL = "https://www.tablycjakalorijnosti.com.ua/tablytsya-yizhyi"
+PAGE_PARAM = "?page="
+PRODUCER = 'tablycjakalorijnosti'
+
+UPDATE_FIELDS = [
+    'calories', 'protein', 'fat', 'carbohydrates', 'portion_size', 'quantity_unit', *DENSITY_FIELDS, 'version',
+]
+
+
+# Statuses worth asking again for; any other error status fails the import.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class WebSource:
+    """
+    Catalog pages fetched over HTTP; the catalog ends at the first empty or
+    missing (404) page. Throttled and failed requests are retried ``retries``
+    times with exponential backoff, then raised, which stops the import with
+    its checkpoint kept.
+    """
+
+    def __init__(self, base_url=BASE_URL, timeout=30, retries=3, backoff=1.0):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+
+    def pages(self, start):
+        page = start
+        while True:
+            yield page
+            page += 1
+
+    def fetch(self, page):
+        for attempt in range(self.retries + 1):
+            response = self.session.get(self.base_url + PAGE_PARAM + str(page), timeout=self.timeout)
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                break
+            time.sleep(self.backoff * 2 ** attempt)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.content
+
+
+class DirectorySource:
+    """Saved HTML pages; the first number in each file name is its page number."""
+
+    def __init__(self, directory):
+        self.files = {}
+        for path in Path(directory).glob('*.htm*'):
+            match = re.search(r'\d+', path.stem)
+            if match:
+                self.files[int(match.group())] = path
+
+    def pages(self, start):
+        return (page for page in sorted(self.files) if page >= start)
+
+    def fetch(self, page):
+        return self.files[page].read_bytes()
+
+
+class Checkpoint:
+    """Remembers the last page whose items were committed."""
+
+    def __init__(self, path):
+        self.path = Path(path) if path else None
+
+    def load(self):
+        if self.path and self.path.exists():
+            return json.loads(self.path.read_text())['last_page']
+        return 0
+
+    def save(self, page):
+        if self.path:
+            tmp = self.path.with_suffix('.tmp')
+            tmp.write_text(json.dumps({'last_page': page}))
+            os.replace(tmp, self.path)
+
+    def clear(self):
+        if self.path and self.path.exists():
+            self.path.unlink()
+
+
+def upsert_food_items(items, owner, producer=PRODUCER):
+    """Insert new items and update existing ones, matching on (producer, name)."""
+    by_name = {item['name']: item for item in items}
+    with transaction.atomic():
+        existing = {
+            food_item.name: food_item
+            for food_item in FoodItem.objects.filter(producer=producer, name__in=by_name)
+        }
+        to_create, to_update = [], []
+        for name, item in by_name.items():
+            food_item = existing.get(name)
+            if food_item is None:
+                food_item = FoodItem(owner=owner, name=name, producer=producer)
+                to_create.append(food_item)
+            else:
+                to_update.append(food_item)
+            food_item.calories = item['calories']
+            food_item.protein = item['protein']
+            food_item.fat = item['fat']
+            food_item.carbohydrates = item['carbohydrates']
+            food_item.portion_size = 100
+            food_item.quantity_unit = FoodItem.GRAMS
+            food_item.refresh_densities()
+        FoodItem.stamp_versions(to_create + to_update)
+        FoodItem.objects.bulk_create(to_create, batch_size=500)
+        FoodItem.objects.bulk_update(to_update, UPDATE_FIELDS, batch_size=500)
+        schedule_portion_update(food_item.pk for food_item in to_update if food_item.densities_changed())
+    return len(to_create), len(to_update)
+
+
+class CatalogImporter:
+    """
+    Fetches pages ``concurrency`` at a time, parses them in a process pool and
+    commits each window of pages before moving the checkpoint past it.
+    """
+
+    def __init__(self, source, owner, checkpoint, concurrency=8, parse_workers=None, log=print):
+        self.source = source
+        self.owner = owner
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.parse_workers = parse_workers
+        self.log = log
+
+    def run(self):
+        start = self.checkpoint.load() + 1
+        created = updated = 0
+        pages = self.source.pages(start)
+
+        with ThreadPoolExecutor(self.concurrency) as fetcher, ProcessPoolExecutor(self.parse_workers) as parser:
+            while True:
+                window = [page for _, page in zip(range(self.concurrency), pages)]
+                if not window:
+                    break
+                contents = list(fetcher.map(self.source.fetch, window))
+                done = []
+                for page, content in zip(window, contents):
+                    if not content:
+                        break
+                    done.append((page, content))
+                parsed = list(parser.map(parse_food_table, [content for _, content in done]))
+
+                finished = len(done) < len(window)
+                items = []
+                last_page = None
+                for (page, _), page_items in zip(done, parsed):
+                    if not page_items:
+                        finished = True
+                        break
+                    items.extend(page_items)
+                    last_page = page
+
+                if items:
+                    window_created, window_updated = upsert_food_items(items, self.owner)
+                    created += window_created
+                    updated += window_updated
+                    self.checkpoint.save(last_page)
+                    self.log(f'Imported pages up to {last_page}: {created} created, {updated} updated.')
+                if finished:
+                    break
+
+        # Only reached past the last page: a failed fetch raises and keeps the checkpoint.
+        self.checkpoint.clear()
+        return created, updated
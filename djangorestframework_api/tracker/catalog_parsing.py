@@ -0,0 +1,29 @@
+from bs4 import BeautifulSoup
+
+# Kept free of Django imports so process pool workers can load it without
+# configuring settings.
+
+
+def parse_food_table(html_content):
+    soup = BeautifulSoup(html_content, 'html.parser')
+    table = soup.find('table')
+    food_items = []
+
+    if table:
+        rows = table.find_all('tr')
+        for row in rows:
+            columns = row.find_all('td')
+            if len(columns) > 1:
+                try:
+                    food_item = {
+                        'name': columns[0].text.strip(),
+                        'calories': float(columns[1].text.strip()),
+                        'protein': float(columns[2].text.strip()),
+                        'carbohydrates': float(columns[3].text.strip()),
+                        'fat': float(columns[4].text.strip()),
+                    }
+                except (ValueError, IndexError):
+                    continue
+                if food_item['name'] and min(food_item['protein'], food_item['carbohydrates'], food_item['fat']) >= 0:
+                    food_items.append(food_item)
+    return food_items
@@ -0,0 +1,138 @@
+"""
+Offline copies of the food catalog for clients. A snapshot is the whole
+catalog as gzip'd NDJSON: a header line with the catalog version and field
+names, then one JSON array per item. Snapshots are written to
+CATALOG_SYNC['DIRECTORY'] at most once per MIN_INTERVAL seconds and served
+as files. From the snapshot's version on, clients stay current with the
+changes feed, which lists items changed and deleted after a given version.
+"""
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import CatalogVersion, FoodItem, FoodItemTombstone
+
+FIELDS = [
+    'id', 'name', 'producer', 'calories', 'protein', 'fat', 'carbohydrates', 'portion_size', 'quantity_unit',
+]
+
+SNAPSHOT_RE = re.compile(r'catalog-(\d+)\.ndjson\.gz$')
+
+_build_lock = threading.Lock()
+
+
+def encode(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def snapshots():
+    """{version: path} of the snapshots on disk."""
+    directory = Path(settings.CATALOG_SYNC['DIRECTORY'])
+    if not directory.is_dir():
+        return {}
+    found = {}
+    for path in directory.iterdir():
+        match = SNAPSHOT_RE.match(path.name)
+        if match:
+            found[int(match.group(1))] = path
+    return found
+
+
+def build_snapshot():
+    """Write a snapshot of the catalog as it is now, remove older ones and return (version, path)."""
+    directory = Path(settings.CATALOG_SYNC['DIRECTORY'])
+    directory.mkdir(parents=True, exist_ok=True)
+    # Read before the rows, so the snapshot holds at least everything up to this
+    # version; items changed while dumping are sent again by the changes feed.
+    version = CatalogVersion.current()
+    path = directory / f'catalog-{version}.ndjson.gz'
+    partial = directory / f'.catalog-{version}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with gzip.open(partial, 'wt', encoding='utf-8', compresslevel=settings.CATALOG_SYNC['COMPRESSION']) as file:
+        file.write(encode({'version': version, 'fields': FIELDS}) + '\n')
+        for row in FoodItem.objects.order_by().values_list(*FIELDS).iterator(chunk_size=10000):
+            file.write(encode(row) + '\n')
+    os.replace(partial, path)
+    for older, older_path in snapshots().items():
+        if older < version:
+            # Downloads already reading it keep their open file.
+            older_path.unlink(missing_ok=True)
+    return version, path
+
+
+def find_snapshot():
+    """
+    (version, path) of a snapshot to serve: the newest one if it is current
+    or younger than MIN_INTERVAL, else a new one. While another thread is
+    writing a snapshot the newest one is served rather than waiting.
+    """
+    found = snapshots()
+    if found:
+        version = max(found)
+        path = found[version]
+        try:
+            age = time.time() - path.stat().st_mtime
+        except FileNotFoundError:
+            return find_snapshot()
+        if age < settings.CATALOG_SYNC['MIN_INTERVAL'] or version == CatalogVersion.current():
+            return version, path
+        if not _build_lock.acquire(blocking=False):
+            return version, path
+    else:
+        _build_lock.acquire()
+    try:
+        return build_snapshot()
+    finally:
+        _build_lock.release()
+
+
+def get_snapshot():
+    """
+    (version, file opened for binary reading) of the snapshot to serve. A
+    newer snapshot can remove the one found before it is opened, in which
+    case the lookup starts over; once open, the file stays readable.
+    """
+    while True:
+        version, path = find_snapshot()
+        try:
+            return version, open(path, 'rb')
+        except FileNotFoundError:
+            continue
+
+
+def changes(since, limit):
+    """
+    Items changed and ids deleted after version ``since``, at most ``limit``
+    in all, in version order. Returns (items, deleted ids, the version to ask
+    from next, whether more changes follow).
+    """
+    # Every version up to the committed counter belongs to a committed
+    # transaction, so both reads see all of them. A later version either query
+    # sees could end the page past one the other missed.
+    upto = CatalogVersion.current()
+    items = list(
+        FoodItem.objects.filter(version__gt=since, version__lte=upto).order_by('version')
+        .values_list('version', *FIELDS)[:limit + 1]
+    )
+    tombstones = list(
+        FoodItemTombstone.objects.filter(version__gt=since, version__lte=upto).order_by('version')
+        .values_list('version', 'food_item_id')[:limit + 1]
+    )
+    # Versions are unique across items and tombstones, so the page can end anywhere.
+    merged = sorted(
+        [(version, row, None) for version, *row in items]
+        + [(version, None, food_item_id) for version, food_item_id in tombstones],
+        key=lambda entry: entry[0],
+    )
+    page = merged[:limit]
+    return (
+        [row for _, row, _ in page if row is not None],
+        [food_item_id for _, _, food_item_id in page if food_item_id is not None],
+        page[-1][0] if page else since,
+        len(merged) > limit,
+    )
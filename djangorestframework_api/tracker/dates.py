@@ -0,0 +1,28 @@
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.utils import timezone
+
+
+def get_timezone(name=None):
+    """The IANA zone called ``name``, or the current timezone when it is blank."""
+    if not name:
+        return timezone.get_current_timezone()
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        raise ValueError(f'Unknown timezone: {name}')
+
+
+def start_of_day(date, tz=None):
+    return timezone.make_aware(datetime.combine(date, time.min), tz)
+
+
+def day_bounds(date_from, date_to=None, tz=None):
+    """
+    Half-open ``[start, end)`` aware datetimes covering local days
+    ``date_from`` to ``date_to`` inclusive in ``tz``. Days around DST changes
+    are 23 or 25 hours long, so the end is a separate midnight, not start + 24h.
+    """
+    date_to = date_to or date_from
+    return start_of_day(date_from, tz), start_of_day(date_to + timedelta(days=1), tz)
@@ -0,0 +1,46 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+EXPORT_FIELDS = [
+    'id', 'datetime', 'meal_type', 'food_item_id', 'food_item__name', 'food_item__producer',
+    'food_item__quantity_unit', 'quantity', 'portion_calories', 'portion_fat',
+    'portion_carbohydrates', 'portion_proteins',
+]
+
+EXPORT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class Echo:
+    """File-like object whose write() hands the row back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset):
+    return queryset.order_by('datetime', 'id').values_list(*EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def stream_ndjson(queryset):
+    encoder = DjangoJSONEncoder()
+    for row in export_rows(queryset):
+        yield encoder.encode(dict(zip(EXPORT_FIELDS, row))) + '\n'
+
+
+def stream_csv(queryset):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in export_rows(queryset):
+        yield writer.writerow(row)
+
+
+STREAMERS = {
+    'ndjson': stream_ndjson,
+    'csv': stream_csv,
+}
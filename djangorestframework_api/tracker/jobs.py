@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import random
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .ai import advise
+from .dates import get_timezone
+from .models import AdviceJob
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    pass
+
+
+def advice_dedup_key(user, meal_type, tz=''):
+    raw = f'{user.pk}:{meal_type}:{tz}:{timezone.localdate(timezone=get_timezone(tz)).isoformat()}'
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def enqueue_advice(user, meal_type, tz=''):
+    """
+    Return ``(job, created)``. A job for the same user, meal type, timezone
+    and day submitted within COALESCE_WINDOW seconds is reused unless it failed.
+    """
+    config = settings.AI_JOBS
+    dedup_key = advice_dedup_key(user, meal_type, tz)
+    window_start = timezone.now() - timedelta(seconds=config['COALESCE_WINDOW'])
+    existing = (
+        AdviceJob.objects
+        .filter(dedup_key=dedup_key, created_at__gte=window_start)
+        .exclude(status=AdviceJob.FAILED)
+        .order_by('-created_at')
+        .first()
+    )
+    if existing is not None:
+        return existing, False
+
+    waiting = AdviceJob.objects.filter(status__in=[AdviceJob.PENDING, AdviceJob.RUNNING]).count()
+    if waiting >= config['MAX_PENDING']:
+        raise QueueFull()
+
+    job = AdviceJob.objects.create(owner=user, meal_type=meal_type, tz=tz, dedup_key=dedup_key)
+    return job, True
+
+
+def claim_next_job():
+    """Lease the next runnable job to the calling worker, or return None."""
+    now = timezone.now()
+    runnable = (
+        Q(status=AdviceJob.PENDING, run_after__lte=now)
+        | Q(status=AdviceJob.RUNNING, locked_until__lt=now)
+    )
+    lease = now + timedelta(seconds=settings.AI_JOBS['LEASE'])
+    for job_id in AdviceJob.objects.filter(runnable).order_by('run_after').values_list('id', flat=True)[:10]:
+        # The conditional UPDATE is the lock: only one worker can move the job.
+        claimed = AdviceJob.objects.filter(runnable, pk=job_id).update(
+            status=AdviceJob.RUNNING, locked_until=lease, attempts=F('attempts') + 1, updated_at=now,
+        )
+        if claimed:
+            return AdviceJob.objects.select_related('owner').get(pk=job_id)
+    return None
+
+
+def retry_delay(attempts):
+    base = settings.AI_JOBS['RETRY_BACKOFF']
+    return base * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+
+
+def run_job(job):
+    try:
+        result = advise(job.owner, job.meal_type, get_timezone(job.tz))
+    except Exception as error:
+        logger.warning('Advice job %s failed on attempt %s: %s', job.pk, job.attempts, error)
+        job.error = str(error) or error.__class__.__name__
+        if job.attempts < settings.AI_JOBS['MAX_ATTEMPTS']:
+            job.status = AdviceJob.PENDING
+            job.run_after = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+        else:
+            job.status = AdviceJob.FAILED
+        job.locked_until = None
+        job.save(update_fields=['status', 'error', 'run_after', 'locked_until', 'updated_at'])
+        return
+
+    job.status = AdviceJob.DONE
+    job.result = result
+    job.error = ''
+    job.locked_until = None
+    job.save(update_fields=['status', 'result', 'error', 'locked_until', 'updated_at'])
+
+
+def process_available_jobs():
+    """Run jobs until none is runnable; returns how many were run."""
+    processed = 0
+    while (job := claim_next_job()) is not None:
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def worker_loop(stop):
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            processed = process_available_jobs()
+        except Exception:
+            logger.exception('Advice worker crashed while polling')
+            processed = 0
+        if not processed:
+            stop.wait(settings.AI_JOBS['POLL_INTERVAL'])
+    connection.close()
+
+
+def start_workers(count, stop):
+    threads = [
+        threading.Thread(target=worker_loop, args=(stop,), name=f'advice-worker-{i}', daemon=True)
+        for i in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
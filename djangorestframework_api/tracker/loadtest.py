@@ -0,0 +1,237 @@
+"""
+Load test scenarios for the API, run in-process against the ASGI handler.
+Virtual users pick weighted scenarios in a loop for a fixed time; the
+report is JSON so runs from different commits can be compared.
+"""
+import asyncio
+import itertools
+import random
+import subprocess
+import time
+from collections import Counter
+from datetime import timedelta
+from statistics import mean, quantiles
+
+from django.test import AsyncClient
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .benchmark import FOOD_WORDS, create_food_items, create_meals, create_population
+from .models import DailyNutritionSummary, FoodItem, UserMeal
+
+PASSWORD = 'loadtest-password'
+
+# users, shared catalog size, meals per user and years of history.
+SCALES = {
+    'small': {'users': 50, 'food_items': 2000, 'meals_per_user': 500, 'years': 1},
+    'medium': {'users': 500, 'food_items': 20000, 'meals_per_user': 1500, 'years': 2},
+    'large': {'users': 5000, 'food_items': 100000, 'meals_per_user': 3000, 'years': 3},
+}
+
+DEFAULT_WEIGHTS = {
+    'food_search': 25,
+    'today': 20,
+    'log_meal': 20,
+    'token_refresh': 5,
+    'ai_estimate': 5,
+    'ai_advice': 2,
+    'token_obtain': 2,
+    'register': 1,
+}
+
+NUTRITION_ANSWER = '{"calories": 420, "protein": 25, "fat": 14, "carbohydrates": 48, "weight": 350}'
+
+
+def seed(users, food_items, meals_per_user, years, rng):
+    """Create the users, a shared food catalog and their meal histories up to now."""
+    people = create_population(users, rng, prefix='load', password=PASSWORD)
+    create_food_items(people[0], food_items, rng)
+    catalog = list(FoodItem.objects.only('id', 'calories_per_unit', 'fat_per_unit',
+                                         'carbohydrates_per_unit', 'protein_per_unit'))
+    days = 365 * years
+    create_meals(people, catalog, users * meals_per_user, timezone.now() - timedelta(days=days), days, rng)
+    for start in range(0, len(people), 500):
+        DailyNutritionSummary.rebuild([person.pk for person in people[start:start + 500]])
+    return people, [food_item.pk for food_item in catalog]
+
+
+class Session:
+    """One virtual user: a client, its tokens and its own random stream."""
+
+    registrations = itertools.count()
+
+    def __init__(self, user, food_item_ids, rng):
+        self.client = AsyncClient()
+        self.user = user
+        self.food_item_ids = food_item_ids
+        self.rng = rng
+        refresh = RefreshToken.for_user(user)
+        self.refresh = str(refresh)
+        self.headers = {'Authorization': f'Bearer {refresh.access_token}'}
+
+    def get(self, path, data=None):
+        return self.client.get(path, data, headers=self.headers)
+
+    def post(self, path, data, authenticated=True):
+        return self.client.post(
+            path, data, content_type='application/json', headers=self.headers if authenticated else None,
+        )
+
+    def description(self):
+        words = self.rng.sample(FOOD_WORDS, self.rng.randint(1, 3))
+        return ', '.join(f'{self.rng.choice([50, 100, 150, 200])}g {word}' for word in words)
+
+
+async def register(session):
+    number = next(Session.registrations)
+    return await session.post('/api/register/', {
+        'username': f'newcomer{number}', 'email': f'newcomer{number}@example.com', 'password': PASSWORD,
+        'gender': 'F', 'age': 30, 'height': 170, 'weight': 65, 'activity_level': 'M', 'goal': 'M',
+    }, authenticated=False)
+
+
+async def token_obtain(session):
+    return await session.post('/api/token/', {'username': session.user.username, 'password': PASSWORD},
+                              authenticated=False)
+
+
+async def token_refresh(session):
+    return await session.post('/api/token/refresh/', {'refresh': session.refresh}, authenticated=False)
+
+
+async def food_search(session):
+    return await session.get('/fooditems/', {'search': session.rng.choice(FOOD_WORDS)})
+
+
+async def log_meal(session):
+    return await session.post('/usermeals/', {
+        'food_item': session.rng.choice(session.food_item_ids),
+        'meal_type': session.rng.choice(UserMeal.MEAL_TYPES)[0],
+        'quantity': session.rng.choice([50, 100, 150, 200, 250]),
+    })
+
+
+async def today(session):
+    return await session.get('/usermeals/today/')
+
+
+async def ai_estimate(session):
+    return await session.post('/fooditems/calculate_nutritional_value/', {'description': session.description()})
+
+
+async def ai_advice(session):
+    return await session.post('/usermeals/ai_advice/', {'meal_type': session.rng.choice(['daily', 'lunch'])})
+
+
+SCENARIOS = {
+    scenario.__name__: scenario
+    for scenario in (register, token_obtain, token_refresh, food_search, log_meal, today, ai_estimate, ai_advice)
+}
+
+
+async def run(sessions, weights, duration, warmup=0.0):
+    """
+    Run every session's scenario loop concurrently for ``duration`` seconds
+    after ``warmup`` seconds whose requests are not recorded. Returns
+    {scenario: (latencies in seconds, Counter of status codes)}.
+    """
+    names = [name for name, weight in weights.items() if weight > 0]
+    shares = [weights[name] for name in names]
+    results = {name: ([], Counter()) for name in names}
+    began = time.perf_counter()
+    recording_from = began + warmup
+    deadline = recording_from + duration
+
+    async def loop(session):
+        while (started := time.perf_counter()) < deadline:
+            name = session.rng.choices(names, shares)[0]
+            response = await SCENARIOS[name](session)
+            finished = time.perf_counter()
+            if started >= recording_from:
+                latencies, statuses = results[name]
+                latencies.append(finished - started)
+                statuses[response.status_code] += 1
+
+    await asyncio.gather(*(loop(session) for session in sessions))
+    return results
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(latencies, statuses, duration):
+    milliseconds = sorted(latency * 1000 for latency in latencies)
+    cuts = quantiles(milliseconds, n=100, method='inclusive') if len(milliseconds) > 1 else milliseconds * 99
+    return {
+        'requests': len(milliseconds),
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+        'rps': len(milliseconds) / duration,
+        'mean_ms': mean(milliseconds) if milliseconds else None,
+        'p50_ms': cuts[49] if milliseconds else None,
+        'p90_ms': cuts[89] if milliseconds else None,
+        'p99_ms': cuts[98] if milliseconds else None,
+        'max_ms': milliseconds[-1] if milliseconds else None,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def build_report(results, duration, meta):
+    scenarios = {name: summarize(latencies, statuses, duration) for name, (latencies, statuses) in results.items()}
+    every = [latency for latencies, _ in results.values() for latency in latencies]
+    statuses = sum((statuses for _, statuses in results.values()), Counter())
+    return {
+        'meta': {'commit': current_commit(), 'finished_at': timezone.now().isoformat(), **meta},
+        'total': summarize(every, statuses, duration),
+        'scenarios': scenarios,
+    }
+
+
+def format_report(report):
+    lines = [
+        f'{"scenario":<14} {"requests":>9} {"errors":>7} {"req/s":>8} '
+        f'{"mean ms":>8} {"p50 ms":>8} {"p90 ms":>8} {"p99 ms":>8} {"max ms":>8}'
+    ]
+    for name, row in [*report['scenarios'].items(), ('total', report['total'])]:
+        if not row['requests']:
+            lines.append(f'{name:<14} {0:>9}')
+            continue
+        lines.append(
+            f'{name:<14} {row["requests"]:>9} {row["errors"]:>7} {row["rps"]:>8.1f} {row["mean_ms"]:>8.2f} '
+            f'{row["p50_ms"]:>8.2f} {row["p90_ms"]:>8.2f} {row["p99_ms"]:>8.2f} {row["max_ms"]:>8.2f}'
+        )
+    return '\n'.join(lines)
+
+
+def change(before, after):
+    if not before or after is None:
+        return '     n/a'
+    return f'{(after - before) / before * 100:+7.1f}%'
+
+
+def format_comparison(baseline, report):
+    """Per-scenario change in throughput and latency from ``baseline`` to ``report``."""
+    lines = [
+        f'compared with {baseline["meta"].get("commit") or "baseline"}:',
+        f'{"scenario":<14} {"req/s":>8} {"p50":>8} {"p99":>8} {"errors":>13}',
+    ]
+    names = [name for name in report['scenarios'] if name in baseline['scenarios']]
+    for name, before, after in [
+        *((name, baseline['scenarios'][name], report['scenarios'][name]) for name in names),
+        ('total', baseline['total'], report['total']),
+    ]:
+        lines.append(
+            f'{name:<14} {change(before["rps"], after["rps"])} {change(before["p50_ms"], after["p50_ms"])} '
+            f'{change(before["p99_ms"], after["p99_ms"])} {before["errors"]:>6} -> {after["errors"]:<4}'
+        )
+    return '\n'.join(lines)
+
+
+def sessions_for(users, food_item_ids, count, seed_value):
+    rng = random.Random(seed_value)
+    return [Session(rng.choice(users), food_item_ids, random.Random(rng.random())) for _ in range(count)]
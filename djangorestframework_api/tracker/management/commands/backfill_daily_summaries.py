@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from tracker.models import DailyNutritionSummary, UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Rebuild DailyNutritionSummary rows from existing meals, a chunk of users at a time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users per transaction.')
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only rebuild these user ids.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        users = UserProfile.objects.order_by('id')
+        if options['users']:
+            users = users.filter(id__in=options['users'])
+
+        rebuilt = 0
+        last_id = 0
+        while True:
+            user_ids = list(users.filter(id__gt=last_id).values_list('id', flat=True)[:chunk_size])
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+            rebuilt += DailyNutritionSummary.rebuild(user_ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} daily summaries.'))
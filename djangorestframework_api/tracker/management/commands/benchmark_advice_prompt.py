@@ -0,0 +1,79 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tracker.benchmark import create_food_items, get_benchmark_user, isolated_database, percentiles
+from tracker.dates import day_bounds
+from tracker.models import FoodItem, UserMeal
+from tracker.prompts import advice_intake, advice_prompt
+
+
+def per_meal_prompt(user, now):
+    """The daily advice prompt as it was built before, one description per meal, for comparison."""
+    today_start, today_end = day_bounds(now.date(), tz=now.tzinfo)
+    meals = UserMeal.objects.filter(owner=user, datetime__gte=today_start, datetime__lt=today_end).select_related('food_item')
+    food_description = "; ".join(
+        f"{meal.food_item.name} at {timezone.localtime(meal.datetime, now.tzinfo).strftime('%H:%M')} ({meal.portion_fat}g fat, {meal.portion_proteins}g protein, {meal.portion_carbohydrates}g carbs) {meal.quantity} {meal.food_item.quantity_unit}"
+        for meal in meals
+    )
+    return (
+        "You are an AI nutritionist. Based on the following user intakes, and the current time of day, "
+        "provide a brief summary and advice on how to balance nutrition and optimize the user's diet for the current day:\n"
+        f"Current time of day: {now.strftime('%H:%M')}\n"
+        f"User intakes:\n"
+        f"Calorie intake: {user.calorie_intake}\n"
+        f"Carbohydrates intake: {user.carbohydrate_intake}\n"
+        f"Protein intake: {user.protein_intake}\n"
+        f"Fat intake: {user.fat_intake}\n\n"
+        f"Food consumed during the day: {food_description}\n"
+        "Your answer must containt only concise summary in 5-6 sentences about how to improve this meal and overall diet balance."
+    )
+
+
+class Command(BaseCommand):
+    help = 'Compare the size and build time of the daily ai_advice prompt, per meal and aggregated, as meals pile up.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meals', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--food-items', type=int, default=300)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        rng = random.Random(4)
+        with isolated_database():
+            user = get_benchmark_user()
+            create_food_items(user, options['food_items'], rng)
+            food_items = list(FoodItem.objects.all())
+            meal_types = [meal_type for meal_type, _ in UserMeal.MEAL_TYPES]
+
+            for count in options['meals']:
+                UserMeal.objects.all().delete()
+                # Spread over the hours already past, so every meal falls on today.
+                now = timezone.localtime()
+                elapsed = now - now.replace(hour=0, minute=0, second=0, microsecond=0)
+                meals = UserMeal.bulk_log([
+                    UserMeal(owner=user, food_item=rng.choice(food_items), meal_type=rng.choice(meal_types),
+                             quantity=rng.choice([50, 100, 150, 200]))
+                    for _ in range(count)
+                ])
+                for meal in meals:
+                    meal.datetime = now - timedelta(seconds=rng.uniform(0, elapsed.total_seconds()))
+                UserMeal.objects.bulk_update(meals, ['datetime'], batch_size=1000)
+
+                builders = {
+                    'per meal': lambda: per_meal_prompt(user, now),
+                    'aggregated': lambda: advice_prompt(user, 'daily', list(advice_intake(user, 'daily', now)), now),
+                }
+                for label, build in builders.items():
+                    timings = []
+                    for _ in range(options['repeat']):
+                        began = time.perf_counter()
+                        prompt = build()
+                        timings.append(time.perf_counter() - began)
+                    p50, p99 = percentiles(timings)
+                    self.stdout.write(
+                        f'{count:>5} meals  {label:<10} {len(prompt):>8} chars  p50 {p50:8.2f} ms  p99 {p99:8.2f} ms'
+                    )
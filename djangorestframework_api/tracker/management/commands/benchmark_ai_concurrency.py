@@ -0,0 +1,75 @@
+import asyncio
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tracker.benchmark import (
+    FakeAI21Server, create_food_items, get_benchmark_user, isolated_database, percentiles,
+)
+from tracker.models import FoodItem, UserMeal
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure /usermeals/today/ latency while AI requests are in flight, '
+        'using the ASGI handler and a local fake AI21 server.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ai-requests', type=int, default=32)
+        parser.add_argument('--delay', type=float, default=1.0, help='Fake model latency in seconds.')
+        parser.add_argument('--probes', type=int, default=50)
+
+    def handle(self, *args, **options):
+        os.environ.setdefault('AI21_API_KEY', 'fake')
+        with isolated_database(), FakeAI21Server(delay=options['delay']) as server:
+            user = get_benchmark_user()
+            create_food_items(user, 20)
+            UserMeal.bulk_log([
+                UserMeal(owner=user, food_item=food_item, meal_type='lunch', quantity=100)
+                for food_item in FoodItem.objects.all()
+            ])
+            # One user fires every AI request, far past the per-user rate limit.
+            unlimited = {**settings.RATE_LIMITS, 'ENABLED': False}
+            with override_settings(AI={**settings.AI, 'API_HOST': server.url}, RATE_LIMITS=unlimited):
+                asyncio.run(self.run(AccessToken.for_user(user), options))
+            self.stdout.write(f'fake AI21 server handled {server.requests} requests')
+
+    async def run(self, token, options):
+        client = AsyncClient()
+        headers = {'Authorization': f'Bearer {token}'}
+
+        async def probe_today():
+            timings = []
+            for _ in range(options['probes']):
+                start = time.perf_counter()
+                await client.get('/usermeals/today/', headers=headers)
+                timings.append(time.perf_counter() - start)
+            return timings
+
+        idle = await probe_today()
+
+        start = time.perf_counter()
+        advice = [
+            asyncio.create_task(client.post(
+                '/usermeals/ai_advice/', {'meal_type': 'daily'}, content_type='application/json', headers=headers,
+            ))
+            for _ in range(options['ai_requests'])
+        ]
+        await asyncio.sleep(0.05)
+        busy = await probe_today()
+        responses = await asyncio.gather(*advice)
+        ai_elapsed = time.perf_counter() - start
+
+        for label, timings in (('idle', idle), ('AI in flight', busy)):
+            p50, p99 = percentiles(timings)
+            self.stdout.write(f'/usermeals/today/ {label:<13} p50 {p50:8.2f} ms  p99 {p99:8.2f} ms')
+        ok = sum(response.status_code == 200 for response in responses)
+        self.stdout.write(
+            f'{ok}/{len(responses)} ai_advice requests answered in {ai_elapsed:.2f} s '
+            f'(limit {settings.AI["MAX_CONCURRENCY"]} concurrent, {options["delay"]} s each)'
+        )
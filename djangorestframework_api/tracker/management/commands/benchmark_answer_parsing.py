@@ -0,0 +1,85 @@
+import json
+import re
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from tracker.ai_parsing import NutritionParser
+
+CORPUS = Path(__file__).resolve().parents[2] / 'testdata' / 'nutrition_answers.jsonl'
+
+REGEX_PATTERNS = {
+    'calories': r'"calories":\s*(\d+(?:\.\d+)?)',
+    'protein': r'"protein":\s*(\d+(?:\.\d+)?)',
+    'fat': r'"fat":\s*(\d+(?:\.\d+)?)',
+    'carbohydrates': r'"carbohydrates":\s*(\d+(?:\.\d+)?)',
+    'weight': r'"weight":\s*(\d+(?:\.\d+)?)'
+}
+
+
+def regex_parse(assistant_content):
+    """The answers as they were parsed before, one regex per value, for comparison."""
+    nutritional_data = {}
+    for key, pattern in REGEX_PATTERNS.items():
+        match = re.search(pattern, assistant_content)
+        if match:
+            nutritional_data[key] = float(match.group(1))
+
+    if len(nutritional_data) == 5:
+        weight = nutritional_data['weight']
+        for nutrient in nutritional_data:
+            if nutrient != 'weight':
+                nutritional_data[nutrient] = round((nutritional_data[nutrient] / (weight / 100)), 2)
+        nutritional_data['weight'] = 100
+    else:
+        nutritional_data = {}
+
+    return nutritional_data
+
+
+class Command(BaseCommand):
+    help = (
+        'Parse the recorded nutrition answers with the old per-value regexes and with the new parser, '
+        'counting answers read correctly, wrongly or not at all (which the client retries), and timing both.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=str(CORPUS))
+        parser.add_argument('--repeat', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with open(options['corpus'], encoding='utf-8') as file:
+            corpus = [json.loads(line) for line in file]
+        usable = sum(1 for entry in corpus if entry['expected'])
+        self.stdout.write(f'{len(corpus)} answers, {usable} with usable values')
+
+        parsers = {'regexes': regex_parse, 'parser': NutritionParser().parse}
+        for label, parse in parsers.items():
+            correct = wrong = retried = crashed = 0
+            for entry in corpus:
+                try:
+                    values = parse(entry['answer'])
+                except ArithmeticError:
+                    crashed += 1
+                    continue
+                if values == entry['expected']:
+                    correct += 1
+                elif not values:
+                    retried += 1
+                else:
+                    wrong += 1
+
+            began = time.perf_counter()
+            for _ in range(options['repeat']):
+                for entry in corpus:
+                    try:
+                        parse(entry['answer'])
+                    except ArithmeticError:
+                        pass
+            per_answer = (time.perf_counter() - began) / (options['repeat'] * len(corpus))
+
+            self.stdout.write(
+                f'{label:<8} correct {correct:>3}  wrong {wrong:>3}  retried {retried:>3}  crashed {crashed:>3}  '
+                f'{per_answer * 1e6:7.2f} us per answer'
+            )
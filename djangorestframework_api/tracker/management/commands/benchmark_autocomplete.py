@@ -0,0 +1,62 @@
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from tracker.autocomplete import AutocompleteIndex
+from tracker.benchmark import FOOD_WORDS, PRODUCERS, create_food_items, get_benchmark_user, isolated_database, measure
+from tracker.models import FoodItem
+from tracker.search import search_food_items
+
+
+def keystrokes(rng, count):
+    """Queries as typed: growing prefixes of one or two words, some with a producer."""
+    queries = []
+    while len(queries) < count:
+        words = rng.sample(FOOD_WORDS, rng.randint(1, 2))
+        if rng.random() < 0.2:
+            words.append(rng.choice(PRODUCERS))
+        typed = ' '.join(words)
+        queries.extend(typed[:length] for length in range(1, len(typed) + 1) if typed[length - 1] != ' ')
+    return queries[:count]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure autocomplete index build time, memory and lookup latency per keystroke, '
+        'next to the full-text search each keystroke used to run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--food-items', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--limit', type=int, default=10)
+
+    def handle(self, *args, **options):
+        rng = random.Random(5)
+        queries = keystrokes(rng, options['queries'])
+
+        with isolated_database():
+            create_food_items(get_benchmark_user(), options['food_items'], rng)
+            self.stdout.write(f'{FoodItem.objects.count()} food items')
+
+            index = AutocompleteIndex()
+            tracemalloc.start()
+            began = time.perf_counter()
+            index.rebuild()
+            elapsed = time.perf_counter() - began
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stdout.write(f'index built in {elapsed:.1f} s, peak {peak / 2 ** 20:.0f} MiB during the build')
+
+            limit = options['limit']
+            p50, p99 = measure(lambda query: index.lookup(query, limit), queries)
+            self.stdout.write(f'{"autocomplete index":<20} p50 {p50:8.3f} ms  p99 {p99:8.3f} ms')
+
+            sample = queries[::max(1, len(queries) // 200)]
+            p50, p99 = measure(
+                lambda query: list(search_food_items(FoodItem.objects.select_related('owner'), query)[:limit]),
+                sample,
+            )
+            self.stdout.write(f'{"full-text search":<20} p50 {p50:8.3f} ms  p99 {p99:8.3f} ms')
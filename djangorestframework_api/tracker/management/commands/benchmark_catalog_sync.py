@@ -0,0 +1,83 @@
+import random
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from tracker.benchmark import create_food_items, get_benchmark_user, isolated_database, measure
+from tracker.models import CatalogVersion, FoodItem
+
+
+def body_size(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare downloading the food catalog page by page from /fooditems/ with one /fooditems/snapshot/ '
+        'download, and measure snapshot revalidation and catching up through /fooditems/changes/.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--food-items', type=int, default=100000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--changes', type=int, default=1000, help='Items edited after the snapshot.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(3)
+        with isolated_database(), tempfile.TemporaryDirectory() as directory:
+            user = get_benchmark_user()
+            create_food_items(user, options['food_items'], rng)
+            client = APIClient()
+            client.force_authenticate(user)
+
+            began = time.perf_counter()
+            requests = size = 0
+            url = f'/fooditems/?page_size={options["page_size"]}'
+            while url:
+                response = client.get(url)
+                requests += 1
+                size += len(response.content)
+                url = response.data['next']
+            self.report('paginated JSON', requests, size, time.perf_counter() - began)
+
+            with override_settings(CATALOG_SYNC={**settings.CATALOG_SYNC, 'DIRECTORY': directory}):
+                began = time.perf_counter()
+                response = client.get('/fooditems/snapshot/')
+                size = body_size(response)
+                self.report('snapshot (built)', 1, size, time.perf_counter() - began)
+
+                began = time.perf_counter()
+                response = client.get('/fooditems/snapshot/')
+                size = body_size(response)
+                self.report('snapshot (on disk)', 1, size, time.perf_counter() - began)
+
+                etag = response['ETag']
+                p50, p99 = measure(
+                    lambda _: client.get('/fooditems/snapshot/', HTTP_IF_NONE_MATCH=etag), range(200),
+                )
+                self.stdout.write(f'{"revalidation (304)":<20} p50 {p50:8.3f} ms  p99 {p99:8.3f} ms')
+
+            since = CatalogVersion.current()
+            for food_item in rng.sample(list(FoodItem.objects.all()), min(options['changes'], options['food_items'])):
+                food_item.calories += 1
+                food_item.save()
+            began = time.perf_counter()
+            requests = size = 0
+            more = True
+            while more:
+                response = client.get('/fooditems/changes/', {'since': since})
+                requests += 1
+                size += len(response.content)
+                since, more = response.data['version'], response.data['more']
+            self.report(f'{options["changes"]} changes', requests, size, time.perf_counter() - began)
+
+    def report(self, label, requests, size, elapsed):
+        self.stdout.write(
+            f'{label:<20} {requests:>6} requests  {size / 2 ** 20:8.2f} MiB  {elapsed * 1000:9.1f} ms'
+        )
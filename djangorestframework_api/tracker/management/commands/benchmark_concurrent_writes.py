@@ -0,0 +1,107 @@
+import logging
+import multiprocessing
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from tracker.benchmark import create_food_items, create_population, isolated_database, percentiles
+from tracker.models import FoodItem, UserMeal
+
+
+def log_meals(user, food_item_ids, count, seed, start, results):
+    """
+    One logger process: POST ``count`` meals as ``user`` once ``start``
+    releases, then put its [(seconds, status)] on ``results``.
+    """
+    # Failed requests are counted; their tracebacks would drown the report.
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    rng = random.Random(seed)
+    client = APIClient(raise_request_exception=False)
+    client.force_authenticate(user)
+    timings = []
+    start.wait()
+    for _ in range(count):
+        began = time.perf_counter()
+        response = client.post('/usermeals/', {
+            'food_item': rng.choice(food_item_ids),
+            'meal_type': rng.choice(UserMeal.MEAL_TYPES)[0],
+            'quantity': rng.choice([50, 100, 150, 200]),
+        }, format='json')
+        timings.append((time.perf_counter() - began, response.status_code))
+    connection.close()
+    results.put(timings)
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure meal logging throughput, latency and failures with N logger processes writing in parallel, '
+        'once per SQLite profile in SQLITE_PROFILES (on another backend, with the current settings).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loggers', nargs='+', type=int, default=[1, 4, 16])
+        parser.add_argument('--meals', type=int, default=200, help='Meals per logger.')
+        parser.add_argument('--profile', action='append', choices=settings.SQLITE_PROFILES,
+                            help='SQLite profile to run; all by default.')
+        parser.add_argument('--food-items', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.run_configuration(connection.vendor, None, options)
+            return
+        options_before = connection.settings_dict['OPTIONS']
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                for profile in options['profile'] or settings.SQLITE_PROFILES:
+                    connection.close()
+                    connection.settings_dict['OPTIONS'] = settings.SQLITE_PROFILES[profile]
+                    # Locking only shows up with a database file shared by separate connections.
+                    self.run_configuration(profile, Path(directory) / f'{profile}.sqlite3', options)
+        finally:
+            connection.settings_dict['OPTIONS'] = options_before
+
+    def run_configuration(self, label, name, options):
+        with isolated_database(name):
+            loggers = max(options['loggers'])
+            users = create_population(loggers, random.Random(1), prefix='logger')
+            create_food_items(users[0], options['food_items'], random.Random(2))
+            food_item_ids = list(FoodItem.objects.values_list('id', flat=True))
+            # Loggers are forked processes, like web workers, and must not share this connection.
+            connection.close()
+            context = multiprocessing.get_context('fork')
+            quiet = {**settings.METRICS, 'SLOW_REQUEST_SECONDS': None}
+
+            for count in options['loggers']:
+                start = context.Barrier(count + 1)
+                queue = context.Queue()
+                processes = [
+                    context.Process(target=log_meals, args=(
+                        users[i], food_item_ids, options['meals'], i, start, queue,
+                    ))
+                    for i in range(count)
+                ]
+                with override_settings(METRICS=quiet):
+                    for process in processes:
+                        process.start()
+                    start.wait()
+                    began = time.perf_counter()
+                    results = [timing for _ in processes for timing in queue.get()]
+                    elapsed = time.perf_counter() - began
+                for process in processes:
+                    process.join()
+
+                if not results:
+                    raise CommandError('No meals were logged')
+                created = sum(1 for _, status in results if status == 201)
+                p50, p99 = percentiles([seconds for seconds, _ in results])
+                self.stdout.write(
+                    f'{label:<10} {count:>3} loggers  {created / elapsed:8.1f} meals/s  '
+                    f'p50 {p50:8.2f} ms  p99 {p99:8.2f} ms  {len(results) - created:>5} failed'
+                )
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIClient
+
+from tracker.benchmark import create_food_items, get_benchmark_user, isolated_database
+from tracker.models import FoodItem
+
+
+class Command(BaseCommand):
+    help = 'Compare logging N meals with N single POSTs against one /usermeals/batch/ POST.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10, 100, 500])
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            user = get_benchmark_user()
+            create_food_items(user, 1000)
+            food_item_ids = list(FoodItem.objects.values_list('id', flat=True))
+            client = APIClient()
+            client.force_authenticate(user)
+
+            for size in options['sizes']:
+                payload = [
+                    {'food_item': food_item_ids[i % len(food_item_ids)], 'meal_type': 'lunch', 'quantity': 150}
+                    for i in range(size)
+                ]
+
+                start = time.perf_counter()
+                for meal in payload:
+                    self.ensure_created(client.post('/usermeals/', meal, format='json'))
+                single = time.perf_counter() - start
+
+                start = time.perf_counter()
+                self.ensure_created(client.post('/usermeals/batch/', payload, format='json'))
+                batch = time.perf_counter() - start
+
+                self.stdout.write(
+                    f'{size:>5} meals  single {size / single:9.1f} meals/s  '
+                    f'batch {size / batch:9.1f} meals/s  ({single / batch:.1f}x)'
+                )
+
+    def ensure_created(self, response):
+        if response.status_code != 201:
+            raise CommandError(f'Logging failed with {response.status_code}: {response.data}')
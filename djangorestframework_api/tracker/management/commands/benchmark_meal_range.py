@@ -0,0 +1,72 @@
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIClient
+
+from tracker.benchmark import (
+    create_food_items, create_meals, create_users, isolated_database, measure,
+)
+from tracker.dates import day_bounds, get_timezone
+from tracker.models import FoodItem, UserMeal
+
+INDEX_NAME = 'usermeal_owner_datetime_id_idx'
+
+
+class Command(BaseCommand):
+    help = 'Measure /usermeals/range/ latency on a large meal table with and without the (owner, datetime) index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meals', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--tz', default='Europe/Kyiv')
+
+    def handle(self, *args, **options):
+        rng = random.Random(2)
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        tz = get_timezone(options['tz'])
+
+        with isolated_database():
+            users = create_users(options['users'])
+            create_food_items(users[0], 2000, rng)
+            food_items = list(FoodItem.objects.all())
+            create_meals(users, food_items, options['meals'], start, options['days'], rng)
+            self.stdout.write(f'{UserMeal.objects.count()} meals, {len(users)} users')
+
+            user = users[0]
+            first_day = start.date()
+            dates = [first_day + timedelta(days=rng.randrange(options['days'])) for _ in range(options['queries'])]
+            client = APIClient()
+            client.force_authenticate(user)
+
+            def query(day):
+                day_start, day_end = day_bounds(day, tz=tz)
+                return list(UserMeal.objects.filter(owner=user, datetime__gte=day_start, datetime__lt=day_end))
+
+            def fetch(day):
+                response = client.get('/usermeals/range/', {'date': day.isoformat(), 'tz': options['tz']})
+                if response.status_code != 200:
+                    raise CommandError(f'Range query failed with {response.status_code}: {response.data}')
+
+            range_start, range_end = day_bounds(first_day, tz=tz)
+            queryset = UserMeal.objects.filter(owner=user, datetime__gte=range_start, datetime__lt=range_end)
+            plan = queryset.explain()
+            self.stdout.write(f'plan: {plan}')
+            if INDEX_NAME not in plan:
+                raise CommandError(f'The range query does not use {INDEX_NAME}.')
+
+            self.report('indexed', query, fetch, dates)
+
+            index = next(index for index in UserMeal._meta.indexes if index.name == INDEX_NAME)
+            with connection.schema_editor() as editor:
+                editor.remove_index(UserMeal, index)
+            self.stdout.write(f'plan: {queryset.explain()}')
+            self.report('no index', query, fetch, dates)
+
+    def report(self, label, query, fetch, dates):
+        for target, run in (('query', query), ('endpoint', fetch)):
+            p50, p99 = measure(run, dates)
+            self.stdout.write(f'{label:<9} {target:<9} p50 {p50:8.2f} ms  p99 {p99:8.2f} ms')
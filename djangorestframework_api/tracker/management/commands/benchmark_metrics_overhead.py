@@ -0,0 +1,102 @@
+import time
+from statistics import mean
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tracker.benchmark import create_food_items, get_benchmark_user, isolated_database, percentiles
+from tracker.metrics import Histogram, RequestStats, current_request, instrument_query
+from tracker.models import FoodItem, UserMeal
+
+ENDPOINTS = ('/usermeals/today/', '/usermeals/?page_size=50', '/fooditems/?search=apple')
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure what the metrics middleware and query hook add to request latency, '
+        'comparing the same requests with instrumentation on and off.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint per round.')
+        parser.add_argument('--rounds', type=int, default=5, help='Alternating on/off rounds.')
+
+    def handle(self, *args, **options):
+        self.micro()
+
+        with isolated_database():
+            user = get_benchmark_user()
+            create_food_items(user, 2000)
+            UserMeal.bulk_log([
+                UserMeal(owner=user, food_item=food_item, meal_type='lunch', quantity=100)
+                for food_item in FoodItem.objects.all()[:200]
+            ])
+            headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+            plain = [name for name in settings.MIDDLEWARE if name != 'tracker.middleware.MetricsMiddleware']
+            modes = {
+                'off': (override_settings(MIDDLEWARE=plain), False),
+                'on': (override_settings(MIDDLEWARE=['tracker.middleware.MetricsMiddleware', *plain]), True),
+            }
+
+            timings = {(mode, path): [] for mode in modes for path in ENDPOINTS}
+            for _ in range(options['rounds']):
+                for mode, (middleware, hooked) in modes.items():
+                    self.set_query_hook(hooked)
+                    with middleware:
+                        client = Client()
+                        for path in ENDPOINTS:
+                            client.get(path, headers=headers)
+                            for _ in range(options['requests']):
+                                start = time.perf_counter()
+                                client.get(path, headers=headers)
+                                timings[mode, path].append(time.perf_counter() - start)
+            self.set_query_hook(True)
+
+            for path in ENDPOINTS:
+                off, on = timings['off', path], timings['on', path]
+                off_p50, off_p99 = percentiles(off)
+                on_p50, on_p99 = percentiles(on)
+                overhead = (mean(on) - mean(off)) * 1e6
+                self.stdout.write(
+                    f'{path:<28} off p50 {off_p50:6.2f} ms p99 {off_p99:6.2f} ms | '
+                    f'on p50 {on_p50:6.2f} ms p99 {on_p99:6.2f} ms | {overhead:+7.1f} us/request'
+                )
+
+    def set_query_hook(self, enabled):
+        connection.ensure_connection()
+        if instrument_query in connection.execute_wrappers:
+            connection.execute_wrappers.remove(instrument_query)
+        if enabled:
+            connection.execute_wrappers.append(instrument_query)
+
+    def micro(self, count=200000):
+        histogram = Histogram('benchmark_seconds', 'Benchmark.', ('route',))
+        start = time.perf_counter()
+        for _ in range(count):
+            histogram.observe(0.012, route='usermeal-list')
+        observe = (time.perf_counter() - start) / count * 1e9
+
+        stats = RequestStats(keep=10)
+
+        def execute(sql, params, many, context):
+            return None
+
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        for _ in range(count):
+            instrument_query(execute, 'SELECT 1', (), False, None)
+        hooked = (time.perf_counter() - start) / count * 1e9
+        current_request.reset(token)
+
+        start = time.perf_counter()
+        for _ in range(count):
+            instrument_query(execute, 'SELECT 1', (), False, None)
+        idle = (time.perf_counter() - start) / count * 1e9
+
+        self.stdout.write(
+            f'Histogram.observe {observe:.0f} ns, query hook {hooked:.0f} ns in a request '
+            f'and {idle:.0f} ns outside one'
+        )
@@ -0,0 +1,62 @@
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from tracker.benchmark import create_food_items, get_benchmark_user, isolated_database, measure
+from tracker.models import FoodItem, UserMeal
+from tracker.pagination import UserMealPagination
+
+
+def meal_queryset(user):
+    return UserMeal.objects.filter(owner=user).select_related('owner', 'food_item__owner')
+
+
+def page_request(path, params=None):
+    return Request(APIRequestFactory().get(path, params))
+
+
+class Command(BaseCommand):
+    help = 'Compare p50/p99 latency of fetching a deep /usermeals/ page by page number and by cursor.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meals', type=int, default=20000)
+        parser.add_argument('--page', type=int, default=1000)
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        page, page_size = options['page'], options['page_size']
+
+        with isolated_database():
+            user = get_benchmark_user()
+            create_food_items(user, 100)
+            food_items = list(FoodItem.objects.all())
+            for start in range(0, options['meals'], 5000):
+                UserMeal.bulk_log([
+                    UserMeal(owner=user, food_item=food_items[i % len(food_items)], meal_type='lunch', quantity=150)
+                    for i in range(start, min(start + 5000, options['meals']))
+                ])
+
+            def numbered_page(_):
+                paginator = PageNumberPagination()
+                paginator.page_size = page_size
+                request = page_request('/usermeals/', {'page': page})
+                return paginator.paginate_queryset(meal_queryset(user).order_by('-datetime'), request)
+
+            # The cursor a client holds after following ``next`` page - 1 times.
+            last = meal_queryset(user).order_by(*UserMealPagination.ordering)[(page - 1) * page_size - 1]
+            paginator = UserMealPagination()
+            paginator.base_url = f'http://testserver/usermeals/?page_size={page_size}'
+            cursor_url = urlsplit(paginator.encode_cursor([last.datetime, last.id]))
+
+            def keyset_page(_):
+                request = page_request(f'{cursor_url.path}?{cursor_url.query}')
+                return UserMealPagination().paginate_queryset(meal_queryset(user), request)
+
+            self.stdout.write(f'{options["meals"]} meals, page {page} of size {page_size}')
+            for label, run in (('page number', numbered_page), ('cursor', keyset_page)):
+                p50, p99 = measure(run, range(options['repeat']))
+                self.stdout.write(f'{label:<12} p50 {p50:8.2f} ms  p99 {p99:8.2f} ms')
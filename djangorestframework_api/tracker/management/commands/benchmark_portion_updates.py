@@ -0,0 +1,70 @@
+import random
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Sum
+
+from tracker.benchmark import create_food_items, create_meals, create_users, isolated_database
+from tracker.models import DailyNutritionSummary, FoodItem, UserMeal
+from tracker.portion_updates import propagate_food_item_change
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare saving every meal of an edited food item one by one with the chunked '
+        'set-based propagation, for a food item referenced by many meals.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meals', type=int, default=100000, help='Meals referencing the edited food item.')
+        parser.add_argument('--other-meals', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--naive-sample', type=int, default=2000,
+                            help='Meals saved one by one; the full naive time is extrapolated.')
+        parser.add_argument('--chunk-sizes', nargs='+', type=int, default=[500, 2000, 10000])
+
+    def handle(self, *args, **options):
+        rng = random.Random(3)
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+        with isolated_database():
+            users = create_users(options['users'])
+            create_food_items(users[0], 500, rng)
+            edited, *others = FoodItem.objects.order_by('id')
+            create_meals(users, [edited], options['meals'], start, 365, rng)
+            create_meals(users, others, options['other_meals'], start, 365, rng)
+            DailyNutritionSummary.rebuild([user.pk for user in users])
+            self.stdout.write(f'{UserMeal.objects.count()} meals, {options["meals"]} of the edited food item')
+
+            self.edit(edited)
+            sample = list(UserMeal.objects.filter(food_item=edited).select_related('food_item')[:options['naive_sample']])
+            began = time.perf_counter()
+            for meal in sample:
+                meal.food_item = edited
+                meal.save()
+            naive = (time.perf_counter() - began) / len(sample) * options['meals']
+            self.stdout.write(f'{"save() per meal":<22} {naive:8.2f} s (extrapolated from {len(sample)} meals)')
+
+            for chunk_size in options['chunk_sizes']:
+                self.edit(edited)
+                began = time.perf_counter()
+                rewritten = propagate_food_item_change(edited.pk, chunk_size=chunk_size)
+                elapsed = time.perf_counter() - began
+                self.stdout.write(
+                    f'{f"chunks of {chunk_size}":<22} {elapsed:8.2f} s  {rewritten / elapsed:10.0f} meals/s  '
+                    f'({naive / elapsed:.0f}x)'
+                )
+
+            meals_total = UserMeal.objects.aggregate(total=Sum('portion_calories'))['total']
+            summaries_total = DailyNutritionSummary.objects.aggregate(total=Sum('calories'))['total']
+            if abs(meals_total - summaries_total) > 1e-6 * meals_total:
+                raise CommandError(f'Summaries drifted: {summaries_total} kcal vs {meals_total} kcal in meals.')
+            self.stdout.write('Daily summaries match the meals.')
+
+    def edit(self, food_item):
+        # A queryset update, so the edit itself does not trigger propagation.
+        food_items = FoodItem.objects.filter(pk=food_item.pk)
+        food_items.update(calories=F('calories') * 1.1)
+        food_items.update(**FoodItem.density_expressions())
+        food_item.refresh_from_db()
@@ -0,0 +1,60 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from rest_framework.filters import SearchFilter
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from tracker.benchmark import (
+    FOOD_WORDS, create_food_items, get_benchmark_user, isolated_database, measure,
+)
+from tracker.models import FoodItem
+from tracker.search import search_food_items
+
+
+class LegacySearchView:
+    search_fields = ['name', 'producer']
+
+
+def legacy_search(query):
+    """The icontains query FoodItemViewSet ran before the search index."""
+    queryset = FoodItem.objects.all()
+    condition = Q()
+    for term in query.split():
+        condition |= Q(name__icontains=term) | Q(producer__icontains=term)
+    queryset = queryset.filter(condition)
+    request = Request(APIRequestFactory().get('/fooditems/', {'search': query}))
+    return SearchFilter().filter_queryset(request, queryset, LegacySearchView())
+
+
+def first_page(queryset, page_size=10):
+    queryset.count()
+    return list(queryset[:page_size])
+
+
+class Command(BaseCommand):
+    help = 'Compare p50/p99 food search latency of the icontains query and the search index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000])
+        parser.add_argument('--queries', type=int, default=100)
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        queries = [
+            ' '.join(word[:rng.randint(3, len(word))] for word in rng.sample(FOOD_WORDS, rng.randint(1, 2)))
+            for _ in range(options['queries'])
+        ]
+
+        with isolated_database():
+            owner = get_benchmark_user()
+            total = 0
+            for size in sorted(options['sizes']):
+                total += create_food_items(owner, size - total, rng)
+                for label, run in (
+                    ('icontains', lambda q: first_page(legacy_search(q))),
+                    ('index', lambda q: first_page(search_food_items(FoodItem.objects.all(), q))),
+                ):
+                    p50, p99 = measure(run, queries)
+                    self.stdout.write(f'{size:>9} items  {label:<10} p50 {p50:8.2f} ms  p99 {p99:8.2f} ms')
@@ -0,0 +1,111 @@
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from tracker.benchmark import create_food_items, create_meals, create_users, isolated_database, measure
+from tracker.dates import day_bounds
+from tracker.models import DailyNutritionSummary, FoodItem, UserMeal
+from tracker.summaries import NUTRIENTS, build_trends, user_targets
+from tracker.trends import PERIODS
+
+
+def python_trends(user, period, date_from, date_to):
+    """The trends computed the straightforward way, from every meal, for comparison."""
+    window = PERIODS[period]
+    first = date_from - timedelta(days=window - 1)
+    range_start, range_end = day_bounds(first, date_to)
+    days = {}
+    for meal in UserMeal.objects.filter(owner=user, datetime__gte=range_start, datetime__lt=range_end):
+        totals = days.setdefault(DailyNutritionSummary.meal_date(meal), dict.fromkeys(NUTRIENTS, 0.0))
+        for nutrient in NUTRIENTS:
+            totals[nutrient] += getattr(meal, f'portion_{nutrient}')
+    targets = user_targets(user)
+    result = []
+    day = date_from
+    while day <= date_to:
+        logged = [days[past] for offset in range(window) if (past := day - timedelta(days=offset)) in days]
+        result.append({
+            'date': day,
+            'totals': days.get(day),
+            'rolling_average': {
+                nutrient: sum(totals[nutrient] for totals in logged) / len(logged) for nutrient in NUTRIENTS
+            } if logged else None,
+            'deviation': {
+                nutrient: days[day][nutrient] - targets[nutrient] for nutrient in NUTRIENTS
+            } if day in days else None,
+        })
+        day += timedelta(days=1)
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure /usermeals/trends/ over a multi-year meal history: computed from the daily summaries with '
+        'NumPy, from every meal in Python, and served from the cache.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--years', type=int, default=5)
+        parser.add_argument('--meals-per-day', type=int, default=4, help='Average per user.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        rng = random.Random(5)
+        days = options['years'] * 365 + options['years'] // 4
+        start = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+        date_from = start.date()
+        date_to = date_from + timedelta(days=days - 1)
+
+        with isolated_database(), override_settings(TRENDS={**settings.TRENDS, 'MAX_DAYS': days}):
+            users = create_users(options['users'])
+            create_food_items(users[0], 2000, rng)
+            food_items = list(FoodItem.objects.all())
+            count = create_meals(users, food_items, len(users) * days * options['meals_per_day'], start, days, rng)
+            DailyNutritionSummary.rebuild([user.pk for user in users])
+            user = users[0]
+            self.stdout.write(
+                f'{count} meals, {user.meals.count()} of them the measured user\'s over {days} days; '
+                f'{DailyNutritionSummary.objects.filter(owner=user).count()} summary rows'
+            )
+
+            client = APIClient()
+            client.force_authenticate(user)
+            params = {'from': date_from.isoformat(), 'to': date_to.isoformat()}
+            cache = caches[settings.TRENDS['CACHE']]
+            runs = range(options['repeat'])
+
+            for period in PERIODS:
+                expected = python_trends(user, period, date_from, date_to)
+                with override_settings(TRENDS={**settings.TRENDS, 'TIMEOUT': None}):
+                    computed = build_trends(user, period, date_from, date_to)['days']
+                for python_day, day in zip(expected, computed):
+                    average = python_day['rolling_average']
+                    if (average is None) != (day['rolling_average'] is None) or average and any(
+                        abs(average[nutrient] - day['rolling_average'][nutrient]) > 0.01 for nutrient in NUTRIENTS
+                    ):
+                        raise CommandError(f'Trends disagree on {day["date"]}: {average} != {day["rolling_average"]}')
+
+                self.report(period, 'python, meals', measure(
+                    lambda _: python_trends(user, period, date_from, date_to), range(max(1, options['repeat'] // 4)),
+                ))
+                with override_settings(TRENDS={**settings.TRENDS, 'TIMEOUT': None}):
+                    self.report(period, 'numpy, summaries', measure(
+                        lambda _: build_trends(user, period, date_from, date_to), runs,
+                    ))
+                    self.report(period, 'endpoint, uncached', measure(
+                        lambda _: client.get('/usermeals/trends/', {**params, 'period': period}), runs,
+                    ))
+                cache.clear()
+                self.report(period, 'endpoint, cached', measure(
+                    lambda _: client.get('/usermeals/trends/', {**params, 'period': period}), runs,
+                ))
+
+    def report(self, period, label, timings):
+        p50, p99 = timings
+        self.stdout.write(f'{period:<6} {label:<20} p50 {p50:9.2f} ms  p99 {p99:9.2f} ms')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from tracker.catalog_sync import build_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Write a catalog snapshot for /fooditems/snapshot/ now, e.g. after a deploy or a catalog import.'
+
+    def handle(self, *args, **options):
+        version, path = build_snapshot()
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote the catalog at version {version} to {path} ({path.stat().st_size / 2 ** 20:.1f} MiB).'
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.catalog_import import CatalogImporter, Checkpoint, DirectorySource, WebSource
+from tracker.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Import the food catalog, upserting on (producer, name) and resuming from a checkpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', type=int, default=1, help='Id of the user that owns imported items.')
+        parser.add_argument('--source-dir', help='Read saved HTML pages from this directory instead of the web.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Pages fetched in parallel.')
+        parser.add_argument('--parse-workers', type=int, default=None, help='Parser processes (default: CPU count).')
+        parser.add_argument('--checkpoint', default='.food_import_checkpoint.json',
+                            help="Progress file used to resume an interrupted run ('' disables it).")
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint.')
+
+    def handle(self, *args, **options):
+        try:
+            owner = UserProfile.objects.get(id=options['owner'])
+        except UserProfile.DoesNotExist:
+            raise CommandError(f"User with ID {options['owner']} does not exist.")
+
+        checkpoint = Checkpoint(options['checkpoint'])
+        if options['restart']:
+            checkpoint.clear()
+        source = DirectorySource(options['source_dir']) if options['source_dir'] else WebSource()
+
+        importer = CatalogImporter(
+            source, owner, checkpoint,
+            concurrency=options['concurrency'],
+            parse_workers=options['parse_workers'],
+            log=self.stdout.write,
+        )
+        created, updated = importer.run()
+        self.stdout.write(self.style.SUCCESS(f'Done: {created} created, {updated} updated.'))
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import os
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from tracker.benchmark import FakeAI21Server, isolated_database
+from tracker.loadtest import (
+    DEFAULT_WEIGHTS, NUTRITION_ANSWER, SCALES, SCENARIOS, build_report, format_comparison, format_report, run, seed,
+    sessions_for,
+)
+
+
+def scenario_weight(value):
+    name, _, weight = value.partition('=')
+    if name not in SCENARIOS or not weight.isdigit():
+        raise ValueError(value)
+    return name, int(weight)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database with users, a food catalog and years of meals, then run weighted '
+        'API scenarios from concurrent virtual users against the ASGI handler and a fake AI21 server. '
+        'Writes a JSON report that --compare can diff against a later run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='small')
+        parser.add_argument('--users', type=int, help='Override the number of users of --scale.')
+        parser.add_argument('--food-items', type=int, help='Override the catalog size of --scale.')
+        parser.add_argument('--meals-per-user', type=int, help='Override the meals per user of --scale.')
+        parser.add_argument('--years', type=int, help='Override the years of meal history of --scale.')
+        parser.add_argument('--concurrency', type=int, default=20, help='Virtual users.')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds of recorded load.')
+        parser.add_argument('--warmup', type=float, default=3, help='Seconds of unrecorded load first.')
+        parser.add_argument('--ai-delay', type=float, default=0.5, help='Fake model latency in seconds.')
+        parser.add_argument('--scenario', type=scenario_weight, action='append', default=[],
+                            metavar='NAME=WEIGHT', help=f'Reweight a scenario, 0 to skip it: {", ".join(SCENARIOS)}.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        parser.add_argument('--compare', help='A previous JSON report to compare with.')
+
+    def handle(self, *args, **options):
+        scale = {
+            key: options[key] if options[key] is not None else value
+            for key, value in SCALES[options['scale']].items()
+        }
+        weights = {**DEFAULT_WEIGHTS, **dict(options['scenario'])}
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as error:
+                raise CommandError(f'Cannot read {options["compare"]}: {error}')
+
+        os.environ.setdefault('AI21_API_KEY', 'fake')
+        with isolated_database(), FakeAI21Server(NUTRITION_ANSWER, delay=options['ai_delay']) as server:
+            began = time.perf_counter()
+            users, food_item_ids = seed(**scale, rng=random.Random(options['seed']))
+            self.stdout.write(
+                f'Seeded {scale["users"]} users, {scale["food_items"]} food items and '
+                f'{scale["users"] * scale["meals_per_user"]} meals in {time.perf_counter() - began:.1f} s'
+            )
+
+            sessions = sessions_for(users, food_item_ids, options['concurrency'], options['seed'])
+            # Under load most requests queue long enough to count as slow.
+            quiet = {**settings.METRICS, 'SLOW_REQUEST_SECONDS': None}
+            # The point is how much the server handles, not how much the AI rate limits let through.
+            unlimited = {**settings.RATE_LIMITS, 'ENABLED': False}
+            with override_settings(AI={**settings.AI, 'API_HOST': server.url}, METRICS=quiet, RATE_LIMITS=unlimited):
+                results = asyncio.run(run(sessions, weights, options['duration'], options['warmup']))
+
+        report = build_report(results, options['duration'], {
+            'scale': scale,
+            'concurrency': options['concurrency'],
+            'duration': options['duration'],
+            'warmup': options['warmup'],
+            'ai_delay': options['ai_delay'],
+            'weights': weights,
+            'seed': options['seed'],
+            'database': settings.DATABASES['default']['ENGINE'],
+        })
+        self.stdout.write(format_report(report))
+        if baseline:
+            self.stdout.write(format_comparison(baseline, report))
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(f'Report written to {options["output"]}')
@@ -0,0 +1,31 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tracker.jobs import process_available_jobs, start_workers
+
+
+class Command(BaseCommand):
+    help = 'Run a pool of worker threads that execute queued ai_advice jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.AI_JOBS['WORKERS'])
+        parser.add_argument('--once', action='store_true', help='Run the runnable jobs in this thread and exit.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            processed = process_available_jobs()
+            self.stdout.write(f'Processed {processed} jobs.')
+            return
+
+        stop = threading.Event()
+        threads = start_workers(options['workers'], stop)
+        self.stdout.write(f"Started {options['workers']} advice workers. Press Ctrl+C to stop.")
+        try:
+            while not stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
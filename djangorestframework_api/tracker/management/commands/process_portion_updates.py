@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from tracker.portion_updates import process_pending_updates
+
+
+class Command(BaseCommand):
+    help = 'Rewrite the meals and daily summaries of food items whose nutrients changed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            processed = process_pending_updates()
+            self.stdout.write(f'Processed {processed} food items.')
+            return
+
+        self.stdout.write('Waiting for food item changes. Press Ctrl+C to stop.')
+        try:
+            while True:
+                close_old_connections()
+                if not process_pending_updates():
+                    time.sleep(settings.PORTION_UPDATES['POLL_INTERVAL'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from tracker.models import DailyNutritionSummary, FoodItem, UserMeal
+
+
+class Command(BaseCommand):
+    help = (
+        'Rewrite the stored portion_* values of meals from their food items in one bulk UPDATE, '
+        'then rebuild the affected daily summaries.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--food-item', type=int, action='append', dest='food_items',
+                            help='Food item id to recompute; repeat for several.')
+        parser.add_argument('--all', action='store_true', help='Recompute meals of every food item.')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users per summary rebuild transaction.')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            food_item_ids = FoodItem.objects.values('id')
+        elif options['food_items']:
+            food_item_ids = options['food_items']
+        else:
+            raise CommandError('Pass --food-item ID or --all.')
+
+        with transaction.atomic():
+            # Densities first, in case the items were changed by a bulk write.
+            food_items = FoodItem.objects.filter(id__in=food_item_ids, portion_size__gt=0)
+            refreshed = food_items.update(**FoodItem.density_expressions())
+            owner_ids = sorted(UserMeal.recompute_portions(food_item_ids))
+
+        chunk_size = options['chunk_size']
+        for start in range(0, len(owner_ids), chunk_size):
+            DailyNutritionSummary.rebuild(owner_ids[start:start + chunk_size])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed meals of {refreshed} food items for {len(owner_ids)} users.'
+        ))
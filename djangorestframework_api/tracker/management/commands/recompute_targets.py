@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tracker.authentication import forget_users
+from tracker.models import UserProfile
+from tracker.targets import INPUT_FIELDS, TARGET_FIELDS, calculate_targets_batch, profile_inputs
+from tracker.trends import forget_trends
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's calorie and macro targets, a chunk of users at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Users per transaction.')
+
+    def handle(self, *args, **options):
+        users = UserProfile.objects.only('id', *INPUT_FIELDS, *TARGET_FIELDS).order_by('id')
+        checked = updated = 0
+        last_id = 0
+        while True:
+            chunk = list(users.filter(id__gt=last_id)[:options['chunk_size']])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+            checked += len(chunk)
+            updated += self.recompute(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f'Updated targets of {updated} of {checked} users.'))
+
+    @transaction.atomic
+    def recompute(self, users):
+        targets = calculate_targets_batch(**profile_inputs(users))
+        changed = []
+        for index, user in enumerate(users):
+            values = {field: float(targets[field][index]) for field in TARGET_FIELDS}
+            if any(getattr(user, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(user, field, value)
+                changed.append(user)
+        UserProfile.objects.bulk_update(changed, TARGET_FIELDS, batch_size=1000)
+        forget_users(user.pk for user in changed)
+        forget_trends(user.pk for user in changed)
+        return len(changed)
@@ -0,0 +1,281 @@
+"""
+In-process request metrics, served in the Prometheus text format on /metrics.
+Every worker process keeps its own numbers, so each worker is scraped on its
+own. Recording a value is one dict lookup, a bisect and a short lock.
+"""
+import bisect
+import heapq
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+
+from .ai_cache import nutrition_cache
+from .ai_parsing import nutrition_parser
+from .ratelimit import rate_limiter
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=''):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def key(self, labels):
+        return tuple(labels[name] for name in self.labels)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._series.get(self.key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        return self.header() + [
+            f'{self.name}{format_labels(self.labels, key)} {format_value(value)}' for key, value in series
+        ]
+
+
+class CallbackCounter(Counter):
+    """A counter whose values are read from ``callback`` at scrape time, as {label values: value}."""
+
+    def __init__(self, name, documentation, labels, callback):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def render(self):
+        with self._lock:
+            self._series = dict(self.callback())
+        return super().render()
+
+
+class CallbackGauge(CallbackCounter):
+    kind = 'gauge'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then sum and count.
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, **labels):
+        """(sum, count) of one series, for tests."""
+        with self._lock:
+            series = self._series.get(self.key(labels))
+            return (series[1], series[2]) if series else (0.0, 0)
+
+    def render(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        lines = self.header()
+        bounds = [format_value(float(bound)) for bound in self.buckets] + ['+Inf']
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, key)} {format_value(total)}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, key)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.register(Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request, by route.', ('route', 'method', 'status'),
+))
+REQUEST_QUERIES = registry.register(Histogram(
+    'http_request_db_queries', 'Database queries run per request.', ('route',), buckets=QUERY_COUNT_BUCKETS,
+))
+REQUEST_DB_DURATION = registry.register(Histogram(
+    'http_request_db_duration_seconds', 'Time spent in database queries per request.', ('route',),
+))
+RESPONSE_RENDER_DURATION = registry.register(Histogram(
+    'http_response_render_duration_seconds', 'Time spent rendering DRF responses to bytes.', ('route',),
+))
+UPSTREAM_DURATION = registry.register(Histogram(
+    'upstream_request_duration_seconds', 'Duration of calls to external services.', ('service', 'outcome'),
+))
+SLOW_REQUESTS = registry.register(Counter(
+    'http_slow_requests_total', 'Requests slower than the slow request threshold.', ('route',),
+))
+
+
+def ai_cache_lookups():
+    stats = nutrition_cache.stats()
+    return {(nutrition_cache.namespace, result): stats[result] for result in ('hits', 'misses', 'coalesced')}
+
+
+AI_CACHE_LOOKUPS = registry.register(CallbackCounter(
+    'ai_cache_lookups_total', 'AI answer cache lookups by result.', ('cache', 'result'), ai_cache_lookups,
+))
+
+
+def ai_response_parses():
+    return {('nutrition', result): count for result, count in nutrition_parser.results().items()}
+
+
+AI_RESPONSE_PARSES = registry.register(CallbackCounter(
+    'ai_response_parses_total', 'Model answers parsed, by how or why they could not be.', ('parser', 'result'),
+    ai_response_parses,
+))
+
+RATE_LIMIT_DECISIONS = registry.register(CallbackCounter(
+    'ai_rate_limit_decisions_total', 'AI endpoint rate limit checks by outcome.', ('endpoint', 'outcome'),
+    rate_limiter.decisions,
+))
+
+
+def rate_limit_levels():
+    return {(bucket,): tokens for bucket, tokens in rate_limiter.levels().items()}
+
+
+RATE_LIMIT_TOKENS = registry.register(CallbackGauge(
+    'ai_rate_limit_tokens', 'Tokens left in the rate limit buckets shared by all users.', ('bucket',),
+    rate_limit_levels,
+))
+
+
+class RequestStats:
+    """What one request did, filled in by the query hook while it runs."""
+
+    __slots__ = ('queries', 'db_duration', 'render_duration', 'slowest', 'keep')
+
+    def __init__(self, keep=0):
+        self.queries = 0
+        self.db_duration = 0.0
+        self.render_duration = None
+        # A min-heap of the ``keep`` slowest (duration, sql) statements.
+        self.slowest = []
+        self.keep = keep
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.db_duration += duration
+        if self.keep:
+            if len(self.slowest) < self.keep:
+                heapq.heappush(self.slowest, (duration, sql))
+            elif duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (duration, sql))
+
+
+current_request = ContextVar('current_request_stats', default=None)
+
+
+def instrument_query(execute, sql, params, many, context):
+    """Database execute wrapper that charges each query to the current request, if any."""
+    stats = current_request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - started)
+
+
+def install_query_hook(sender, connection, **kwargs):
+    # connection_created fires on every reconnect of the same wrapper.
+    if instrument_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(instrument_query)
+
+
+@contextmanager
+def observe_upstream(service):
+    """Record how long the block took as a call to ``service`` and whether it succeeded."""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    except BaseException as error:
+        if not isinstance(error, Exception):
+            outcome = 'cancelled'
+        raise
+    finally:
+        UPSTREAM_DURATION.observe(time.perf_counter() - started, service=service, outcome=outcome)
+
+
+@require_GET
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS['ALLOWED_IPS']:
+        raise Http404
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,102 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .metrics import (
+    REQUEST_DB_DURATION, REQUEST_DURATION, REQUEST_QUERIES, RESPONSE_RENDER_DURATION, SLOW_REQUESTS,
+    RequestStats, current_request,
+)
+
+logger = logging.getLogger('tracker.slow_requests')
+
+
+class MetricsMiddleware:
+    """
+    Records each request's latency, database queries and render time under
+    its route name. It runs in both modes, so async views stay on the event
+    loop; queries made in sync_to_async threads are still counted because
+    the stats live in a context variable.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # A sync hook would be run in a worker thread for every response.
+            self.process_template_response = self.aprocess_template_response
+        self.slow_request_seconds = settings.METRICS['SLOW_REQUEST_SECONDS']
+        self.logged_queries = settings.METRICS['LOGGED_QUERIES'] if self.slow_request_seconds is not None else 0
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats, token, started = self.begin()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self.finish(request, response, stats, started)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, started = self.begin()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self.finish(request, response, stats, started)
+        return response
+
+    def begin(self):
+        stats = RequestStats(keep=self.logged_queries)
+        return stats, current_request.set(stats), time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns, still inside __call__.
+        self.time_render(response)
+        return response
+
+    async def aprocess_template_response(self, request, response):
+        self.time_render(response)
+        return response
+
+    def time_render(self, response):
+        stats = current_request.get()
+        if stats is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                stats.render_duration = time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+
+    def finish(self, request, response, stats, started):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+
+        REQUEST_DURATION.observe(elapsed, route=route, method=request.method, status=response.status_code)
+        REQUEST_QUERIES.observe(stats.queries, route=route)
+        REQUEST_DB_DURATION.observe(stats.db_duration, route=route)
+        if stats.render_duration is not None:
+            RESPONSE_RENDER_DURATION.observe(stats.render_duration, route=route)
+
+        if self.slow_request_seconds is not None and elapsed >= self.slow_request_seconds:
+            SLOW_REQUESTS.inc(route=route)
+            statements = ''.join(
+                f'\n  {duration * 1000:8.2f} ms  {sql}' for duration, sql in sorted(stats.slowest, reverse=True)
+            )
+            logger.warning(
+                'Slow request %s %s (%s) took %.0f ms, %s queries in %.0f ms. Slowest statements:%s',
+                request.method, request.path, route, elapsed * 1000, stats.queries, stats.db_duration * 1000,
+                statements,
+            )
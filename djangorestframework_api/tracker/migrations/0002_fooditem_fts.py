@@ -0,0 +1,63 @@
+from django.db import migrations
+
+FTS_TABLE = 'tracker_fooditem_fts'
+
+CREATE_STATEMENTS = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    "name, producer, tokenize = 'unicode61 remove_diacritics 2')",
+    f"INSERT INTO {FTS_TABLE} (rowid, name, producer) "
+    "SELECT id, name, producer FROM tracker_fooditem",
+    f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON tracker_fooditem BEGIN "
+    f"INSERT INTO {FTS_TABLE} (rowid, name, producer) VALUES (new.id, new.name, new.producer); END",
+    f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON tracker_fooditem BEGIN "
+    f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END",
+    f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF name, producer ON tracker_fooditem BEGIN "
+    f"UPDATE {FTS_TABLE} SET name = new.name, producer = new.producer WHERE rowid = old.id; END",
+]
+
+DROP_STATEMENTS = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def fts5_supported(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if cursor.fetchone()[0]:
+            return True
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+            cursor.execute("DROP TABLE temp.fts5_probe")
+        except Exception:
+            return False
+    return True
+
+
+def create_fts_table(apps, schema_editor):
+    if not fts5_supported(schema_editor.connection):
+        return
+    for statement in CREATE_STATEMENTS:
+        schema_editor.execute(statement)
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_STATEMENTS:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0 on 2026-10-18 17:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0002_fooditem_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyNutritionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('meal_type', models.CharField(choices=[('breakfast', 'Breakfast'), ('morning_snack', 'Morning Snack'), ('lunch', 'Lunch'), ('afternoon_snack', 'Afternoon Snack'), ('dinner', 'Dinner'), ('evening_snack', 'Evening Snack')], max_length=20)),
+                ('meal_count', models.PositiveIntegerField(default=0)),
+                ('calories', models.FloatField(default=0)),
+                ('fat', models.FloatField(default=0)),
+                ('carbohydrates', models.FloatField(default=0)),
+                ('proteins', models.FloatField(default=0)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date', 'meal_type'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailynutritionsummary',
+            constraint=models.UniqueConstraint(fields=('owner', 'date', 'meal_type'), name='unique_daily_summary'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-18 17:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0003_dailynutritionsummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(fields=['producer', 'name'], name='fooditem_producer_name_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0 on 2026-10-18 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0005_advicejob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(fields=['name', 'id'], name='fooditem_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usermeal',
+            index=models.Index(fields=['owner', 'datetime', 'id'], name='usermeal_owner_datetime_id_idx'),
+        ),
+    ]
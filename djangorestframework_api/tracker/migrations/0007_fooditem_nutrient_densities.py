@@ -0,0 +1,69 @@
+# Generated by Django 5.0 on 2026-10-18 17:27
+
+from django.db import migrations, models
+from django.db.models import F
+
+FTS_TABLE = 'tracker_fooditem_fts'
+
+# Adding NOT NULL columns makes SQLite rebuild tracker_fooditem, which drops
+# the search triggers created in 0002; any migration that rebuilds the table
+# has to put them back.
+TRIGGER_STATEMENTS = [
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON tracker_fooditem BEGIN "
+    f"INSERT INTO {FTS_TABLE} (rowid, name, producer) VALUES (new.id, new.name, new.producer); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON tracker_fooditem BEGIN "
+    f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, producer ON tracker_fooditem BEGIN "
+    f"UPDATE {FTS_TABLE} SET name = new.name, producer = new.producer WHERE rowid = old.id; END",
+]
+
+
+def restore_fts_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or FTS_TABLE not in connection.introspection.table_names():
+        return
+    for statement in TRIGGER_STATEMENTS:
+        schema_editor.execute(statement)
+
+
+def fill_densities(apps, schema_editor):
+    FoodItem = apps.get_model('tracker', 'FoodItem')
+    FoodItem.objects.filter(portion_size__gt=0).update(
+        calories_per_unit=F('calories') / F('portion_size'),
+        fat_per_unit=F('fat') / F('portion_size'),
+        carbohydrates_per_unit=F('carbohydrates') / F('portion_size'),
+        protein_per_unit=F('protein') / F('portion_size'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_fts_triggers),
+        migrations.AddField(
+            model_name='fooditem',
+            name='calories_per_unit',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='fooditem',
+            name='carbohydrates_per_unit',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='fooditem',
+            name='fat_per_unit',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='fooditem',
+            name='protein_per_unit',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+        migrations.RunPython(fill_densities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0 on 2026-10-18 17:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0007_fooditem_nutrient_densities'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingPortionUpdate',
+            fields=[
+                ('food_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pending_portion_update', serialize=False, to='tracker.fooditem')),
+                ('requested_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['requested_at'],
+            },
+        ),
+    ]
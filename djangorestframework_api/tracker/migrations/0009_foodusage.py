@@ -0,0 +1,35 @@
+# Generated by Django 5.0 on 2026-10-18 18:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0008_pendingportionupdate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('meal_type', models.CharField(choices=[('breakfast', 'Breakfast'), ('morning_snack', 'Morning Snack'), ('lunch', 'Lunch'), ('afternoon_snack', 'Afternoon Snack'), ('dinner', 'Dinner'), ('evening_snack', 'Evening Snack')], max_length=20)),
+                ('use_count', models.PositiveIntegerField(default=0)),
+                ('last_used', models.DateTimeField()),
+                ('score', models.FloatField()),
+                ('food_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage', to='tracker.fooditem')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='food_usage', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-score'],
+                'indexes': [models.Index(fields=['owner', 'meal_type', '-score'], name='foodusage_ranking_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='foodusage',
+            constraint=models.UniqueConstraint(fields=('owner', 'meal_type', 'food_item'), name='unique_food_usage'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.0 on 2026-10-18 18:32
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+FTS_TABLE = 'tracker_fooditem_fts'
+
+# Adding the NOT NULL version column rebuilds tracker_fooditem on SQLite and
+# drops the search triggers, as in 0007.
+TRIGGER_STATEMENTS = [
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON tracker_fooditem BEGIN "
+    f"INSERT INTO {FTS_TABLE} (rowid, name, producer) VALUES (new.id, new.name, new.producer); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON tracker_fooditem BEGIN "
+    f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, producer ON tracker_fooditem BEGIN "
+    f"UPDATE {FTS_TABLE} SET name = new.name, producer = new.producer WHERE rowid = old.id; END",
+]
+
+
+def restore_fts_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or FTS_TABLE not in connection.introspection.table_names():
+        return
+    for statement in TRIGGER_STATEMENTS:
+        schema_editor.execute(statement)
+
+
+def number_existing_items(apps, schema_editor):
+    # Ids are unique and never reused, so they make valid first versions.
+    FoodItem = apps.get_model('tracker', 'FoodItem')
+    CatalogVersion = apps.get_model('tracker', 'CatalogVersion')
+    FoodItem.objects.update(version=F('id'))
+    CatalogVersion.objects.create(pk=1, value=FoodItem.objects.aggregate(last=Max('id'))['last'] or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0009_foodusage'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_fts_triggers),
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FoodItemTombstone',
+            fields=[
+                ('food_item_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(db_index=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fooditem',
+            name='version',
+            field=models.PositiveBigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+        migrations.RunPython(number_existing_items, migrations.RunPython.noop),
+    ]
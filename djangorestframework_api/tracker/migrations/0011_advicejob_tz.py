@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0010_catalog_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advicejob',
+            name='tz',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
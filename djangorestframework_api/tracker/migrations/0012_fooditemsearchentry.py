@@ -0,0 +1,26 @@
+# Generated by Django 5.0 on 2026-10-18 19:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0011_advicejob_tz'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodItemSearchEntry',
+            fields=[
+                ('food_item', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='tracker.fooditem')),
+                ('name', models.TextField()),
+                ('producer', models.TextField()),
+            ],
+            options={
+                'db_table': 'tracker_fooditem_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -1,9 +1,17 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Exp, Greatest, Ln, TruncDate
+from django.utils import timezone
+
+from .nutrition import DENSITY_FIELDS, NUTRIENT_FIELDS, apply_portions, nutrient_densities
+from .targets import INPUT_FIELDS as TARGET_INPUT_FIELDS, TARGET_FIELDS, calculate_targets
+from .trends import forget_trends
+from .usage import MIN_REMAINDER, add_weights, combined_weight, use_weight
 
 class UserProfile(AbstractUser):
     GENDER_CHOICES = [
@@ -35,57 +43,31 @@ class UserProfile(AbstractUser):
     fat_intake = models.FloatField(default=0)
     carbohydrate_intake = models.FloatField(default=0)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_target_inputs = [instance.__dict__.get(field) for field in TARGET_INPUT_FIELDS]
+        return instance
+
+    def target_inputs_changed(self):
+        return getattr(self, '_saved_target_inputs', None) != [getattr(self, field) for field in TARGET_INPUT_FIELDS]
+
     def save(self, *args, **kwargs):
-        self.calculate_intakes()
+        # Logins and password changes save the user too; targets only move
+        # when one of their inputs does.
+        update_fields = kwargs.get('update_fields')
+        touches_inputs = update_fields is None or not set(update_fields).isdisjoint(TARGET_INPUT_FIELDS)
+        if touches_inputs and self.target_inputs_changed():
+            self.calculate_intakes()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, *TARGET_FIELDS}
         super().save(*args, **kwargs)
+        self._saved_target_inputs = [getattr(self, field) for field in TARGET_INPUT_FIELDS]
 
     def calculate_intakes(self):
-        if self.gender == 'M':
-            bmr = 10 * self.weight + 6.25 * self.height - 5 * self.age + 5
-        else:
-            bmr = 10 * self.weight + 6.25 * self.height - 5 * self.age - 161
-
-        activity_factors = {
-            'S': 1.2,
-            'L': 1.375,
-            'M': 1.55,
-            'V': 1.725,
-            'E': 1.9
-        }
-        ka = activity_factors[self.activity_level]
-
-        protein_percent = 0.25
-        fat_percent = 0.30
-        carb_percent = 0.45
-
-        if self.goal == 'L':
-            self.calorie_intake = (bmr * ka) - 500
-            protein_percent += 0.05
-            fat_percent -= 0.05
-        elif self.goal == 'M':
-            self.calorie_intake = bmr * ka
-        else:  # 'G'
-            self.calorie_intake = (bmr * ka) + 500
-            carb_percent += 0.05
-            protein_percent -= 0.05
-
-        if self.activity_level in ['V', 'E']:  # Very active or Extra active
-            protein_percent += 0.05
-            carb_percent += 0.05
-            fat_percent -= 0.10
-
-        if self.age > 50:
-            protein_percent += 0.05
-            fat_percent -= 0.05
-
-        if self.gender == 'F':
-            fat_percent += 0.05
-            carb_percent -= 0.05
-
-        self.protein_intake = round((self.calorie_intake * protein_percent) / 4, 1)
-        self.fat_intake = round((self.calorie_intake * fat_percent) / 9, 1)
-        self.carbohydrate_intake = round((self.calorie_intake * carb_percent) / 4, 1)
-        self.calorie_intake = round(self.calorie_intake, 1)
+        targets = calculate_targets(**{field: getattr(self, field) for field in TARGET_INPUT_FIELDS})
+        for field, value in targets.items():
+            setattr(self, field, value)
 
 class FoodItem(models.Model):
     owner = models.ForeignKey(
@@ -99,6 +81,13 @@ class FoodItem(models.Model):
     carbohydrates = models.FloatField(default=0)
     portion_size = models.FloatField()
 
+    # Nutrients per one unit of quantity_unit, kept in sync by save() and
+    # refresh_densities() so portions are a single multiplication.
+    calories_per_unit = models.FloatField(default=0, editable=False)
+    fat_per_unit = models.FloatField(default=0, editable=False)
+    carbohydrates_per_unit = models.FloatField(default=0, editable=False)
+    protein_per_unit = models.FloatField(default=0, editable=False)
+
     GRAMS = 'g'
     MILLILITERS = 'ml'
     PIECES = 'pcs'
@@ -110,6 +99,15 @@ class FoodItem(models.Model):
     
     quantity_unit = models.CharField(max_length=3, choices=UNIT_CHOICES, default=GRAMS)
 
+    # The catalog version of the item's last change, see CatalogVersion.
+    version = models.PositiveBigIntegerField(default=0, editable=False, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['producer', 'name'], name='fooditem_producer_name_idx'),
+            models.Index(fields=['name', 'id'], name='fooditem_name_id_idx'),
+        ]
+
     def clean(self):
         if self.protein < 0:
             raise ValidationError(_('Protein value cannot be negative'))
@@ -118,13 +116,98 @@ class FoodItem(models.Model):
         if self.carbohydrates < 0:
             raise ValidationError(_('Carbohydrates value cannot be negative'))
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_densities = [instance.__dict__.get(field) for field in DENSITY_FIELDS]
+        return instance
+
+    def densities_changed(self):
+        """Whether the stored densities differ from the ones last loaded or saved."""
+        return getattr(self, '_saved_densities', None) != [getattr(self, field) for field in DENSITY_FIELDS]
+
+    def refresh_densities(self):
+        """Recompute the *_per_unit fields; call before bulk_create or bulk_update."""
+        for field, value in zip(DENSITY_FIELDS, nutrient_densities(self)):
+            setattr(self, field, value)
+
+    @staticmethod
+    def stamp_versions(food_items):
+        """Give each item a new catalog version; call before bulk_create or bulk_update, in the same transaction."""
+        first = CatalogVersion.take(len(food_items))
+        for offset, food_item in enumerate(food_items):
+            food_item.version = first + offset
+
+    @staticmethod
+    def density_expressions():
+        """The *_per_unit fields as SQL expressions, for set-based updates of items with a positive portion_size."""
+        return {density: F(nutrient) / F('portion_size') for nutrient, density, _ in NUTRIENT_FIELDS}
+
     def save(self, *args, **kwargs):
         self.clean()
-        super().save(*args, **kwargs)
+        self.refresh_densities()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], *DENSITY_FIELDS, 'version'}
+        with transaction.atomic(savepoint=False):
+            self.version = CatalogVersion.take()
+            super().save(*args, **kwargs)
+        self._saved_densities = [getattr(self, field) for field in DENSITY_FIELDS]
 
     def __str__(self):
         return f"{self.producer} {self.name} ({self.calories} kcal per {self.portion_size} {self.quantity_unit})"
 
+class CatalogVersion(models.Model):
+    """
+    The food catalog's change counter, in a single row. Every change to an
+    item takes the next version; taking one locks the row until commit, so
+    versions become visible in the order they were taken and a client
+    syncing changes after the version it last saw never skips one.
+    """
+
+    value = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def take(cls, count=1):
+        """Reserve ``count`` consecutive versions and return the first."""
+        with transaction.atomic(savepoint=False):
+            if not cls.objects.filter(pk=1).update(value=F('value') + count):
+                cls.objects.create(pk=1, value=count)
+            return cls.objects.values_list('value', flat=True).get(pk=1) - count + 1
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=1).values_list('value', flat=True).first() or 0
+
+
+class FoodItemTombstone(models.Model):
+    """A deleted food item, kept so clients syncing the catalog drop it too."""
+
+    food_item_id = models.BigIntegerField(primary_key=True)
+    version = models.PositiveBigIntegerField(db_index=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def record(cls, food_item_id):
+        cls.objects.create(food_item_id=food_item_id, version=CatalogVersion.take())
+
+
+class FoodItemSearchEntry(models.Model):
+    """
+    A row of the FTS5 table of migration 0002, which triggers keep in step
+    with tracker_fooditem. Mapped only so searches can join it; the table
+    is missing where FTS5 is not available.
+    """
+
+    food_item = models.OneToOneField(FoodItem, primary_key=True, db_column='rowid', related_name='search_entry',
+                                     on_delete=models.DO_NOTHING)
+    name = models.TextField()
+    producer = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = 'tracker_fooditem_fts'
+
+
 class UserMeal(models.Model):
     MEAL_TYPES = [
         ('breakfast', 'Breakfast'),
@@ -149,26 +232,289 @@ class UserMeal(models.Model):
 
     class Meta:
         ordering = ['-datetime']
+        indexes = [
+            models.Index(fields=['owner', 'datetime', 'id'], name='usermeal_owner_datetime_id_idx'),
+        ]
 
     def clean(self):
         if self.quantity <= 0:
             raise ValidationError(_('Quantity must be positive'))
 
     def save(self, *args, **kwargs):
-        self.portion_calories = self.calculate_portion_calories()
-        self.portion_fat = self.calculate_portion_fat()
-        self.portion_carbohydrates = self.calculate_portion_carbohydrates()
-        self.portion_proteins = self.calculate_portion_proteins()
-        super().save(*args, **kwargs)
-    
-    def calculate_portion_calories(self):
-        return (self.quantity / self.food_item.portion_size) * self.food_item.calories
+        apply_portions([self])
+        with transaction.atomic():
+            previous = None
+            if self.pk is not None:
+                previous = UserMeal.objects.filter(pk=self.pk).first()
+            super().save(*args, **kwargs)
+            if previous is not None:
+                DailyNutritionSummary.remove_meal(previous)
+            DailyNutritionSummary.add_meal(self)
+            usage_key = ('food_item_id', 'meal_type', 'datetime')
+            if previous is None or any(getattr(previous, field) != getattr(self, field) for field in usage_key):
+                if previous is not None:
+                    FoodUsage.remove_meal(previous)
+                FoodUsage.add_meal(self)
+
+    @classmethod
+    def bulk_log(cls, meals):
+        """
+        Insert meals whose food_item is already loaded in one transaction,
+        computing portions and daily summaries without per-meal queries.
+        """
+        apply_portions(meals)
+        with transaction.atomic():
+            meals = cls.objects.bulk_create(meals)
+            DailyNutritionSummary.add_meals(meals)
+            FoodUsage.add_meals(meals)
+        return meals
 
-    def calculate_portion_fat(self):
-        return (self.quantity / self.food_item.portion_size) * self.food_item.fat
+    @classmethod
+    def recompute_portions(cls, food_item_ids):
+        """
+        Rewrite the stored portions of every meal of ``food_item_ids`` from the
+        items' current densities in one UPDATE and return the affected owner ids.
+        Daily summaries are left to the caller.
+        """
+        meals = cls.objects.filter(food_item_id__in=food_item_ids)
+        owner_ids = set(meals.values_list('owner_id', flat=True).distinct())
+        meals.update(**{
+            portion: F('quantity') * Subquery(
+                FoodItem.objects.filter(pk=OuterRef('food_item_id')).values(density)[:1]
+            )
+            for _, density, portion in NUTRIENT_FIELDS
+        })
+        return owner_ids
 
-    def calculate_portion_carbohydrates(self):
-        return (self.quantity / self.food_item.portion_size) * self.food_item.carbohydrates
 
-    def calculate_portion_proteins(self):
-        return (self.quantity / self.food_item.portion_size) * self.food_item.protein
+class DailyNutritionSummary(models.Model):
+    """
+    Running totals of a user's meals per day and meal type. Days are those of
+    the server's TIME_ZONE, whatever timezone a request has activated.
+    """
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name='daily_summaries', on_delete=models.CASCADE)
+    date = models.DateField()
+    meal_type = models.CharField(max_length=20, choices=UserMeal.MEAL_TYPES)
+
+    meal_count = models.PositiveIntegerField(default=0)
+    calories = models.FloatField(default=0)
+    fat = models.FloatField(default=0)
+    carbohydrates = models.FloatField(default=0)
+    proteins = models.FloatField(default=0)
+
+    class Meta:
+        ordering = ['date', 'meal_type']
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'date', 'meal_type'], name='unique_daily_summary'),
+        ]
+
+    @staticmethod
+    def meal_date(meal):
+        return timezone.localdate(meal.datetime, timezone.get_default_timezone())
+
+    @classmethod
+    def add_meal(cls, meal):
+        cls.add_meals([meal])
+
+    @classmethod
+    def add_meals(cls, meals):
+        groups = {}
+        for meal in meals:
+            key = (meal.owner_id, cls.meal_date(meal), meal.meal_type)
+            groups.setdefault(key, []).append(meal)
+        for (owner_id, date, meal_type), group in groups.items():
+            summary, _ = cls.objects.get_or_create(owner_id=owner_id, date=date, meal_type=meal_type)
+            cls._apply(cls.objects.filter(pk=summary.pk), group, 1)
+        forget_trends({owner_id for owner_id, _, _ in groups})
+
+    @classmethod
+    def remove_meal(cls, meal):
+        summaries = cls.objects.filter(
+            owner_id=meal.owner_id, date=cls.meal_date(meal), meal_type=meal.meal_type)
+        cls._apply(summaries, [meal], -1)
+        summaries.filter(meal_count__lte=0).delete()
+        forget_trends([meal.owner_id])
+
+    @classmethod
+    @transaction.atomic
+    def rebuild(cls, user_ids):
+        """Replace the summaries of ``user_ids`` with totals aggregated from their meals."""
+        cls.objects.filter(owner_id__in=user_ids).delete()
+        rows = (
+            UserMeal.objects
+            .filter(owner_id__in=user_ids)
+            .annotate(date=TruncDate('datetime', tzinfo=timezone.get_default_timezone()))
+            .values('owner_id', 'date', 'meal_type')
+            .annotate(
+                meal_count=Count('id'),
+                calories=Sum('portion_calories'),
+                fat=Sum('portion_fat'),
+                carbohydrates=Sum('portion_carbohydrates'),
+                proteins=Sum('portion_proteins'),
+            )
+            .order_by()
+        )
+        summaries = cls.objects.bulk_create(
+            (cls(**row) for row in rows.iterator(chunk_size=2000)),
+            batch_size=1000,
+        )
+        forget_trends(user_ids)
+        return len(summaries)
+
+    @staticmethod
+    def _apply(summaries, meals, sign):
+        summaries.update(
+            meal_count=F('meal_count') + sign * len(meals),
+            calories=F('calories') + sign * sum(meal.portion_calories for meal in meals),
+            fat=F('fat') + sign * sum(meal.portion_fat for meal in meals),
+            carbohydrates=F('carbohydrates') + sign * sum(meal.portion_carbohydrates for meal in meals),
+            proteins=F('proteins') + sign * sum(meal.portion_proteins for meal in meals),
+        )
+
+
+class FoodUsage(models.Model):
+    """
+    How often and how recently a user logged a food item for a meal type,
+    kept up to date as meals are saved and deleted. ``score`` is the log of
+    the recency-weighted use count, see tracker.usage.
+    """
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name='food_usage', on_delete=models.CASCADE)
+    food_item = models.ForeignKey(FoodItem, related_name='usage', on_delete=models.CASCADE)
+    meal_type = models.CharField(max_length=20, choices=UserMeal.MEAL_TYPES)
+
+    use_count = models.PositiveIntegerField(default=0)
+    last_used = models.DateTimeField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['-score']
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'meal_type', 'food_item'], name='unique_food_usage'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', 'meal_type', '-score'], name='foodusage_ranking_idx'),
+        ]
+
+    @classmethod
+    def add_meal(cls, meal):
+        cls.add_meals([meal])
+
+    @classmethod
+    def add_meals(cls, meals):
+        """Count ``meals`` in their usage rows in three queries at most, whatever their number."""
+        groups = {}
+        for meal in meals:
+            groups.setdefault((meal.owner_id, meal.meal_type, meal.food_item_id), []).append(meal.datetime)
+        with transaction.atomic(savepoint=False):
+            existing = cls.objects.select_for_update().filter(
+                owner_id__in={owner_id for owner_id, _, _ in groups},
+                food_item_id__in={food_item_id for _, _, food_item_id in groups},
+            )
+            usages = {(usage.owner_id, usage.meal_type, usage.food_item_id): usage for usage in existing}
+            created, updated = [], []
+            for key, moments in groups.items():
+                usage = usages.get(key)
+                if usage is None:
+                    owner_id, meal_type, food_item_id = key
+                    created.append(cls(
+                        owner_id=owner_id, meal_type=meal_type, food_item_id=food_item_id,
+                        use_count=len(moments), last_used=max(moments), score=combined_weight(moments),
+                    ))
+                else:
+                    usage.use_count += len(moments)
+                    usage.last_used = max(usage.last_used, *moments)
+                    usage.score = add_weights(usage.score, combined_weight(moments))
+                    updated.append(usage)
+            cls.objects.bulk_create(created)
+            cls.objects.bulk_update(updated, ['use_count', 'last_used', 'score'])
+
+    @classmethod
+    def remove_meal(cls, meal):
+        usages = cls.objects.filter(owner_id=meal.owner_id, meal_type=meal.meal_type, food_item_id=meal.food_item_id)
+        # log(exp(score) - exp(weight)); the meal's own weight is part of the score.
+        remainder = Greatest(1 - Exp(Value(use_weight(meal.datetime)) - F('score')), Value(MIN_REMAINDER))
+        usages.update(use_count=F('use_count') - 1, score=F('score') + Ln(remainder))
+        usages.filter(use_count__lte=0).delete()
+        latest = (
+            UserMeal.objects
+            .filter(owner_id=meal.owner_id, meal_type=meal.meal_type, food_item_id=meal.food_item_id)
+            .order_by('-datetime')
+            .values('datetime')[:1]
+        )
+        usages.filter(last_used__lte=meal.datetime).update(last_used=Subquery(latest))
+
+    @classmethod
+    @transaction.atomic
+    def rebuild(cls, user_ids):
+        """Replace the usage rows of ``user_ids`` with ones computed from their meals."""
+        cls.objects.filter(owner_id__in=user_ids).delete()
+        groups = {}
+        meals = (
+            UserMeal.objects
+            .filter(owner_id__in=user_ids)
+            .values_list('owner_id', 'meal_type', 'food_item_id', 'datetime')
+            .order_by()
+        )
+        for owner_id, meal_type, food_item_id, moment in meals.iterator(chunk_size=5000):
+            groups.setdefault((owner_id, meal_type, food_item_id), []).append(moment)
+        usages = cls.objects.bulk_create(
+            (
+                cls(owner_id=owner_id, meal_type=meal_type, food_item_id=food_item_id,
+                    use_count=len(moments), last_used=max(moments), score=combined_weight(moments))
+                for (owner_id, meal_type, food_item_id), moments in groups.items()
+            ),
+            batch_size=1000,
+        )
+        return len(usages)
+
+
+class AdviceJob(models.Model):
+    """A queued ai_advice request, executed by the process_advice_jobs workers."""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name='advice_jobs', on_delete=models.CASCADE)
+    meal_type = models.CharField(max_length=20)
+    # IANA zone of the day to advise on; blank for the server's.
+    tz = models.CharField(max_length=64, blank=True)
+    dedup_key = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='advicejob_status_run_after_idx'),
+            models.Index(fields=['dedup_key', 'created_at'], name='advicejob_dedup_idx'),
+        ]
+
+
+class PendingPortionUpdate(models.Model):
+    """A food item whose meals still carry portions from its old nutrients."""
+
+    food_item = models.OneToOneField(FoodItem, primary_key=True, related_name='pending_portion_update',
+                                     on_delete=models.CASCADE)
+    requested_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['requested_at']
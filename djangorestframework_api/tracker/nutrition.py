@@ -0,0 +1,37 @@
+import numpy as np
+
+# (FoodItem nutrient, FoodItem per-unit density, UserMeal portion field)
+NUTRIENT_FIELDS = (
+    ('calories', 'calories_per_unit', 'portion_calories'),
+    ('fat', 'fat_per_unit', 'portion_fat'),
+    ('carbohydrates', 'carbohydrates_per_unit', 'portion_carbohydrates'),
+    ('protein', 'protein_per_unit', 'portion_proteins'),
+)
+DENSITY_FIELDS = [density for _, density, _ in NUTRIENT_FIELDS]
+PORTION_FIELDS = [portion for _, _, portion in NUTRIENT_FIELDS]
+
+
+def nutrient_densities(food_item):
+    """Nutrients per one unit (g, ml or piece) of ``food_item``."""
+    if not food_item.portion_size or food_item.portion_size <= 0:
+        return [0.0] * len(NUTRIENT_FIELDS)
+    return [getattr(food_item, nutrient) / food_item.portion_size for nutrient, _, _ in NUTRIENT_FIELDS]
+
+
+def portions(quantities, densities):
+    """Portion nutrients as an (n, 4) array for n quantities and their (n, 4) densities."""
+    return np.asarray(quantities, dtype=float)[:, np.newaxis] * np.asarray(densities, dtype=float)
+
+
+def apply_portions(meals):
+    """Set the portion_* fields of meals whose food_item is loaded, in one vectorized pass."""
+    if not meals:
+        return meals
+    values = portions(
+        [meal.quantity for meal in meals],
+        [[getattr(meal.food_item, field) for field in DENSITY_FIELDS] for meal in meals],
+    )
+    for meal, row in zip(meals, values.tolist()):
+        for field, value in zip(PORTION_FIELDS, row):
+            setattr(meal, field, value)
+    return meals
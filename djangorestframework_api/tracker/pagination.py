@@ -0,0 +1,144 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pages by the position of the last row instead of OFFSET, so page 1000
+    costs the same as page 1 and no COUNT(*) is run. ``ordering`` must end
+    with a unique field. With ``ordering = None`` the queryset keeps its own
+    order (e.g. search relevance) and the cursor carries an offset instead,
+    capped at ``max_results`` when that is set.
+    """
+    ordering = None
+    max_results = None
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            return json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        # isoformat() keeps microseconds, which DjangoJSONEncoder would cut
+        # to milliseconds and make the cursor skip or repeat rows.
+        encoded = base64.urlsafe_b64encode(json.dumps(position, default=lambda value: value.isoformat()).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def parse_position(self, model, position):
+        """The cursor ``position`` with each value converted to its ordering field's type."""
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            values = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if any(value is None for value in values):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def after(self, position):
+        """Rows strictly after ``position`` in ``ordering``."""
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{name}__{lookup}': position[index]})
+            for previous, value in zip(self.ordering[:index], position):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        # The redundant bound on the leading field lets the database seek into
+        # the index instead of filtering every row before the cursor.
+        first = self.ordering[0]
+        bound = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": position[0]})
+        return bound & condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = remove_query_param(request.build_absolute_uri(), self.cursor_query_param)
+        position = self.decode_cursor(request)
+
+        if self.ordering is None:
+            offset = position if isinstance(position, int) and position > 0 else 0
+            stop = offset + self.page_size + 1
+            if self.max_results is not None:
+                offset, stop = min(offset, self.max_results), min(stop, self.max_results)
+            rows = list(queryset[offset:stop])
+            self.next_position = offset + self.page_size
+        else:
+            queryset = queryset.order_by(*self.ordering)
+            if position is not None:
+                queryset = queryset.filter(self.after(self.parse_position(queryset.model, position)))
+            rows = list(queryset[:self.page_size + 1])
+            if rows:
+                last = rows[min(len(rows), self.page_size) - 1]
+                self.next_position = [getattr(last, field.lstrip('-')) for field in self.ordering]
+
+        self.has_next = len(rows) > self.page_size
+        return rows[:self.page_size]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class UserMealPagination(KeysetPagination):
+    ordering = ('-datetime', '-id')
+
+
+class FoodItemPagination(KeysetPagination):
+    ordering = ('name', 'id')
+
+
+class RankedPagination(KeysetPagination):
+    ordering = None
+
+    @property
+    def max_results(self):
+        # Every backend stops ranking here, so no cursor can OFFSET past it.
+        return settings.FOOD_SEARCH['MAX_RESULTS']
@@ -0,0 +1,117 @@
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyNutritionSummary, FoodItem, PendingPortionUpdate, UserMeal
+from .nutrition import NUTRIENT_FIELDS
+from .trends import forget_trends
+
+logger = logging.getLogger(__name__)
+
+
+def summary_field(portion):
+    return portion.removeprefix('portion_')
+
+
+def apply_summary_deltas(fields, rows):
+    """Add each row's values to ``fields`` of the summary whose id ends the row."""
+    quote = connection.ops.quote_name
+    assignments = ', '.join(f'{quote(field)} = {quote(field)} + %s' for field in fields)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {quote(DailyNutritionSummary._meta.db_table)} SET {assignments} WHERE {quote("id")} = %s',
+            rows,
+        )
+
+
+def rewrite_chunk(food_item, first_id, last_id):
+    """
+    Move the daily summaries by each meal's new minus old portion, then
+    store the new portions, for meals first_id..last_id of ``food_item``.
+    """
+    chunk = UserMeal.objects.filter(food_item_id=food_item.pk, id__gte=first_id, id__lte=last_id).order_by()
+    densities = {portion: Value(getattr(food_item, density), FloatField()) for _, density, portion in NUTRIENT_FIELDS}
+
+    # Each meal finds its summary through the (owner, date, meal_type) unique
+    # index and the deltas are summed per summary in one query.
+    summary_id = Subquery(
+        DailyNutritionSummary.objects.filter(
+            owner_id=OuterRef('owner_id'), meal_type=OuterRef('meal_type'), date=OuterRef('date'),
+        ).order_by().values('id')[:1]
+    )
+    fields = [summary_field(portion) for portion in densities]
+    deltas = (
+        chunk.annotate(date=TruncDate('datetime', tzinfo=timezone.get_default_timezone()))
+        .annotate(summary_id=summary_id)
+        .values('owner_id', 'summary_id')
+        .annotate(**{
+            summary_field(portion): Sum(F('quantity') * density - F(portion))
+            for portion, density in densities.items()
+        })
+        .values_list('owner_id', *fields, 'summary_id')
+    )
+    deltas = list(deltas)
+    apply_summary_deltas(fields, [row[1:] for row in deltas if row[-1] is not None])
+    forget_trends({row[0] for row in deltas})
+    chunk.update(**{portion: F('quantity') * density for portion, density in densities.items()})
+
+
+def propagate_food_item_change(food_item_id, chunk_size=None):
+    """
+    Rewrite the stored portions of every meal of a food item, and the daily
+    summaries they feed, ``chunk_size`` meals per transaction. Returns the
+    number of meals rewritten.
+    """
+    chunk_size = chunk_size or settings.PORTION_UPDATES['CHUNK_SIZE']
+    food_item = FoodItem.objects.filter(pk=food_item_id).first()
+    if food_item is None:
+        return 0
+
+    meals = UserMeal.objects.filter(food_item_id=food_item_id).order_by('id')
+    rewritten = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            # Locking the chunk keeps two runs from applying the same delta twice.
+            ids = list(meals.filter(id__gt=last_id).select_for_update().values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            rewrite_chunk(food_item, ids[0], ids[-1])
+        rewritten += len(ids)
+        last_id = ids[-1]
+    return rewritten
+
+
+def schedule_portion_update(food_item_ids):
+    """Propagate nutrient changes of ``food_item_ids`` once the current transaction commits."""
+    food_item_ids = list(food_item_ids)
+    if not food_item_ids:
+        return
+    if settings.PORTION_UPDATES['DEFER']:
+        PendingPortionUpdate.objects.bulk_create(
+            [PendingPortionUpdate(food_item_id=food_item_id) for food_item_id in food_item_ids],
+            update_conflicts=True, unique_fields=['food_item'], update_fields=['requested_at'],
+        )
+        return
+
+    def propagate():
+        for food_item_id in food_item_ids:
+            propagate_food_item_change(food_item_id)
+
+    transaction.on_commit(propagate)
+
+
+def process_pending_updates():
+    """Propagate queued food items until the queue is empty; returns how many were processed."""
+    processed = 0
+    while (pending := PendingPortionUpdate.objects.first()) is not None:
+        rewritten = propagate_food_item_change(pending.food_item_id)
+        logger.info('Rewrote %s meals of food item %s', rewritten, pending.food_item_id)
+        # An edit made while this ran bumped requested_at and keeps the item queued.
+        PendingPortionUpdate.objects.filter(pk=pending.pk, requested_at=pending.requested_at).delete()
+        processed += 1
+    return processed
@@ -0,0 +1,177 @@
+"""
+Prompts for the AI endpoints, filled from templates assembled once at import.
+
+Advice prompts describe the day's intake from one query that groups the
+meals per meal type and food, however often each food was logged. Foods are
+listed by calories until the prompt would exceed
+AI_PROMPTS['ADVICE_MAX_CHARS']; the rest of each meal type is folded into one
+line of totals, so heavy loggers get prompts of bounded size.
+"""
+from django.conf import settings
+from django.db.models import Count, Min, Sum
+from django.utils import timezone
+
+from .dates import day_bounds
+from .models import UserMeal
+
+NUTRITION_PRE_PROMPT = (
+    "You are an AI used for calculations in a mobile calorie counting app. "
+    "Your task is to generate only a JSON response based on the input description. "
+    "I will provide you with a description of a dish. Extract the ingredients and their amounts from the description. "
+    "First, calculate the total nutritional values (calories, protein, fat, carbohydrates, weight) for the entire dish by summing the values of each ingredient. "
+    "Next, determine the total weight of the dish by summing the weight of all ingredients. "
+    "Return only the nutritional values in JSON format with the following keys: 'calories', 'protein', 'fat', 'carbohydrates', 'weight'. "
+    "Do not include any explanations, calculation steps, or text outside of the JSON. "
+    "If any value cannot be calculated, return an empty JSON object."
+)
+
+NUTRITION_TEMPLATE = NUTRITION_PRE_PROMPT + "\nDish description: {description}"
+
+INTAKES_TEMPLATE = (
+    "User intakes:\n"
+    "Calorie intake: {calorie_intake}\n"
+    "Carbohydrates intake: {carbohydrate_intake}\n"
+    "Protein intake: {protein_intake}\n"
+    "Fat intake: {fat_intake}\n"
+)
+
+ANSWER_INSTRUCTION = (
+    "Your answer must containt only concise summary in 5-6 sentences about how to improve this meal and overall diet balance."
+)
+
+MEAL_ADVICE_TEMPLATE = (
+    "You are an AI nutritionist. Based on the following user intakes, the meals consumed at the current meal, and the current time of day, "
+    "provide a brief summary and advice on how to balance nutrition and optimize the user's diet for the current meal:\n"
+    "Current meal: {meal_type}. "
+    "Current time of day: {time}\n"
+    + INTAKES_TEMPLATE
+    + "\nFood consumed during the meal:\n{foods}\n"
+    + ANSWER_INSTRUCTION
+)
+
+DAILY_ADVICE_TEMPLATE = (
+    "You are an AI nutritionist. Based on the following user intakes, and the current time of day, "
+    "provide a brief summary and advice on how to balance nutrition and optimize the user's diet for the current day:\n"
+    "Current time of day: {time}\n"
+    + INTAKES_TEMPLATE
+    + "\nFood consumed during the day:\n{foods}\n"
+    + ANSWER_INSTRUCTION
+)
+
+NUTRIENTS_TEMPLATE = '{calories:.0f} kcal, {fat:.1f}g fat, {proteins:.1f}g protein, {carbohydrates:.1f}g carbs'
+
+FOOD_TEMPLATE = '- {name}: {amount:g} {unit}, logged {entries}x from {time} (' + NUTRIENTS_TEMPLATE + ')'
+
+MEAL_TYPE_TEMPLATE = '{label} (' + NUTRIENTS_TEMPLATE + '):'
+
+REST_TEMPLATE = '- {count} more foods (' + NUTRIENTS_TEMPLATE + ')'
+
+NOTHING_LOGGED = 'Nothing logged yet.'
+
+NUTRIENTS = ('calories', 'fat', 'proteins', 'carbohydrates')
+
+MEAL_TYPE_LABELS = dict(UserMeal.MEAL_TYPES)
+
+MEAL_TYPE_ORDER = {meal_type: order for order, meal_type in enumerate(MEAL_TYPE_LABELS)}
+
+# Room kept for each meal type's summary line once foods have to be left out.
+REST_RESERVE = len(REST_TEMPLATE.format(count=99999, **dict.fromkeys(NUTRIENTS, 999999.9))) + 1
+
+
+def nutrition_prompt(description):
+    return NUTRITION_TEMPLATE.format(description=description)
+
+
+def advice_intake(user, meal_type, now):
+    """
+    What ``user`` logged on the local day of ``now``, which must be aware, as
+    one row per meal type and food with its totals, most calories first.
+    """
+    today_start, today_end = day_bounds(now.date(), tz=now.tzinfo)
+    meals = UserMeal.objects.filter(owner=user, datetime__gte=today_start, datetime__lt=today_end)
+    if meal_type != 'daily':
+        meals = meals.filter(meal_type=meal_type)
+    return (
+        meals
+        .values('meal_type', 'food_item_id', 'food_item__name', 'food_item__quantity_unit')
+        .annotate(
+            entries=Count('id'),
+            amount=Sum('quantity'),
+            first_logged=Min('datetime'),
+            calories=Sum('portion_calories'),
+            fat=Sum('portion_fat'),
+            proteins=Sum('portion_proteins'),
+            carbohydrates=Sum('portion_carbohydrates'),
+        )
+        .order_by('-calories', 'food_item_id')
+    )
+
+
+def totals(rows):
+    return {nutrient: sum(row[nutrient] for row in rows) for nutrient in NUTRIENTS}
+
+
+def food_line(row, tz):
+    return FOOD_TEMPLATE.format(
+        name=row['food_item__name'],
+        amount=row['amount'],
+        unit=row['food_item__quantity_unit'],
+        entries=row['entries'],
+        time=timezone.localtime(row['first_logged'], tz).strftime('%H:%M'),
+        **{nutrient: row[nutrient] for nutrient in NUTRIENTS},
+    )
+
+
+def describe_foods(rows, budget, tz, headers):
+    """
+    The food lines of ``rows``, grouped under a totals line per meal type if
+    ``headers``, in at most about ``budget`` characters.
+    """
+    if not rows:
+        return NOTHING_LOGGED
+    groups = {}
+    for index, row in enumerate(rows):
+        groups.setdefault(row['meal_type'], []).append(index)
+    groups = dict(sorted(groups.items(), key=lambda item: MEAL_TYPE_ORDER[item[0]]))
+    heads = [
+        MEAL_TYPE_TEMPLATE.format(
+            label=MEAL_TYPE_LABELS[meal_type], **totals([rows[index] for index in group]),
+        )
+        for meal_type, group in groups.items()
+    ] if headers else []
+
+    lines = [food_line(row, tz) for row in rows]
+    remaining = budget - sum(len(head) + 1 for head in heads)
+    if sum(len(line) + 1 for line in lines) > remaining:
+        remaining -= REST_RESERVE * len(groups)
+    # Rows come most calories first, so the foods that matter most are kept.
+    kept = 0
+    while kept < len(lines) and len(lines[kept]) + 1 <= remaining:
+        remaining -= len(lines[kept]) + 1
+        kept += 1
+
+    output = []
+    for meal_type, head in zip(groups, heads or [None] * len(groups)):
+        if head is not None:
+            output.append(head)
+        output.extend(lines[index] for index in groups[meal_type] if index < kept)
+        rest = [rows[index] for index in groups[meal_type] if index >= kept]
+        if rest:
+            output.append(REST_TEMPLATE.format(count=len(rest), **totals(rest)))
+    return '\n'.join(output)
+
+
+def advice_prompt(user, meal_type, rows, now):
+    """The advice prompt for ``meal_type`` ('daily' for the whole day) from advice_intake() ``rows``."""
+    daily = meal_type == 'daily'
+    template = DAILY_ADVICE_TEMPLATE if daily else MEAL_ADVICE_TEMPLATE
+    fields = dict(
+        meal_type=meal_type,
+        time=now.strftime('%H:%M'),
+        calorie_intake=user.calorie_intake,
+        carbohydrate_intake=user.carbohydrate_intake,
+        protein_intake=user.protein_intake,
+        fat_intake=user.fat_intake,
+    )
+    budget = settings.AI_PROMPTS['ADVICE_MAX_CHARS'] - len(template.format(foods='', **fields))
+    return template.format(foods=describe_foods(rows, budget, now.tzinfo, headers=daily), **fields)
@@ -0,0 +1,191 @@
+"""
+Token bucket rate limits for the AI endpoints. A request takes one token
+from the caller's bucket for the endpoint, from the endpoint's bucket shared
+by all users and from the global bucket shared by every AI endpoint. If any
+of them is empty it is refused and takes nothing. A bucket holds up to
+``capacity`` tokens and refills at ``capacity`` per ``period`` seconds, so a
+client can burst up to capacity and then keeps to the average rate.
+
+A bucket that would have refilled is indistinguishable from one never used,
+so storages only keep buckets touched within their period. LocalStorage
+keeps them in this process; CacheStorage keeps them in a Django cache shared
+by the workers, but reads and writes them without a lock, so workers racing
+on the same bucket can let a few extra requests through.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+class Bucket:
+    __slots__ = ('key', 'capacity', 'period')
+
+    def __init__(self, key, capacity, period):
+        self.key = key
+        self.capacity = capacity
+        self.period = period
+
+    @property
+    def rate(self):
+        return self.capacity / self.period
+
+    def level(self, state, now):
+        """Tokens in the bucket at ``now``, given its stored (tokens, at) or None."""
+        if state is None:
+            return self.capacity
+        tokens, at = state
+        return min(self.capacity, tokens + (now - at) * self.rate)
+
+
+def take(buckets, states, now):
+    """
+    (new states, 0.0) after taking a token from every bucket, or (None,
+    seconds until each of them has a token again) if any is empty.
+    """
+    levels = [bucket.level(state, now) for bucket, state in zip(buckets, states)]
+    wait = max((1 - level) / bucket.rate for bucket, level in zip(buckets, levels))
+    if wait > 0:
+        return None, wait
+    return [(level - 1, now) for level in levels], 0.0
+
+
+class LocalStorage:
+    """Buckets in this process. Past RATE_LIMITS['MAX_BUCKETS'] the least recently used are dropped."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = OrderedDict()
+
+    def take(self, buckets, now):
+        with self._lock:
+            new, wait = take(buckets, [self._states.get(bucket.key) for bucket in buckets], now)
+            if new is not None:
+                for bucket, state in zip(buckets, new):
+                    self._states[bucket.key] = state
+                    self._states.move_to_end(bucket.key)
+                while len(self._states) > settings.RATE_LIMITS['MAX_BUCKETS']:
+                    # Forgetting a bucket refills it early, which only errs towards allowing.
+                    self._states.popitem(last=False)
+            return wait
+
+    async def atake(self, buckets, now):
+        return self.take(buckets, now)
+
+    def level(self, bucket, now):
+        with self._lock:
+            return bucket.level(self._states.get(bucket.key), now)
+
+
+class CacheStorage:
+    """Buckets in the RATE_LIMITS['CACHE'] cache, one key each, expiring once they would be full."""
+
+    prefix = 'ratelimit'
+
+    @property
+    def cache(self):
+        return caches[settings.RATE_LIMITS['CACHE']]
+
+    def make_key(self, bucket):
+        return f'{self.prefix}:{bucket.key}'
+
+    def take(self, buckets, now):
+        cache = self.cache
+        keys = [self.make_key(bucket) for bucket in buckets]
+        found = cache.get_many(keys)
+        new, wait = take(buckets, [found.get(key) for key in keys], now)
+        if new is not None:
+            timeout = math.ceil(max(bucket.period for bucket in buckets))
+            cache.set_many(dict(zip(keys, new)), timeout)
+        return wait
+
+    async def atake(self, buckets, now):
+        cache = self.cache
+        keys = [self.make_key(bucket) for bucket in buckets]
+        found = await cache.aget_many(keys)
+        new, wait = take(buckets, [found.get(key) for key in keys], now)
+        if new is not None:
+            timeout = math.ceil(max(bucket.period for bucket in buckets))
+            await cache.aset_many(dict(zip(keys, new)), timeout)
+        return wait
+
+    def level(self, bucket, now):
+        return bucket.level(self.cache.get(self.make_key(bucket)), now)
+
+
+class RateLimiter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._storage = None
+        self._decisions = {}
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            with self._lock:
+                if self._storage is None:
+                    self._storage = import_string(settings.RATE_LIMITS['STORAGE'])()
+        return self._storage
+
+    def buckets(self, endpoint, user):
+        config = settings.RATE_LIMITS
+        limits = config['ENDPOINTS'].get(endpoint, {})
+        buckets = []
+        if limits.get('user'):
+            buckets.append(Bucket(f'{endpoint}:user:{user.pk}', *limits['user']))
+        if limits.get('endpoint'):
+            buckets.append(Bucket(endpoint, *limits['endpoint']))
+        if config['GLOBAL']:
+            buckets.append(Bucket('global', *config['GLOBAL']))
+        return buckets
+
+    def shared_buckets(self):
+        """The buckets not tied to a user, whose levels are worth exporting."""
+        config = settings.RATE_LIMITS
+        buckets = [
+            Bucket(endpoint, *limits['endpoint'])
+            for endpoint, limits in config['ENDPOINTS'].items() if limits.get('endpoint')
+        ]
+        if config['GLOBAL']:
+            buckets.append(Bucket('global', *config['GLOBAL']))
+        return buckets
+
+    def _record(self, endpoint, wait):
+        key = (endpoint, 'limited' if wait else 'allowed')
+        with self._lock:
+            self._decisions[key] = self._decisions.get(key, 0) + 1
+        return wait
+
+    def check(self, endpoint, user):
+        """Take a token for ``user`` calling ``endpoint``; 0.0 if allowed, else seconds to wait."""
+        buckets = self.buckets(endpoint, user) if settings.RATE_LIMITS['ENABLED'] else []
+        if not buckets:
+            return 0.0
+        return self._record(endpoint, self.storage.take(buckets, time.time()))
+
+    async def acheck(self, endpoint, user):
+        buckets = self.buckets(endpoint, user) if settings.RATE_LIMITS['ENABLED'] else []
+        if not buckets:
+            return 0.0
+        return self._record(endpoint, await self.storage.atake(buckets, time.time()))
+
+    def decisions(self):
+        with self._lock:
+            return dict(self._decisions)
+
+    def levels(self):
+        now = time.time()
+        return {bucket.key: self.storage.level(bucket, now) for bucket in self.shared_buckets()}
+
+    def reset(self):
+        """Forget the decision counts and reload the storage from settings, for tests."""
+        with self._lock:
+            self._storage = None
+            self._decisions.clear()
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,255 @@
+import re
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, Case, F, FloatField, Func, IntegerField, Value, When
+from django.utils.module_loading import import_string
+from rest_framework import filters
+
+from .models import FoodItem
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+FTS_TABLE = 'tracker_fooditem_fts'
+
+NAME_WEIGHT = 10.0
+PRODUCER_WEIGHT = 1.0
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').casefold())
+
+
+class FTSFunc(Func):
+    """
+    A call on the FTS table that ``column``, one of its columns, is joined
+    as. MATCH and the auxiliary functions take the table, not a column.
+    """
+
+    def __init__(self, column, *arguments):
+        super().__init__(column, *[Value(argument) for argument in arguments])
+
+    def as_sql(self, compiler, connection, **extra_context):
+        column, *arguments = self.get_source_expressions()
+        compiled = [compiler.compile(argument) for argument in arguments]
+        sql = self.template % {
+            'table': compiler.quote_name_unless_alias(column.alias),
+            'arguments': ', '.join(argument_sql for argument_sql, _ in compiled),
+        }
+        return sql, [param for _, params in compiled for param in params]
+
+
+class Match(FTSFunc):
+    template = '%(table)s MATCH %(arguments)s'
+    output_field = BooleanField()
+
+
+class BM25(FTSFunc):
+    template = 'bm25(%(table)s, %(arguments)s)'
+    output_field = FloatField()
+
+
+class BaseSearchBackend(ABC):
+    @abstractmethod
+    def search(self, query, limit):
+        """Return ids of matching food items, best match first."""
+
+    def filter_queryset(self, queryset, query):
+        """Restrict ``queryset`` to matches, ordered by relevance."""
+        ids = self.search(query, settings.FOOD_SEARCH['MAX_RESULTS'])
+        if not ids:
+            return queryset.none()
+        ranking = Case(
+            *[When(pk=pk, then=position) for position, pk in enumerate(ids)],
+            output_field=IntegerField(),
+        )
+        return queryset.filter(pk__in=ids).order_by(ranking)
+
+    def index(self, food_item):
+        pass
+
+    def remove(self, food_item_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    Searches the FTS5 table created in migration 0002. Triggers on
+    tracker_fooditem keep it in sync, including bulk writes.
+    """
+
+    @staticmethod
+    def is_available():
+        if connection.vendor != 'sqlite':
+            return False
+        return FTS_TABLE in connection.introspection.table_names()
+
+    @staticmethod
+    def match_expression(query):
+        return ' OR '.join('"%s"*' % term for term in tokenize(query))
+
+    def search(self, query, limit):
+        match = self.match_expression(query)
+        if not match:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, %s, %s) LIMIT %s",
+                [match, NAME_WEIGHT, PRODUCER_WEIGHT, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter_queryset(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        # Joining the FTS table lets SQLite rank and paginate in one query. The
+        # isnull filter makes the join an inner one, which MATCH needs to drive it.
+        column = F('search_entry__name')
+        return (
+            queryset
+            .filter(search_entry__isnull=False)
+            .filter(Match(column, match))
+            .annotate(search_rank=BM25(column, NAME_WEIGHT, PRODUCER_WEIGHT))
+            .order_by('search_rank')
+        )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, producer) "
+                "SELECT id, name, producer FROM tracker_fooditem"
+            )
+
+
+class InMemoryBackend(BaseSearchBackend):
+    """
+    Per-process inverted index used when FTS5 is not available. Tokens are
+    kept in a sorted vocabulary so prefix lookups are a bisect plus a scan of
+    the matching range.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._postings = defaultdict(dict)
+        self._vocabulary = []
+        self._documents = {}
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.rebuild()
+
+    def rebuild(self):
+        with self._lock:
+            self._postings = defaultdict(dict)
+            self._documents = {}
+            rows = FoodItem.objects.values_list('id', 'name', 'producer')
+            for food_item_id, name, producer in rows.iterator(chunk_size=5000):
+                self._add(food_item_id, name, producer)
+            self._vocabulary = sorted(self._postings)
+            self._loaded = True
+
+    def _add(self, food_item_id, name, producer):
+        tokens = set()
+        for token in tokenize(name):
+            self._postings[token][food_item_id] = self._postings[token].get(food_item_id, 0) + NAME_WEIGHT
+            tokens.add(token)
+        for token in tokenize(producer):
+            self._postings[token][food_item_id] = self._postings[token].get(food_item_id, 0) + PRODUCER_WEIGHT
+            tokens.add(token)
+        self._documents[food_item_id] = tokens
+
+    def _discard(self, food_item_id):
+        for token in self._documents.pop(food_item_id, ()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(food_item_id, None)
+            if not postings:
+                del self._postings[token]
+                index = bisect_left(self._vocabulary, token)
+                if index < len(self._vocabulary) and self._vocabulary[index] == token:
+                    del self._vocabulary[index]
+
+    def index(self, food_item):
+        with self._lock:
+            if not self._loaded:
+                return
+            self._discard(food_item.pk)
+            self._add(food_item.pk, food_item.name, food_item.producer)
+            for token in self._documents[food_item.pk]:
+                index = bisect_left(self._vocabulary, token)
+                if index == len(self._vocabulary) or self._vocabulary[index] != token:
+                    self._vocabulary.insert(index, token)
+
+    def remove(self, food_item_id):
+        with self._lock:
+            if self._loaded:
+                self._discard(food_item_id)
+
+    def _expand(self, prefix):
+        start = bisect_left(self._vocabulary, prefix)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            yield token
+
+    def search(self, query, limit):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            self._ensure_loaded()
+            scores = defaultdict(float)
+            for term in terms:
+                for token in self._expand(term):
+                    # Exact token hits rank above prefix-only hits.
+                    boost = 2.0 if token == term else 1.0
+                    for food_item_id, weight in self._postings[token].items():
+                        scores[food_item_id] += weight * boost
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [food_item_id for food_item_id, _ in ranked[:limit]]
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_class = import_string(settings.FOOD_SEARCH['BACKEND'])
+                if backend_class is SQLiteFTSBackend and not SQLiteFTSBackend.is_available():
+                    backend_class = InMemoryBackend
+                _backend = backend_class()
+    return _backend
+
+
+def search_food_items(queryset, query):
+    return get_search_backend().filter_queryset(queryset, query)
+
+
+class FoodSearchFilter(filters.BaseFilterBackend):
+    """
+    Ranked full-text search over name and producer. Each term also matches
+    as a prefix, so partially typed words find results.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip():
+            return queryset
+        return search_food_items(queryset, query)
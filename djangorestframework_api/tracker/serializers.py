@@ -1,6 +1,8 @@
 from rest_framework import serializers
 
-from tracker.models import FoodItem, UserMeal, UserProfile
+from tracker.dates import get_timezone
+from tracker.models import AdviceJob, FoodItem, FoodUsage, UserMeal, UserProfile
+from tracker.nutrition import DENSITY_FIELDS
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -14,10 +16,18 @@ class FoodItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = FoodItem
-        fields = '__all__'
+        exclude = DENSITY_FIELDS
         read_only_fields = ['owner']
         
 
+class FoodUsageSerializer(serializers.ModelSerializer):
+    food_item = FoodItemSerializer(read_only=True)
+
+    class Meta:
+        model = FoodUsage
+        fields = ['food_item', 'meal_type', 'use_count', 'last_used']
+
+
 class UserMealSerializer(serializers.ModelSerializer):
     owner = serializers.ReadOnlyField(source='owner.username')
     food_item = serializers.PrimaryKeyRelatedField(queryset=FoodItem.objects.all())
@@ -26,4 +36,30 @@ class UserMealSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserMeal
         fields = ['id', 'owner', 'food_item', 'food_item_detail', 'meal_type', 'quantity', 'datetime', 'portion_calories', 'portion_fat', 'portion_carbohydrates', 'portion_proteins']
-        depth = 1
\ No newline at end of file
+        depth = 1
+
+class UserMealBatchItemSerializer(serializers.Serializer):
+    food_item = serializers.IntegerField()
+    meal_type = serializers.ChoiceField(choices=UserMeal.MEAL_TYPES)
+    quantity = serializers.FloatField()
+
+    def validate_quantity(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('Quantity must be positive')
+        return value
+
+
+class AdviceJobSerializer(serializers.ModelSerializer):
+    meal_type = serializers.ChoiceField(choices=[('daily', 'Daily')] + UserMeal.MEAL_TYPES)
+
+    class Meta:
+        model = AdviceJob
+        fields = ['id', 'meal_type', 'tz', 'status', 'result', 'error', 'attempts', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'status', 'result', 'error', 'attempts', 'created_at', 'updated_at']
+
+    def validate_tz(self, value):
+        try:
+            get_timezone(value)
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
+        return value
@@ -0,0 +1,62 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .authentication import forget_users
+from .autocomplete import autocomplete_index
+from .models import DailyNutritionSummary, FoodItem, FoodItemTombstone, FoodUsage, UserMeal, UserProfile
+from .portion_updates import schedule_portion_update
+from .search import get_search_backend
+from .trends import forget_trends
+
+
+@receiver(post_save, sender=FoodItem)
+def index_food_item(sender, instance, **kwargs):
+    get_search_backend().index(instance)
+    autocomplete_index.index(instance)
+
+
+@receiver(post_save, sender=FoodItem)
+def propagate_nutrient_change(sender, instance, created, **kwargs):
+    if not created and instance.densities_changed():
+        schedule_portion_update([instance.pk])
+
+
+@receiver(post_delete, sender=FoodItem)
+def unindex_food_item(sender, instance, **kwargs):
+    get_search_backend().remove(instance.pk)
+    autocomplete_index.remove(instance.pk)
+
+
+@receiver(post_delete, sender=FoodItem)
+def record_food_item_tombstone(sender, instance, **kwargs):
+    FoodItemTombstone.record(instance.pk)
+
+
+@receiver(post_delete, sender=UserMeal)
+def remove_meal_from_summary(sender, instance, **kwargs):
+    DailyNutritionSummary.remove_meal(instance)
+
+
+@receiver(post_delete, sender=UserMeal)
+def remove_meal_from_usage(sender, instance, **kwargs):
+    FoodUsage.remove_meal(instance)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def forget_cached_user(sender, instance, **kwargs):
+    forget_users([instance.pk])
+
+
+@receiver(post_save, sender=UserProfile)
+def forget_user_trends(sender, instance, created, **kwargs):
+    # Trends compare intake with the targets stored on the profile.
+    if not created:
+        forget_trends([instance.pk])
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def forget_blacklisted_token_user(sender, instance, **kwargs):
+    if instance.token.user_id is not None:
+        forget_users([instance.token.user_id])
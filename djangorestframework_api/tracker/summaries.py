@@ -0,0 +1,158 @@
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Sum
+
+from .models import DailyNutritionSummary
+from .trends import PERIODS, cached, group_sums, period_starts, rolling_means
+
+NUTRIENTS = ('calories', 'fat', 'carbohydrates', 'proteins')
+
+MAX_SUMMARY_DAYS = 366
+
+
+def user_targets(user):
+    return {
+        'calories': user.calorie_intake,
+        'fat': user.fat_intake,
+        'carbohydrates': user.carbohydrate_intake,
+        'proteins': user.protein_intake,
+    }
+
+
+def empty_totals():
+    return {nutrient: 0.0 for nutrient in NUTRIENTS}
+
+
+def build_summary(user, date_from, date_to):
+    """Per-day totals and remaining budget for ``user`` between two dates, inclusive."""
+    targets = user_targets(user)
+    rows = (
+        DailyNutritionSummary.objects
+        .filter(owner=user, date__range=(date_from, date_to))
+        .values('date', 'meal_type', 'meal_count', *NUTRIENTS)
+    )
+
+    days = {}
+    day = date_from
+    while day <= date_to:
+        days[day] = {'date': day, 'meal_count': 0, 'totals': empty_totals(), 'meal_types': {}}
+        day += timedelta(days=1)
+
+    totals = empty_totals()
+    for row in rows:
+        day = days[row['date']]
+        day['meal_count'] += row['meal_count']
+        day['meal_types'][row['meal_type']] = {nutrient: round(row[nutrient], 2) for nutrient in NUTRIENTS}
+        for nutrient in NUTRIENTS:
+            day['totals'][nutrient] += row[nutrient]
+            totals[nutrient] += row[nutrient]
+
+    for day in days.values():
+        day['totals'] = {nutrient: round(value, 2) for nutrient, value in day['totals'].items()}
+        day['remaining'] = {
+            nutrient: round(targets[nutrient] - day['totals'][nutrient], 2) for nutrient in NUTRIENTS
+        }
+
+    return {
+        'from': date_from,
+        'to': date_to,
+        'targets': targets,
+        'totals': {nutrient: round(value, 2) for nutrient, value in totals.items()},
+        'days': list(days.values()),
+    }
+
+
+def nutrient_rows(values):
+    """Rows of a (days, nutrients) array as rounded {nutrient: value}, None for rows of NaN."""
+    return [
+        None if math.isnan(row[0]) else dict(zip(NUTRIENTS, row))
+        for row in np.round(values, 2).tolist()
+    ]
+
+
+def build_trends(user, period, date_from, date_to):
+    """
+    Per-day totals of ``user`` between two dates with the rolling average of
+    the logged days among the PERIODS[period] days up to each, deviations from
+    the user's targets and averages per week or month.
+    """
+    return cached(user.pk, (period, date_from, date_to), lambda: _build_trends(user, period, date_from, date_to))
+
+
+def _build_trends(user, period, date_from, date_to):
+    window = PERIODS[period]
+    # The first rolling averages reach back before date_from.
+    first = date_from - timedelta(days=window - 1)
+    rows = list(
+        DailyNutritionSummary.objects
+        .filter(owner=user, date__range=(first, date_to))
+        .values('date')
+        .annotate(day_meal_count=Sum('meal_count'), **{f'day_{nutrient}': Sum(nutrient) for nutrient in NUTRIENTS})
+        .order_by()
+        .values_list('date', 'day_meal_count', *(f'day_{nutrient}' for nutrient in NUTRIENTS))
+    )
+
+    days = (date_to - first).days + 1
+    meal_counts = np.zeros(days, dtype=np.int64)
+    totals = np.zeros((days, len(NUTRIENTS)))
+    if rows:
+        dates, counts, *values = zip(*rows)
+        index = np.fromiter((day.toordinal() for day in dates), np.int64, len(rows)) - first.toordinal()
+        meal_counts[index] = counts
+        totals[index] = np.column_stack(values)
+    logged = meal_counts > 0
+    averages = rolling_means(totals, logged, window)[window - 1:]
+    meal_counts, totals, logged = meal_counts[window - 1:], totals[window - 1:], logged[window - 1:]
+
+    targets = user_targets(user)
+    target = np.array([targets[nutrient] for nutrient in NUTRIENTS], dtype=float)
+    deviations = np.where(logged[:, None], totals - target, np.nan)
+    on_target = logged & (np.abs(totals[:, 0] - target[0]) <= settings.TRENDS['TOLERANCE'] * target[0])
+
+    starts = period_starts(np.arange(date_from.toordinal(), date_to.toordinal() + 1), period)
+    _, firsts, index = np.unique(starts, return_index=True, return_inverse=True)
+    groups = len(firsts)
+    logged_days = np.bincount(index, logged, groups).astype(np.int64)
+    on_target_days = np.bincount(index, on_target, groups).astype(np.int64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        period_averages = group_sums(index, groups, totals) / logged_days[:, None]
+        adherence = on_target_days / logged_days
+    lasts = np.append(firsts[1:], len(starts)) - 1
+
+    return {
+        'period': period,
+        'window': window,
+        'from': date_from,
+        'to': date_to,
+        'targets': targets,
+        'days': [
+            {
+                'date': date_from + timedelta(days=offset),
+                'meal_count': meal_count,
+                'totals': day_totals,
+                'rolling_average': average,
+                'deviation': deviation,
+            }
+            for offset, (meal_count, day_totals, average, deviation) in enumerate(zip(
+                meal_counts.tolist(), nutrient_rows(totals), nutrient_rows(averages), nutrient_rows(deviations),
+            ))
+        ],
+        'periods': [
+            {
+                'start': date_from + timedelta(days=start),
+                'end': date_from + timedelta(days=end),
+                'logged_days': days_logged,
+                'on_target_days': days_on_target,
+                'adherence': None if math.isnan(share) else round(share, 3),
+                'average': average,
+                'deviation': deviation,
+            }
+            for start, end, days_logged, days_on_target, share, average, deviation in zip(
+                firsts.tolist(), lasts.tolist(), logged_days.tolist(), on_target_days.tolist(), adherence.tolist(),
+                nutrient_rows(period_averages), nutrient_rows(period_averages - target),
+            )
+        ],
+    }
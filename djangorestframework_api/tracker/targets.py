@@ -0,0 +1,88 @@
+"""
+Daily calorie and macro targets from a user's body and goal (Mifflin-St Jeor
+BMR times an activity factor). Everything is computed on arrays, so a cohort
+of profiles costs one pass; calculate_targets() is the one-profile case.
+"""
+import numpy as np
+
+INPUT_FIELDS = ('gender', 'age', 'height', 'weight', 'activity_level', 'goal')
+TARGET_FIELDS = ('calorie_intake', 'protein_intake', 'fat_intake', 'carbohydrate_intake')
+
+BMR_OFFSETS = {'M': 5, 'F': -161}
+ACTIVITY_FACTORS = {'S': 1.2, 'L': 1.375, 'M': 1.55, 'V': 1.725, 'E': 1.9}
+GOAL_CALORIE_OFFSETS = {'L': -500, 'M': 0, 'G': 500}
+
+# Shares of calories as (protein, fat, carbohydrates), plus the adjustments
+# applied in order for the goal, high activity, age over 50 and gender.
+BASE_SHARES = (0.25, 0.30, 0.45)
+GOAL_SHARES = {'L': (0.05, -0.05, 0.0), 'M': (0.0, 0.0, 0.0), 'G': (-0.05, 0.0, 0.05)}
+ACTIVITY_SHARES = {'S': (0.0, 0.0, 0.0), 'L': (0.0, 0.0, 0.0), 'M': (0.0, 0.0, 0.0),
+                   'V': (0.05, -0.10, 0.05), 'E': (0.05, -0.10, 0.05)}
+OVER_50_SHARES = (0.05, -0.05, 0.0)
+GENDER_SHARES = {'M': (0.0, 0.0, 0.0), 'F': (0.0, 0.05, -0.05)}
+
+KCAL_PER_GRAM = (4, 9, 4)
+
+
+def lookup(table, codes):
+    """Map an array of choice codes through ``table``; unknown codes raise KeyError."""
+    keys = np.array(sorted(table))
+    values = np.array([table[key] for key in keys], dtype=float)
+    codes = np.asarray(codes)
+    index = np.searchsorted(keys, codes).clip(0, len(keys) - 1)
+    unknown = keys[index] != codes
+    if unknown.any():
+        raise KeyError(codes[unknown][0])
+    return values[index]
+
+
+def round_1(values):
+    """
+    Round to one decimal exactly like Python's round(). np.round scales by 10
+    first, so e.g. 207.35 (stored as 207.3499...) would come out as 207.4;
+    only results that land exactly on .5 after scaling can differ, and those
+    few are rounded in Python.
+    """
+    scaled = values * 10
+    rounded = np.rint(scaled) / 10
+    for index in np.flatnonzero(scaled - np.floor(scaled) == 0.5):
+        rounded.flat[index] = round(float(values.flat[index]), 1)
+    return rounded
+
+
+def calculate_targets_batch(gender, age, height, weight, activity_level, goal):
+    """
+    Targets for n profiles given as equal-length sequences; returns a dict
+    of float arrays keyed by TARGET_FIELDS.
+    """
+    age = np.asarray(age, dtype=float)
+    height = np.asarray(height, dtype=float)
+    weight = np.asarray(weight, dtype=float)
+
+    bmr = 10 * weight + 6.25 * height - 5 * age + lookup(BMR_OFFSETS, gender)
+    calories = bmr * lookup(ACTIVITY_FACTORS, activity_level) + lookup(GOAL_CALORIE_OFFSETS, goal)
+
+    shares = np.broadcast_to(np.array(BASE_SHARES), (len(age), 3))
+    shares = shares + lookup(GOAL_SHARES, goal)
+    shares = shares + lookup(ACTIVITY_SHARES, activity_level)
+    shares = shares + np.where((age > 50)[:, np.newaxis], OVER_50_SHARES, 0.0)
+    shares = shares + lookup(GENDER_SHARES, gender)
+
+    grams = round_1(calories[:, np.newaxis] * shares / KCAL_PER_GRAM)
+    return {
+        'calorie_intake': round_1(calories),
+        'protein_intake': grams[:, 0],
+        'fat_intake': grams[:, 1],
+        'carbohydrate_intake': grams[:, 2],
+    }
+
+
+def calculate_targets(gender, age, height, weight, activity_level, goal):
+    """Targets for one profile as a dict of floats keyed by TARGET_FIELDS."""
+    targets = calculate_targets_batch([gender], [age], [height], [weight], [activity_level], [goal])
+    return {field: float(values[0]) for field, values in targets.items()}
+
+
+def profile_inputs(profiles):
+    """The INPUT_FIELDS of ``profiles`` as keyword arguments for calculate_targets_batch()."""
+    return {field: [getattr(profile, field) for profile in profiles] for field in INPUT_FIELDS}
@@ -1,3 +1,1492 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+import httpx
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import ai, metrics
+from .ai_cache import ResponseCache, normalize_description
+from .ai_parsing import NutritionParser, nutrition_parser
+from .authentication import CachedJWTAuthentication, forget_users
+from .autocomplete import autocomplete_index
+from .catalog_import import CatalogImporter, Checkpoint, DirectorySource, WebSource
+from .catalog_sync import changes as catalog_changes, find_snapshot
+from .dates import day_bounds
+from .jobs import process_available_jobs
+from .models import (
+    AdviceJob, CatalogVersion, DailyNutritionSummary, FoodItem, FoodItemTombstone, FoodUsage, PendingPortionUpdate,
+    UserMeal, UserProfile,
+)
+from .nutrition import apply_portions
+from .pagination import KeysetPagination
+from .portion_updates import process_pending_updates, propagate_food_item_change
+from .prompts import advice_intake, advice_prompt
+from .ratelimit import Bucket, CacheStorage, LocalStorage, RateLimiter, rate_limiter
+from .search import InMemoryBackend, SQLiteFTSBackend
+from .targets import calculate_targets, calculate_targets_batch
+
+
+def create_user(username='user', password=None, **kwargs):
+    fields = dict(gender='M', age=30, height=180, weight=80, activity_level='M', goal='M')
+    fields.update(kwargs)
+    return UserProfile.objects.create_user(username=username, password=password, **fields)
+
+
+def create_food_item(owner, name, producer='producer', **kwargs):
+    fields = dict(calories=100, protein=10, fat=5, carbohydrates=20, portion_size=100)
+    fields.update(kwargs)
+    return FoodItem.objects.create(owner=owner, name=name, producer=producer, **fields)
+
+
+def create_meal(owner, food_item, meal_type='breakfast', quantity=150):
+    return UserMeal.objects.create(owner=owner, food_item=food_item, meal_type=meal_type, quantity=quantity)
+
+
+def fake_chat_response(content):
+    response = mock.Mock()
+    response.dict.return_value = {'choices': [{'message': {'content': content}}]}
+    return response
+
+
+class StubAIClient:
+    """Stands in for AI21Client and answers every chat request with ``content``."""
+
+    def __init__(self, content):
+        self.content = content
+        self.prompts = []
+        self.chat = self
+        self.completions = self
+
+    def create(self, model, messages, **kwargs):
+        self.prompts.append(messages[-1].content)
+        return fake_chat_response(self.content)
+
+
+class StubAsyncAIClient(StubAIClient):
+    async def create(self, model, messages, **kwargs):
+        return super().create(model, messages, **kwargs)
+
+
+def use_stub_ai(test_case, content):
+    """Route the async AI endpoints to a stub client for the rest of the test, with full rate limit buckets."""
+    rate_limiter.reset()
+    ai_client = StubAsyncAIClient(content)
+    patcher = mock.patch('tracker.ai.get_async_ai_client', return_value=(ai_client, asyncio.Semaphore(4)))
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+    return ai_client
+
+
+def authenticate_with_jwt(client, user):
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+
+class FoodSearchTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.banana = create_food_item(self.user, 'Banana bread', 'bakery')
+        self.milk = create_food_item(self.user, 'Milk', 'banana farm')
+        self.cheese = create_food_item(self.user, 'Cheese', 'dairy')
+
+    def search(self, query):
+        response = self.client.get('/fooditems/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_ranks_name_matches_above_producer_matches(self):
+        self.assertEqual(self.search('banana'), [self.banana.id, self.milk.id])
+
+    def test_matches_prefixes(self):
+        self.assertEqual(self.search('chee'), [self.cheese.id])
+
+    def test_any_term_matches(self):
+        self.assertCountEqual(self.search('milk cheese'), [self.milk.id, self.cheese.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.cheese.name = 'Gouda'
+        self.cheese.save()
+        self.assertEqual(self.search('cheese'), [])
+        self.assertEqual(self.search('gouda'), [self.cheese.id])
+        self.cheese.delete()
+        self.assertEqual(self.search('gouda'), [])
+
+    def test_uses_fts_backend_on_sqlite(self):
+        self.assertTrue(SQLiteFTSBackend.is_available())
+
+    def test_in_memory_backend(self):
+        backend = InMemoryBackend()
+        self.assertEqual(backend.search('banana', 10), [self.banana.id, self.milk.id])
+        self.milk.name = 'Oat milk'
+        backend.index(self.milk)
+        self.assertEqual(backend.search('oat', 10), [self.milk.id])
+        backend.remove(self.banana.id)
+        self.assertEqual(backend.search('bread', 10), [])
+
+
+class AutocompleteTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.banana = create_food_item(self.user, 'Banana bread', 'bakery')
+        self.milk = create_food_item(self.user, 'Milk', 'banana farm')
+        self.brulee = create_food_item(self.user, 'Crème brûlée', 'dairy', calories=330)
+        autocomplete_index.rebuild()
+
+    def autocomplete(self, query, **params):
+        response = self.client.get('/fooditems/autocomplete/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data]
+
+    def test_returns_compact_rows_without_touching_the_database(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/fooditems/autocomplete/', {'q': 'cre'},
+                                       HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.assertEqual(response.data, [
+            {'id': self.brulee.id, 'name': 'Crème brûlée', 'producer': 'dairy', 'calories': 330},
+        ])
+
+    def test_matches_word_prefixes_with_names_before_producers(self):
+        self.assertEqual(self.autocomplete('ban'), [self.banana.id, self.milk.id])
+        self.assertEqual(self.autocomplete('BRU'), [self.brulee.id])
+
+    def test_ranks_every_name_match_before_producer_only_matches(self):
+        applesauce = create_food_item(self.user, 'Applesauce', 'Mott')
+        zucchini = create_food_item(self.user, 'Zucchini', 'Apple Farms')
+        apple_pie = create_food_item(self.user, 'Apple pie')
+        autocomplete_index.rebuild()
+        self.assertEqual(self.autocomplete('app'), [apple_pie.id, applesauce.id, zucchini.id])
+        apple_crumble = create_food_item(self.user, 'Apple crumble', 'Zucchini Co')
+        self.assertEqual(self.autocomplete('app'), [apple_crumble.id, apple_pie.id, applesauce.id, zucchini.id])
+        self.assertEqual(self.autocomplete('zuc app'), [zucchini.id, apple_crumble.id])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.autocomplete('banana fa'), [self.milk.id])
+        self.assertEqual(self.autocomplete('milk bread'), [])
+
+    def test_limit(self):
+        self.assertEqual(self.autocomplete('ban', limit=1), [self.banana.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.milk.name = 'Oat milk'
+        self.milk.save()
+        self.assertEqual(self.autocomplete('oat'), [self.milk.id])
+        oat_bar = create_food_item(self.user, 'Oat bar')
+        self.assertEqual(self.autocomplete('oat'), [oat_bar.id, self.milk.id])
+        self.milk.delete()
+        self.assertEqual(self.autocomplete('oat'), [oat_bar.id])
+
+    def test_falls_back_to_search_while_the_index_loads(self):
+        with mock.patch.object(autocomplete_index, 'lookup', return_value=None):
+            self.assertEqual(self.autocomplete('banana'), [self.banana.id, self.milk.id])
+
+
+class CatalogSyncTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = self.settings(CATALOG_SYNC={**settings.CATALOG_SYNC, 'DIRECTORY': directory.name})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = create_user()
+        self.bread = create_food_item(self.user, 'Bread')
+        self.milk = create_food_item(self.user, 'Milk')
+
+    def read_snapshot(self, response):
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        return json.loads(lines[0]), [json.loads(line) for line in lines[1:]]
+
+    def test_every_change_takes_a_new_version(self):
+        version = self.milk.version
+        self.bread.calories = 250
+        self.bread.save()
+        self.assertGreater(self.bread.version, version)
+        self.bread.delete()
+        self.assertGreater(FoodItemTombstone.objects.get().version, self.bread.version)
+
+    def test_changes_lists_updates_and_deletions_since_a_version(self):
+        since = CatalogVersion.current()
+        self.bread.calories = 250
+        self.bread.save()
+        milk_id = self.milk.pk
+        self.milk.delete()
+        response = self.client.get('/fooditems/changes/', {'since': since})
+        self.assertEqual(response.data['items'], [
+            [self.bread.pk, 'Bread', 'producer', 250, 10, 5, 20, 100, 'g'],
+        ])
+        self.assertEqual(response.data['deleted'], [milk_id])
+        self.assertEqual(response.data['version'], CatalogVersion.current())
+        self.assertFalse(response.data['more'])
+
+    def test_changes_pages_in_version_order(self):
+        since = CatalogVersion.current()
+        eggs = create_food_item(self.user, 'Eggs')
+        bread_id = self.bread.pk
+        self.bread.delete()
+        rice = create_food_item(self.user, 'Rice')
+
+        with self.assertNumQueries(3):
+            first = self.client.get('/fooditems/changes/', {'since': since, 'limit': 2}).data
+        self.assertEqual([row[0] for row in first['items']], [eggs.pk])
+        self.assertEqual(first['deleted'], [bread_id])
+        self.assertTrue(first['more'])
+        second = self.client.get('/fooditems/changes/', {'since': first['version'], 'limit': 2}).data
+        self.assertEqual([row[0] for row in second['items']], [rice.pk])
+        self.assertFalse(second['more'])
+
+    def test_changes_never_skip_a_version_committed_while_reading(self):
+        since = CatalogVersion.current()
+        milk_id = self.milk.pk
+        tombstones = FoodItemTombstone.objects.filter
+        written = []
+
+        def commit_writes_then_filter(*args, **kwargs):
+            # Another writer commits item version N and then tombstone N + 1
+            # after the items were read, before the tombstones are.
+            if not written:
+                written.append(create_food_item(self.user, 'Eggs'))
+                self.milk.delete()
+            return tombstones(*args, **kwargs)
+
+        with mock.patch.object(FoodItemTombstone.objects, 'filter', side_effect=commit_writes_then_filter):
+            self.assertEqual(catalog_changes(since, 10), ([], [], since, False))
+        items, deleted, _, _ = catalog_changes(since, 10)
+        self.assertEqual([row[0] for row in items], [written[0].pk])
+        self.assertEqual(deleted, [milk_id])
+
+    def test_changes_requires_a_version(self):
+        self.assertEqual(self.client.get('/fooditems/changes/').status_code, 400)
+
+    def test_snapshot_serves_the_catalog_with_conditional_get(self):
+        response = self.client.get('/fooditems/snapshot/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        header, rows = self.read_snapshot(response)
+        self.assertEqual(header['version'], CatalogVersion.current())
+        self.assertEqual(sorted(row[1] for row in rows), ['Bread', 'Milk'])
+
+        response = self.client.get('/fooditems/snapshot/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_snapshot_is_rewritten_after_a_change_once_min_interval_passed(self):
+        etag = self.client.get('/fooditems/snapshot/')['ETag']
+        create_food_item(self.user, 'Eggs')
+        self.assertEqual(self.client.get('/fooditems/snapshot/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.settings(CATALOG_SYNC={**settings.CATALOG_SYNC, 'MIN_INTERVAL': 0}):
+            response = self.client.get('/fooditems/snapshot/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        _, rows = self.read_snapshot(response)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(len(os.listdir(settings.CATALOG_SYNC['DIRECTORY'])), 1)
+
+    def test_snapshot_removed_before_it_is_opened_is_looked_up_again(self):
+        version, path = find_snapshot()
+        removed = (version - 1, Path(settings.CATALOG_SYNC['DIRECTORY']) / f'catalog-{version - 1}.ndjson.gz')
+        with mock.patch('tracker.catalog_sync.find_snapshot', side_effect=[removed, (version, path)]):
+            response = self.client.get('/fooditems/snapshot/')
+        self.assertEqual(response['ETag'], f'"catalog-{version}"')
+        self.assertEqual(len(self.read_snapshot(response)[1]), 2)
+
+
+class FrequentFoodsTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+        self.oats = create_food_item(self.user, 'Oats')
+        self.eggs = create_food_item(self.user, 'Eggs')
+        self.steak = create_food_item(self.user, 'Steak')
+
+    def log(self, food_item, meal_type='breakfast', days_ago=0):
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() - timedelta(days=days_ago)):
+            return create_meal(self.user, food_item, meal_type=meal_type)
+
+    def frequent(self, meal_type='breakfast'):
+        response = self.client.get('/fooditems/frequent/', {'meal_type': meal_type})
+        self.assertEqual(response.status_code, 200)
+        return [(usage['food_item']['id'], usage['use_count']) for usage in response.data]
+
+    def test_ranks_by_frequency_per_meal_type(self):
+        for _ in range(3):
+            self.log(self.oats)
+        self.log(self.eggs)
+        self.log(self.steak, 'dinner')
+        self.assertEqual(self.frequent(), [(self.oats.id, 3), (self.eggs.id, 1)])
+        self.assertEqual(self.frequent('dinner'), [(self.steak.id, 1)])
+
+    def test_recent_uses_outweigh_old_ones(self):
+        for _ in range(3):
+            self.log(self.oats, days_ago=200)
+        self.log(self.eggs)
+        self.assertEqual(self.frequent(), [(self.eggs.id, 1), (self.oats.id, 3)])
+
+    def test_follows_edits_and_deletes(self):
+        recent = self.log(self.oats, days_ago=1)
+        self.log(self.oats, days_ago=5)
+        self.log(self.eggs, days_ago=2)
+        recent.delete()
+        usage = FoodUsage.objects.get(owner=self.user, food_item=self.oats)
+        self.assertEqual(usage.use_count, 1)
+        self.assertLess(usage.last_used, timezone.now() - timedelta(days=4))
+        self.assertEqual(self.frequent(), [(self.eggs.id, 1), (self.oats.id, 1)])
+
+        meal = UserMeal.objects.get(food_item=self.eggs)
+        meal.meal_type = 'lunch'
+        meal.save()
+        self.assertEqual(self.frequent(), [(self.oats.id, 1)])
+        self.assertEqual(self.frequent('lunch'), [(self.eggs.id, 1)])
+
+    def test_moving_a_meal_in_time_updates_recency(self):
+        meal = self.log(self.oats, days_ago=200)
+        self.log(self.eggs, days_ago=30)
+        meal.datetime = timezone.now()
+        meal.save()
+        usage = FoodUsage.objects.get(owner=self.user, food_item=self.oats)
+        self.assertEqual((usage.use_count, usage.last_used), (1, meal.datetime))
+        self.assertEqual(self.frequent(), [(self.oats.id, 1), (self.eggs.id, 1)])
+        fields = ('food_item_id', 'use_count', 'last_used', 'score')
+        incremental = list(FoodUsage.objects.order_by('food_item_id').values_list(*fields))
+        FoodUsage.rebuild([self.user.id])
+        rebuilt = list(FoodUsage.objects.order_by('food_item_id').values_list(*fields))
+        for before, after in zip(incremental, rebuilt):
+            self.assertEqual(before[:3], after[:3])
+            self.assertAlmostEqual(before[3], after[3], places=9)
+
+    def test_rebuild_matches_incremental_updates(self):
+        for days_ago in (40, 10, 3):
+            self.log(self.oats, days_ago=days_ago)
+        UserMeal.bulk_log([UserMeal(owner=self.user, food_item=self.eggs, meal_type='breakfast', quantity=50)] * 2)
+        self.log(self.eggs, days_ago=1).delete()
+        fields = ('food_item_id', 'meal_type', 'use_count', 'last_used', 'score')
+        incremental = list(FoodUsage.objects.order_by('food_item_id').values_list(*fields))
+        FoodUsage.rebuild([self.user.id])
+        rebuilt = list(FoodUsage.objects.order_by('food_item_id').values_list(*fields))
+        self.assertEqual([row[:4] for row in incremental], [row[:4] for row in rebuilt])
+        for before, after in zip(incremental, rebuilt):
+            self.assertAlmostEqual(before[4], after[4], places=9)
+
+    def test_one_query_and_meal_type_required(self):
+        for food_item in (self.oats, self.eggs, self.steak):
+            self.log(food_item)
+        with self.assertNumQueries(1):
+            self.frequent()
+        self.assertEqual(self.client.get('/fooditems/frequent/').status_code, 400)
+
+
+class UserMealQueryBudgetTests(APITestCase):
+    """The number of queries per endpoint must not grow with the number of meals."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+
+    def log_meals(self, count):
+        for i in range(count):
+            food_item = create_food_item(create_user(f'owner{UserProfile.objects.count()}'), f'Food {i}')
+            create_meal(self.user, food_item)
+
+    def assertBudget(self, queries, method, url, data=None):
+        for count in (2, 8):
+            self.log_meals(count)
+            with self.assertNumQueries(queries):
+                response = getattr(self.client, method)(url, data, format='json')
+            self.assertEqual(response.status_code, 200)
+
+    def test_list(self):
+        # Keyset pages skip the COUNT(*) a numbered page needs.
+        self.assertBudget(1, 'get', '/usermeals/')
+
+    def test_today(self):
+        self.assertBudget(1, 'get', '/usermeals/today/')
+
+    def test_range(self):
+        self.assertBudget(1, 'get', '/usermeals/range/', {'tz': 'Europe/Kyiv'})
+
+    def test_ai_advice(self):
+        use_stub_ai(self, 'Eat more greens.')
+        authenticate_with_jwt(self.client, self.user)
+        self.client.post('/usermeals/ai_advice/', {'meal_type': 'daily'}, format='json')
+        # Today's meals; the token's user is cached by the first request.
+        self.assertBudget(1, 'post', '/usermeals/ai_advice/', {'meal_type': 'daily'})
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+    def setUp(self):
+        caches[settings.AUTH_CACHE['CACHE']].clear()
+        self.user = create_user(password='old-password')
+        authenticate_with_jwt(self.client, self.user)
+        self.url = f'/userprofile/{self.user.pk}/'
+
+    def test_repeated_requests_need_no_user_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_profile_update_is_seen_by_the_next_request(self):
+        self.client.get(self.url)
+        self.client.patch(self.url, {'weight': 72}, format='json')
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['weight'], 72)
+
+    def test_password_change_and_deactivation_reload_the_user(self):
+        self.client.get(self.url)
+        self.user.set_password('new-password')
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_blacklisting_a_token_drops_the_cached_user(self):
+        self.client.get(self.url)
+        RefreshToken.for_user(self.user).blacklist()
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+    def test_user_loaded_before_an_invalidation_is_not_served(self):
+        authentication = CachedJWTAuthentication()
+        token = AccessToken.for_user(self.user)
+        stale = UserProfile.objects.get(pk=self.user.pk)
+
+        def load_then_change(self, validated_token):
+            # Another request updates the user while this one is loading it.
+            UserProfile.objects.filter(pk=stale.pk).update(weight=90)
+            forget_users([stale.pk])
+            return stale
+
+        with mock.patch.object(JWTAuthentication, 'get_user', load_then_change):
+            authentication.get_user(token)
+        self.assertEqual(authentication.get_user(token).weight, 90)
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, params):
+        ids = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['id'] for item in response.data['results'])
+            if response.data['next'] is None:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_meal_pages_cover_every_meal_once_newest_first(self):
+        food_item = create_food_item(self.user, 'Bread')
+        now = timezone.now()
+        meals = [create_meal(self.user, food_item) for _ in range(7)]
+        # Ties on datetime must still page in a stable (datetime, id) order.
+        UserMeal.objects.filter(pk__in=[meal.pk for meal in meals[:4]]).update(datetime=now)
+        expected = list(UserMeal.objects.order_by('-datetime', '-id').values_list('id', flat=True))
+        self.assertEqual(self.walk('/usermeals/', {'page_size': 3}), expected)
+
+    def test_food_items_page_by_name(self):
+        for name in ('Cheese', 'Apple', 'Bread', 'Apple', 'Milk'):
+            create_food_item(self.user, name)
+        expected = list(FoodItem.objects.order_by('name', 'id').values_list('id', flat=True))
+        self.assertEqual(self.walk('/fooditems/', {'page_size': 2}), expected)
+
+    def test_search_results_page_in_relevance_order(self):
+        for i in range(5):
+            create_food_item(self.user, f'Bread {i}')
+        create_food_item(self.user, 'Milk', producer='bread bakery')
+        ids = self.walk('/fooditems/', {'search': 'bread', 'page_size': 2})
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(ids[-1], FoodItem.objects.get(name='Milk').id)
+
+    def test_page_size_is_capped(self):
+        food_item = create_food_item(self.user, 'Bread')
+        UserMeal.bulk_log([
+            UserMeal(owner=self.user, food_item=food_item, meal_type='breakfast', quantity=100) for _ in range(120)
+        ])
+        response = self.client.get('/usermeals/', {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 100)
+
+    def test_rejects_malformed_cursor(self):
+        response = self.client.get('/usermeals/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_rejects_tampered_cursor(self):
+        def cursor(position):
+            return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+        for url, position in (
+            ('/usermeals/', ['abc', 'x']),
+            ('/usermeals/', [None, 1]),
+            ('/fooditems/', [{'a': 1}, 'x']),
+            ('/fooditems/', ['Bread', [1]]),
+        ):
+            with self.subTest(url=url, position=position):
+                self.assertEqual(self.client.get(url, {'cursor': cursor(position)}).status_code, 404)
+
+    def test_search_cursor_cannot_page_past_max_results(self):
+        for i in range(5):
+            create_food_item(self.user, f'Bread {i}')
+        with self.settings(FOOD_SEARCH={**settings.FOOD_SEARCH, 'MAX_RESULTS': 3}):
+            self.assertEqual(len(self.walk('/fooditems/', {'search': 'bread', 'page_size': 2})), 3)
+            cursor = base64.urlsafe_b64encode(b'1000000000').decode()
+            response = self.client.get('/fooditems/', {'search': 'bread', 'cursor': cursor})
+        self.assertEqual((response.status_code, response.data['results']), (200, []))
+
+    def test_offset_pages_need_no_max_results(self):
+        for i in range(5):
+            create_food_item(self.user, f'Bread {i}')
+        queryset = FoodItem.objects.order_by('-id')
+        request = Request(APIRequestFactory().get('/fooditems/', {'page_size': 2}))
+        paginator = KeysetPagination()
+        ids = [item.id for item in paginator.paginate_queryset(queryset, request)]
+        self.assertEqual(ids, list(queryset.values_list('id', flat=True)[:2]))
+        self.assertTrue(paginator.has_next)
+
+
+class MealDateRangeTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+        self.bread = create_food_item(self.user, 'Bread', calories=250)
+
+    def meal_at(self, value, quantity=100):
+        meal = create_meal(self.user, self.bread, quantity=quantity)
+        UserMeal.objects.filter(pk=meal.pk).update(datetime=datetime.fromisoformat(value))
+        return meal
+
+    def meal_ids(self, **params):
+        response = self.client.get('/usermeals/range/', params)
+        self.assertEqual(response.status_code, 200)
+        return [meal['id'] for meal in response.data['meals']]
+
+    def test_days_follow_the_client_timezone(self):
+        late = self.meal_at('2024-05-01T22:30:00+00:00')
+        early = self.meal_at('2024-05-01T12:00:00+00:00')
+        self.assertEqual(self.meal_ids(date='2024-05-01'), [late.id, early.id])
+        self.assertEqual(self.meal_ids(date='2024-05-01', tz='Europe/Kyiv'), [early.id])
+        self.assertEqual(self.meal_ids(date='2024-05-02', tz='Europe/Kyiv'), [late.id])
+
+    def test_midnight_belongs_to_the_next_day(self):
+        midnight = self.meal_at('2024-05-02T00:00:00+00:00')
+        self.assertEqual(self.meal_ids(date='2024-05-01'), [])
+        self.assertEqual(self.meal_ids(date='2024-05-02'), [midnight.id])
+
+    def test_reports_totals_over_a_range(self):
+        self.meal_at('2024-05-01T08:00:00+00:00', quantity=200)
+        self.meal_at('2024-05-03T08:00:00+00:00')
+        self.meal_at('2024-05-04T08:00:00+00:00')
+        response = self.client.get('/usermeals/range/', {'from': '2024-05-01', 'to': '2024-05-03'})
+        self.assertEqual(response.data['meal_count'], 2)
+        self.assertEqual(response.data['totals']['calories'], 750)
+
+    def test_rejects_unknown_timezone_and_long_ranges(self):
+        response = self.client.get('/usermeals/range/', {'tz': 'Mars/Olympus'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/usermeals/range/', {'from': '2024-01-01', 'to': '2024-03-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_uses_owner_datetime_index(self):
+        start, end = day_bounds(date(2024, 5, 1))
+        queryset = UserMeal.objects.filter(owner=self.user, datetime__gte=start, datetime__lt=end)
+        self.assertIn('usermeal_owner_datetime_id_idx', queryset.explain())
+
+
+class TrendsTests(APITestCase):
+    def setUp(self):
+        caches[settings.TRENDS['CACHE']].clear()
+        self.user = create_user()
+        UserProfile.objects.filter(pk=self.user.pk).update(
+            calorie_intake=2000, fat_intake=70, carbohydrate_intake=250, protein_intake=100)
+        self.user.refresh_from_db()
+        self.client.force_authenticate(self.user)
+
+    def log_day(self, day, calories, meal_type='breakfast', meal_count=1):
+        DailyNutritionSummary.objects.create(
+            owner=self.user, date=day, meal_type=meal_type, meal_count=meal_count,
+            calories=calories, fat=calories / 30, carbohydrates=calories / 8, proteins=calories / 20,
+        )
+
+    def test_daily_totals_rolling_averages_and_deviations(self):
+        # Outside the range, but inside the first days' rolling window.
+        self.log_day(date(2023, 12, 30), 1000)
+        self.log_day(date(2024, 1, 1), 500)
+        self.log_day(date(2024, 1, 1), 1300, meal_type='lunch')
+        self.log_day(date(2024, 1, 3), 2200)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/usermeals/trends/', {'period': 'week', 'from': '2024-01-01', 'to': '2024-01-07'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['window'], 7)
+        days = response.data['days']
+        self.assertEqual([day['date'] for day in days], [date(2024, 1, 1) + timedelta(days=n) for n in range(7)])
+        self.assertEqual(days[0]['meal_count'], 2)
+        self.assertEqual(days[0]['totals']['calories'], 1800)
+        self.assertEqual(days[0]['rolling_average']['calories'], 1400)
+        self.assertEqual(days[0]['deviation']['calories'], -200)
+        self.assertEqual(days[1]['meal_count'], 0)
+        self.assertIsNone(days[1]['deviation'])
+        self.assertEqual(days[1]['rolling_average']['calories'], 1400)
+        self.assertEqual(days[2]['rolling_average']['calories'], 1666.67)
+        self.assertEqual(days[6]['rolling_average']['calories'], 2000)
+
+        [week] = response.data['periods']
+        self.assertEqual((week['start'], week['end']), (date(2024, 1, 1), date(2024, 1, 7)))
+        self.assertEqual((week['logged_days'], week['on_target_days'], week['adherence']), (2, 2, 1.0))
+        self.assertEqual(week['average']['calories'], 2000)
+        self.assertEqual(week['deviation']['calories'], 0)
+
+    def test_month_periods_are_clipped_to_the_range(self):
+        self.log_day(date(2024, 1, 25), 2600)
+        self.log_day(date(2024, 2, 5), 1900)
+        response = self.client.get('/usermeals/trends/', {'period': 'month', 'from': '2024-01-20', 'to': '2024-02-10'})
+        self.assertEqual(response.data['window'], 30)
+        periods = response.data['periods']
+        self.assertEqual(
+            [(period['start'], period['end']) for period in periods],
+            [(date(2024, 1, 20), date(2024, 1, 31)), (date(2024, 2, 1), date(2024, 2, 10))],
+        )
+        self.assertEqual([period['adherence'] for period in periods], [0.0, 1.0])
+        self.assertEqual(response.data['days'][-1]['rolling_average']['calories'], 2250)
+
+    def test_cached_until_meals_or_targets_change(self):
+        bread = create_food_item(self.user, 'Bread', calories=250)
+        create_meal(self.user, bread, quantity=100)
+        self.assertEqual(self.client.get('/usermeals/trends/').data['days'][-1]['totals']['calories'], 250)
+        with self.assertNumQueries(0):
+            self.client.get('/usermeals/trends/')
+
+        create_meal(self.user, bread, quantity=200)
+        self.assertEqual(self.client.get('/usermeals/trends/').data['days'][-1]['totals']['calories'], 750)
+
+        self.user.weight = 60
+        self.user.save()
+        self.assertEqual(self.client.get('/usermeals/trends/').data['targets']['calories'], self.user.calorie_intake)
+
+    def test_rejects_bad_periods_and_ranges(self):
+        self.assertEqual(self.client.get('/usermeals/trends/', {'period': 'year'}).status_code, 400)
+        self.assertEqual(self.client.get('/usermeals/trends/', {'from': '2024-02-01', 'to': '2024-01-01'}).status_code, 400)
+        self.assertEqual(self.client.get('/usermeals/trends/', {'from': '2000-01-01', 'to': '2024-01-01'}).status_code, 400)
+
+
+class DailyNutritionSummaryTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+        self.bread = create_food_item(self.user, 'Bread', calories=250, fat=3, carbohydrates=50, protein=8)
+        self.egg = create_food_item(self.user, 'Egg', calories=150, fat=10, carbohydrates=1, protein=13)
+
+    def summary(self, meal_type='breakfast'):
+        return DailyNutritionSummary.objects.get(owner=self.user, date=timezone.localdate(), meal_type=meal_type)
+
+    def test_tracks_creates_edits_and_deletes(self):
+        meal = create_meal(self.user, self.bread, quantity=200)
+        create_meal(self.user, self.egg, quantity=100)
+        summary = self.summary()
+        self.assertEqual(summary.meal_count, 2)
+        self.assertAlmostEqual(summary.calories, 650)
+
+        meal.quantity = 100
+        meal.food_item = self.egg
+        meal.save()
+        self.assertAlmostEqual(self.summary().calories, 300)
+        self.assertAlmostEqual(self.summary().proteins, 26)
+
+        meal.meal_type = 'lunch'
+        meal.save()
+        self.assertAlmostEqual(self.summary().calories, 150)
+        self.assertAlmostEqual(self.summary('lunch').calories, 150)
+
+        meal.delete()
+        self.assertFalse(DailyNutritionSummary.objects.filter(meal_type='lunch').exists())
+
+    def test_summary_endpoint_reports_remaining_budget(self):
+        create_meal(self.user, self.bread, quantity=100)
+        create_meal(self.user, self.egg, meal_type='dinner', quantity=100)
+        with self.assertNumQueries(1):
+            response = self.client.get('/usermeals/summary/')
+        self.assertEqual(response.status_code, 200)
+        day = response.data['days'][0]
+        self.assertEqual(day['meal_count'], 2)
+        self.assertEqual(day['totals']['calories'], 400)
+        self.assertEqual(day['remaining']['calories'], round(self.user.calorie_intake - 400, 2))
+        self.assertEqual(set(day['meal_types']), {'breakfast', 'dinner'})
+
+    def test_summary_endpoint_validates_range(self):
+        response = self.client.get('/usermeals/summary/', {'from': '2024-05-02', 'to': '2024-05-01'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/usermeals/summary/', {'from': '2024-02-30'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_summary_days_are_server_timezone_days(self):
+        # 22:30 UTC on May 1st is 01:30 on May 2nd in Kyiv.
+        late = datetime(2024, 5, 1, 22, 30, tzinfo=ZoneInfo('UTC'))
+        meal = create_meal(self.user, self.bread, meal_type='dinner', quantity=100)
+        with timezone.override('Europe/Kyiv'):
+            meal.datetime = late
+            meal.save()
+        self.assertTrue(DailyNutritionSummary.objects.filter(date=date(2024, 5, 1), meal_type='dinner').exists())
+
+        response = self.client.get('/usermeals/summary/', {'from': '2024-05-01', 'tz': 'UTC'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['tz'], 'UTC')
+        self.assertEqual(response.data['days'][0]['totals']['calories'], 250)
+
+        for url in ('/usermeals/summary/', '/usermeals/trends/'):
+            response = self.client.get(url, {'from': '2024-05-01', 'to': '2024-05-02', 'tz': 'Europe/Kyiv'})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('/usermeals/range/', response.data['detail'])
+        response = self.client.get('/usermeals/range/', {'date': '2024-05-02', 'tz': 'Europe/Kyiv'})
+        self.assertEqual(response.data['totals']['calories'], 250)
+
+    def test_backfill_rebuilds_summaries(self):
+        create_meal(self.user, self.bread, quantity=100)
+        create_meal(self.user, self.egg, quantity=100)
+        DailyNutritionSummary.objects.all().delete()
+        call_command('backfill_daily_summaries', chunk_size=1, stdout=StringIO())
+        self.assertEqual(self.summary().meal_count, 2)
+        self.assertAlmostEqual(self.summary().calories, 400)
+
+
+def catalog_page(rows):
+    cells = ''.join(
+        f'<tr><td>{name}</td><td>{calories}</td><td>1</td><td>2</td><td>3</td></tr>' for name, calories in rows
+    )
+    return f'<html><body><table><tr><th>Name</th></tr>{cells}</table></body></html>'
+
+
+class CatalogImportTests(APITestCase):
+    def setUp(self):
+        self.owner = create_user()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = Path(self.directory.name)
+        (self.path / 'page1.html').write_text(catalog_page([('Apple', 52), ('Pear', 57)]))
+        (self.path / 'page2.html').write_text(catalog_page([('Plum', 46)]))
+        (self.path / 'page3.html').write_text(catalog_page([]))
+
+    def run_import(self, checkpoint=None):
+        importer = CatalogImporter(
+            DirectorySource(self.path), self.owner, Checkpoint(checkpoint),
+            concurrency=2, parse_workers=1, log=lambda message: None,
+        )
+        return importer.run()
+
+    def test_reimport_updates_instead_of_duplicating(self):
+        self.assertEqual(self.run_import(), (3, 0))
+        (self.path / 'page1.html').write_text(catalog_page([('Apple', 60), ('Pear', 57)]))
+        self.assertEqual(self.run_import(), (0, 3))
+        self.assertEqual(FoodItem.objects.count(), 3)
+        self.assertEqual(FoodItem.objects.get(name='Apple').calories, 60)
+
+    def test_resumes_after_checkpoint(self):
+        checkpoint = self.path / 'checkpoint.json'
+        Checkpoint(checkpoint).save(1)
+        self.assertEqual(self.run_import(checkpoint), (1, 0))
+        self.assertEqual(list(FoodItem.objects.values_list('name', flat=True)), ['Plum'])
+        self.assertFalse(checkpoint.exists())
+
+    def web_source(self, responses):
+        source = WebSource(retries=2, backoff=0)
+        source.session = mock.Mock()
+        source.session.get.side_effect = [self.response(status, content) for status, content in responses]
+        return source
+
+    @staticmethod
+    def response(status, content):
+        response = requests.Response()
+        response.status_code, response._content, response.url = status, content, 'https://catalog.test/'
+        return response
+
+    def test_server_errors_are_retried_then_stop_the_import_with_its_checkpoint(self):
+        page1 = (self.path / 'page1.html').read_bytes()
+        source = self.web_source([(200, page1), (503, b''), (503, b''), (503, b'')])
+        checkpoint = self.path / 'checkpoint.json'
+        importer = CatalogImporter(source, self.owner, Checkpoint(checkpoint), concurrency=1, parse_workers=1,
+                                   log=lambda message: None)
+        with self.assertRaises(requests.HTTPError):
+            importer.run()
+        self.assertEqual(source.session.get.call_count, 4)
+        self.assertEqual(Checkpoint(checkpoint).load(), 1)
+
+    def test_web_catalog_ends_at_a_missing_page(self):
+        source = self.web_source([(429, b''), (200, b'<table></table>'), (404, b'')])
+        self.assertEqual(source.fetch(1), b'<table></table>')
+        self.assertIsNone(source.fetch(2))
+
+
+class MealExportTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+        self.food_item = create_food_item(self.user, 'Oats', calories=380)
+
+    def add_meals(self, owner, count):
+        UserMeal.objects.bulk_create(
+            UserMeal(owner=owner, food_item=self.food_item, meal_type='breakfast', quantity=50,
+                     portion_calories=190, portion_fat=3, portion_carbohydrates=30, portion_proteins=6)
+            for _ in range(count)
+        )
+
+    def consume(self, response):
+        lines = 0
+        for chunk in response.streaming_content:
+            lines += chunk.count(b'\n')
+        return lines
+
+    def test_ndjson(self):
+        create_meal(self.user, self.food_item, quantity=50)
+        response = self.client.get('/usermeals/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        row = json.loads(b''.join(response.streaming_content).splitlines()[0])
+        self.assertEqual(row['food_item__name'], 'Oats')
+        self.assertEqual(row['portion_calories'], 190)
+
+    def test_csv_with_date_range(self):
+        create_meal(self.user, self.food_item)
+        today = timezone.localdate().isoformat()
+        response = self.client.get('/usermeals/export/', {'output': 'csv', 'from': today, 'to': today})
+        self.assertEqual(self.consume(response), 2)
+        response = self.client.get('/usermeals/export/', {'output': 'csv', 'to': '2000-01-01'})
+        self.assertEqual(self.consume(response), 1)
+
+    def test_rejects_unknown_output(self):
+        self.assertEqual(self.client.get('/usermeals/export/', {'output': 'xml'}).status_code, 400)
+
+    def test_rejects_malformed_dates_instead_of_ignoring_them(self):
+        for url in ('/usermeals/export/', '/usermeals/summary/', '/usermeals/range/', '/usermeals/trends/'):
+            for value in ('garbage', '2024-02-30'):
+                response = self.client.get(url, {'from': value})
+                self.assertEqual(response.status_code, 400, (url, value))
+                self.assertEqual(str(response.data['detail']), "'from' must be a valid YYYY-MM-DD date.")
+
+    def peak_memory(self, count):
+        owner = create_user(f'exporter{count}')
+        self.add_meals(owner, count)
+        self.client.force_authenticate(owner)
+        tracemalloc.start()
+        try:
+            response = self.client.get('/usermeals/export/')
+            self.assertEqual(self.consume(response), count)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_peak_memory_does_not_grow_with_history(self):
+        small = self.peak_memory(4000)
+        large = self.peak_memory(16000)
+        self.assertLess(large, small * 1.5)
+
+
+class NutrientDensityTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.bread = create_food_item(self.user, 'Bread', calories=250, fat=3, carbohydrates=50, protein=8, portion_size=50)
+
+    def test_densities_follow_saves(self):
+        self.assertAlmostEqual(self.bread.calories_per_unit, 5)
+        self.bread.calories = 300
+        self.bread.save(update_fields=['calories'])
+        self.bread.refresh_from_db()
+        self.assertAlmostEqual(self.bread.calories_per_unit, 6)
+        self.assertNotIn('calories_per_unit', self.client.get(f'/fooditems/{self.bread.id}/').data)
+
+    def test_apply_portions(self):
+        egg = create_food_item(self.user, 'Egg', calories=150, fat=10, carbohydrates=1, protein=13)
+        meals = apply_portions([UserMeal(food_item=self.bread, quantity=100), UserMeal(food_item=egg, quantity=50)])
+        self.assertEqual([meal.portion_calories for meal in meals], [500, 75])
+        self.assertEqual([meal.portion_proteins for meal in meals], [16, 6.5])
+
+    def test_recompute_rewrites_stale_portions_and_summaries(self):
+        meal = create_meal(self.user, self.bread, quantity=100)
+        other = create_meal(self.user, create_food_item(self.user, 'Egg'), quantity=100)
+        FoodItem.objects.filter(pk=self.bread.pk).update(calories=100)
+
+        with self.assertNumQueries(2):
+            UserMeal.recompute_portions([self.bread.pk])
+        call_command('recompute_meal_portions', food_item=[self.bread.pk], stdout=StringIO())
+
+        meal.refresh_from_db()
+        self.assertAlmostEqual(meal.portion_calories, 200)
+        self.assertAlmostEqual(UserMeal.objects.get(pk=other.pk).portion_calories, 100)
+        summary = DailyNutritionSummary.objects.get(owner=self.user, meal_type='breakfast')
+        self.assertAlmostEqual(summary.calories, 300)
+
+
+class PortionPropagationTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.other = create_user('other')
+        self.client.force_authenticate(self.user)
+        self.bread = create_food_item(self.user, 'Bread', calories=250, fat=3, carbohydrates=50, protein=8)
+        self.egg = create_food_item(self.user, 'Egg', calories=150)
+        self.meals = [
+            create_meal(owner, self.bread, meal_type, quantity)
+            for owner in (self.user, self.other)
+            for meal_type, quantity in (('breakfast', 100), ('breakfast', 50), ('lunch', 200))
+        ]
+        create_meal(self.user, self.egg)
+
+    def summaries(self):
+        return list(DailyNutritionSummary.objects.order_by('owner', 'date', 'meal_type')
+                    .values_list('owner', 'date', 'meal_type', 'meal_count', 'calories', 'fat', 'carbohydrates', 'proteins'))
+
+    def assertSummariesMatchMeals(self):
+        summaries = self.summaries()
+        DailyNutritionSummary.rebuild([self.user.pk, self.other.pk])
+        for kept, rebuilt in zip(summaries, self.summaries(), strict=True):
+            self.assertEqual(kept[:4], rebuilt[:4])
+            for value, expected in zip(kept[4:], rebuilt[4:]):
+                self.assertAlmostEqual(value, expected)
+
+    def test_patch_rewrites_meals_and_summaries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/fooditems/{self.bread.id}/', {'calories': 100}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(UserMeal.objects.filter(food_item=self.bread).values_list('portion_calories', flat=True)),
+            [50, 50, 100, 100, 200, 200],
+        )
+        self.assertSummariesMatchMeals()
+
+    def test_rewrites_in_chunks(self):
+        bread = FoodItem.objects.filter(pk=self.bread.pk)
+        bread.update(calories=500, protein=20)
+        bread.update(**FoodItem.density_expressions())
+        self.assertEqual(propagate_food_item_change(self.bread.pk, chunk_size=4), 6)
+        self.assertAlmostEqual(UserMeal.objects.get(pk=self.meals[2].pk).portion_proteins, 40)
+        self.assertSummariesMatchMeals()
+
+    def test_unrelated_edits_do_not_propagate(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.bread.name = 'Rye bread'
+            self.bread.save()
+        self.assertEqual(callbacks, [])
+
+    @override_settings(PORTION_UPDATES={**settings.PORTION_UPDATES, 'DEFER': True})
+    def test_deferred_updates_wait_for_the_worker(self):
+        self.bread.calories = 100
+        self.bread.save()
+        self.assertAlmostEqual(UserMeal.objects.get(pk=self.meals[0].pk).portion_calories, 250)
+        self.assertTrue(PendingPortionUpdate.objects.filter(food_item=self.bread).exists())
+
+        self.assertEqual(process_pending_updates(), 1)
+        self.assertAlmostEqual(UserMeal.objects.get(pk=self.meals[0].pk).portion_calories, 100)
+        self.assertFalse(PendingPortionUpdate.objects.exists())
+        self.assertSummariesMatchMeals()
+
+
+class NutritionTargetTests(APITestCase):
+    def test_targets(self):
+        self.assertEqual(
+            calculate_targets('M', 30, 180, 80, 'M', 'M'),
+            {'calorie_intake': 2759.0, 'protein_intake': 172.4, 'fat_intake': 92.0, 'carbohydrate_intake': 310.4},
+        )
+
+    def test_batch_matches_single_profiles(self):
+        profiles = [('F', 55, 165, 62.5, 'V', 'L'), ('M', 20, 190, 95, 'S', 'G'), ('F', 120, 300, 123.4, 'S', 'G')]
+        batch = calculate_targets_batch(*zip(*profiles))
+        for index, profile in enumerate(profiles):
+            for field, value in calculate_targets(*profile).items():
+                self.assertEqual(batch[field][index], value)
+
+    def test_only_recomputed_when_inputs_change(self):
+        user = create_user()
+        user = UserProfile.objects.get(pk=user.pk)
+        with mock.patch('tracker.models.calculate_targets', wraps=calculate_targets) as calculate:
+            user.last_login = timezone.now()
+            user.save(update_fields=['last_login'])
+            user.set_password('secret')
+            user.save()
+            calculate.assert_not_called()
+
+            user.weight = 70
+            user.save(update_fields=['weight'])
+            calculate.assert_called_once()
+        user.refresh_from_db()
+        self.assertEqual(user.calorie_intake, calculate_targets('M', 30, 180, 70, 'M', 'M')['calorie_intake'])
+
+    def test_recompute_command(self):
+        users = [create_user(f'user{i}', age=20 + i) for i in range(5)]
+        UserProfile.objects.filter(pk__in=[users[0].pk, users[3].pk]).update(calorie_intake=0)
+        output = StringIO()
+        call_command('recompute_targets', chunk_size=2, stdout=output)
+        self.assertIn('Updated targets of 2 of 5 users', output.getvalue())
+        self.assertEqual(UserProfile.objects.get(pk=users[3].pk).calorie_intake, users[3].calorie_intake)
+
+
+class BatchMealLoggingTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+        self.food_items = [create_food_item(create_user(f'owner{i}'), f'Food {i}', calories=100 + i) for i in range(5)]
+
+    def test_logs_all_meals_in_constant_queries(self):
+        payload = [
+            {'food_item': food_item.id, 'meal_type': 'lunch', 'quantity': 200}
+            for food_item in self.food_items
+        ]
+        # The food item lookup; in a savepoint, the meal insert, the summary
+        # lookup, the new summary row's insert in a savepoint of its own, the
+        # summary update and the usage lookup and insert: 11 queries.
+        with self.assertNumQueries(11):
+            response = self.client.post('/usermeals/batch/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([meal['portion_calories'] for meal in response.data], [200 + 2 * i for i in range(5)])
+        summary = DailyNutritionSummary.objects.get(owner=self.user, meal_type='lunch')
+        self.assertEqual(summary.meal_count, 5)
+        self.assertAlmostEqual(summary.calories, sum(200 + 2 * i for i in range(5)))
+        # Ten times the meals, for a user without summary rows yet, take the
+        # same queries; only batches past one bulk INSERT's worth add more.
+        self.client.force_authenticate(create_user('other'))
+        with self.assertNumQueries(11):
+            response = self.client.post('/usermeals/batch/', payload * 10, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_reports_errors_per_item_and_inserts_nothing(self):
+        payload = [
+            {'food_item': self.food_items[0].id, 'meal_type': 'lunch', 'quantity': 200},
+            {'food_item': 0, 'meal_type': 'lunch', 'quantity': 200},
+            {'food_item': self.food_items[1].id, 'meal_type': 'brunch', 'quantity': -1},
+        ]
+        response = self.client.post('/usermeals/batch/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.data['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('food_item', errors[1])
+        self.assertEqual(set(errors[2]), {'meal_type', 'quantity'})
+        self.assertFalse(UserMeal.objects.exists())
+
+    def test_rejects_non_list(self):
+        response = self.client.post('/usermeals/batch/', {'food_item': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class NutritionEstimateCacheTests(APITestCase):
+    ANSWER = '{"calories": 300, "protein": 20, "fat": 10, "carbohydrates": 30, "weight": 200}'
+
+    def setUp(self):
+        caches['ai_responses'].clear()
+        self.user = create_user()
+        authenticate_with_jwt(self.client, self.user)
+        self.ai_client = use_stub_ai(self, self.ANSWER)
+
+    def estimate(self, description):
+        return self.client.post('/fooditems/calculate_nutritional_value/', {'description': description}, format='json')
+
+    def test_normalizes_descriptions(self):
+        self.assertEqual(
+            normalize_description('2 Eggs and  200 grams toast, 0,5 Litres milk.'),
+            normalize_description('2 eggs and 200g toast, 0.5l milk'),
+        )
+
+    def test_equivalent_descriptions_share_one_upstream_call(self):
+        first = self.estimate('2 eggs and 100 grams toast')
+        second = self.estimate('2 Eggs and 100g toast')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.json(), {'calories': 150, 'protein': 10, 'fat': 5, 'carbohydrates': 15, 'weight': 100})
+        self.assertEqual(len(self.ai_client.prompts), 1)
+
+    def test_failed_answers_are_not_cached(self):
+        self.ai_client.content = '{}'
+        self.assertEqual(self.estimate('mystery stew').json(), {})
+        self.ai_client.content = self.ANSWER
+        self.assertEqual(self.estimate('mystery stew')['X-Cache'], 'MISS')
+        self.assertEqual(len(self.ai_client.prompts), 2)
+
+    def test_concurrent_misses_are_coalesced(self):
+        cache = ResponseCache('test')
+        calls = []
+        release = threading.Event()
+
+        def compute(text):
+            calls.append(text)
+            release.wait(5)
+            return {'calories': 1}
+
+        threads = [threading.Thread(target=cache.get_or_compute, args=('soup', compute)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while cache.stats()['misses'] == 0:
+            time.sleep(0.001)
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 1, 'coalesced': 4})
+
+
+NUTRITION_ANSWERS = Path(__file__).resolve().parent / 'testdata' / 'nutrition_answers.jsonl'
+
+
+class NutritionAnswerParsingTests(APITestCase):
+    def test_recorded_answers(self):
+        parser = NutritionParser()
+        with NUTRITION_ANSWERS.open(encoding='utf-8') as file:
+            corpus = [json.loads(line) for line in file]
+        for entry in corpus:
+            with self.subTest(answer=entry['answer']):
+                self.assertEqual(parser.parse(entry['answer']), entry['expected'])
+        results = parser.results()
+        self.assertEqual(sum(results.values()), len(corpus))
+        self.assertEqual(results['json'] + results['scanned'], sum(1 for entry in corpus if entry['expected']))
+
+    def test_counts_how_answers_were_read(self):
+        parser = NutritionParser()
+        parser.parse('{"calories": 300, "protein": 20, "fat": 10, "carbohydrates": 30, "weight": 200}')
+        parser.parse('Calories: 300 kcal, protein: 20 g, fat: 10 g, carbs: 30 g, weight: 200 g')
+        parser.parse('{"calories": 300, "protein": 20, "fat": 10, "carbohydrates": 30}')
+        parser.parse('{"calories": 300, "protein": "2 l", "fat": 10, "carbohydrates": 30, "weight": 200}')
+        parser.parse('{"calories": 300, "protein": 20, "fat": 10, "carbohydrates": 30, "weight": -1}')
+        self.assertEqual(
+            parser.results(), {'json': 1, 'scanned': 1, 'missing': 1, 'bad_unit': 1, 'out_of_range': 1},
+        )
+
+    def test_endpoint_reads_fenced_answers_and_exports_results(self):
+        nutrition_parser.reset()
+        caches['ai_responses'].clear()
+        user = create_user()
+        authenticate_with_jwt(self.client, user)
+        use_stub_ai(self, '```json\n{"calories": "300 kcal", "protein": "20 g", "fat": 10, "carbohydrates": 30, "weight": 200}\n```')
+        response = self.client.post('/fooditems/calculate_nutritional_value/', {'description': 'rice'}, format='json')
+        self.assertEqual(response.json(), {'calories': 150, 'protein': 10, 'fat': 5, 'carbohydrates': 15, 'weight': 100})
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('ai_response_parses_total{parser="nutrition",result="json"} 1', body)
+        self.assertIn('ai_response_parses_total{parser="nutrition",result="missing"} 0', body)
+
+
+class AsyncAIEndpointTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.ai_client = use_stub_ai(self, 'Add some vegetables.')
+
+    def test_requires_jwt(self):
+        response = self.client.post('/usermeals/ai_advice/', {'meal_type': 'daily'}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_invalid_token_gets_the_authentication_error(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        response = self.client.post('/usermeals/ai_advice/', {'meal_type': 'daily'}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_not_valid')
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+
+    def test_advice_prompt_lists_todays_meals(self):
+        authenticate_with_jwt(self.client, self.user)
+        create_meal(self.user, create_food_item(self.user, 'Porridge'), meal_type='breakfast')
+        response = self.client.post('/usermeals/ai_advice/', {'meal_type': 'breakfast'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), 'Add some vegetables.')
+        self.assertIn('Porridge', self.ai_client.prompts[0])
+
+    def test_rejects_timezones_that_are_not_names(self):
+        authenticate_with_jwt(self.client, self.user)
+        for tz in ('Mars/Olympus', 5, ['Europe/Kyiv']):
+            response = self.client.post('/usermeals/ai_advice/', {'meal_type': 'daily', 'tz': tz}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_upstream_timeout_returns_504(self):
+        authenticate_with_jwt(self.client, self.user)
+
+        async def slow_create(*args, **kwargs):
+            await asyncio.sleep(1)
+
+        self.ai_client.create = slow_create
+        with self.settings(AI={**settings.AI, 'TIMEOUT': 0.01}):
+            response = self.client.post('/usermeals/ai_advice/', {'meal_type': 'daily'}, format='json')
+        self.assertEqual(response.status_code, 504)
+
+
+class AsyncAIClientTests(APITestCase):
+    def test_clients_of_short_lived_loops_are_closed_and_the_limiter_is_shared(self):
+        async def call():
+            async with ai.ai_client_scope():
+                client, limiter = ai.get_async_ai_client()
+                self.assertIs(ai.get_async_ai_client()[0], client)
+            return client, limiter
+
+        http_clients = []
+
+        def new_client():
+            http_clients.append(httpx.AsyncClient())
+            return mock.Mock(), http_clients[-1]
+
+        # What the WSGI handler does for every request: a new event loop.
+        with mock.patch('tracker.ai._new_async_client', side_effect=new_client):
+            (first, limiter), (second, other_limiter) = asyncio.run(call()), asyncio.run(call())
+        self.assertIsNot(first, second)
+        self.assertEqual([client.is_closed for client in http_clients], [True, True])
+        self.assertIs(limiter, other_limiter)
+        self.assertEqual(limiter.limit, settings.AI['MAX_CONCURRENCY'])
+
+
+class AdvicePromptTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.porridge = create_food_item(self.user, 'Porridge', calories=120)
+        self.coffee = create_food_item(self.user, 'Coffee', calories=2)
+
+    def prompt(self, meal_type='daily'):
+        now = timezone.localtime()
+        with self.assertNumQueries(1):
+            rows = list(advice_intake(self.user, meal_type, now))
+        return advice_prompt(self.user, meal_type, rows, now)
+
+    def test_repeated_foods_are_summed_per_meal_type(self):
+        for _ in range(3):
+            create_meal(self.user, self.porridge, quantity=150)
+        create_meal(self.user, self.coffee, meal_type='lunch', quantity=200)
+
+        prompt = self.prompt()
+        self.assertIn('Breakfast (540 kcal', prompt)
+        self.assertIn('- Porridge: 450 g, logged 3x', prompt)
+        self.assertIn('Lunch (4 kcal', prompt)
+        self.assertLess(prompt.index('Breakfast'), prompt.index('Lunch'))
+        self.assertNotIn('Coffee', self.prompt('breakfast'))
+        self.assertIn('Nothing logged yet.', self.prompt('dinner'))
+
+    def test_prompt_size_and_build_time_at_10_100_1000_meals(self):
+        food_items = [
+            create_food_item(self.user, f'Food {i}', calories=50 + i) for i in range(250)
+        ]
+        meal_types = [meal_type for meal_type, _ in UserMeal.MEAL_TYPES]
+        sizes = {}
+        for count in (10, 100, 1000):
+            UserMeal.objects.all().delete()
+            UserMeal.bulk_log([
+                UserMeal(owner=self.user, food_item=food_items[i % len(food_items)],
+                         meal_type=meal_types[i % len(meal_types)], quantity=100)
+                for i in range(count)
+            ])
+            began = time.perf_counter()
+            prompt = self.prompt()
+            elapsed = time.perf_counter() - began
+            sizes[count] = len(prompt)
+            self.assertLessEqual(len(prompt), settings.AI_PROMPTS['ADVICE_MAX_CHARS'], count)
+            self.assertLess(elapsed, 0.5, count)
+        self.assertLess(sizes[10], sizes[100])
+        self.assertIn('more foods', prompt)
+        # The foods with the most calories are the ones listed.
+        self.assertIn('Food 249:', prompt)
+        self.assertNotIn('Food 0:', prompt)
+
+
+@override_settings(RATE_LIMITS={
+    **settings.RATE_LIMITS,
+    'ENDPOINTS': {'ai_advice': {'user': (2, 60), 'endpoint': (3, 60)}},
+    'GLOBAL': None,
+})
+class RateLimitTests(APITestCase):
+    def setUp(self):
+        use_stub_ai(self, 'Add some vegetables.')
+        self.user = create_user()
+        self.other = create_user('other')
+
+    def advise(self, user):
+        authenticate_with_jwt(self.client, user)
+        return self.client.post('/usermeals/ai_advice/', {'meal_type': 'daily'}, format='json')
+
+    def test_over_the_user_limit_answers_429_with_retry_after(self):
+        self.assertEqual(self.advise(self.user).status_code, 200)
+        self.assertEqual(self.advise(self.user).status_code, 200)
+        response = self.advise(self.user)
+        self.assertEqual(response.status_code, 429)
+        # One token of a bucket refilling 2 per minute.
+        self.assertEqual(response['Retry-After'], '30')
+
+    def test_users_share_only_the_endpoint_bucket(self):
+        self.advise(self.user)
+        self.advise(self.user)
+        # Refused requests take no token from the endpoint bucket.
+        self.assertEqual(self.advise(self.user).status_code, 429)
+        self.assertEqual(self.advise(self.other).status_code, 200)
+        self.assertEqual(self.advise(self.other).status_code, 429)
+
+    def test_buckets_refill_over_time(self):
+        storage = LocalStorage()
+        bucket = Bucket('test', 2, 60)
+        self.assertEqual(storage.take([bucket], now=0), 0.0)
+        self.assertEqual(storage.take([bucket], now=0), 0.0)
+        self.assertEqual(storage.take([bucket], now=15), 15.0)
+        self.assertEqual(storage.take([bucket], now=30), 0.0)
+
+    def test_cache_storage_shares_buckets_between_limiters_without_queries(self):
+        limits = {**settings.RATE_LIMITS, 'STORAGE': 'tracker.ratelimit.CacheStorage'}
+        with self.settings(RATE_LIMITS=limits), self.assertNumQueries(0):
+            caches['default'].clear()
+            first, second = RateLimiter(), RateLimiter()
+            self.assertIsInstance(first.storage, CacheStorage)
+            self.assertEqual(first.check('ai_advice', self.user), 0.0)
+            self.assertEqual(first.check('ai_advice', self.user), 0.0)
+            self.assertGreater(second.check('ai_advice', self.user), 0)
+
+    def test_metrics_expose_decisions_and_shared_bucket_levels(self):
+        self.advise(self.user)
+        self.advise(self.user)
+        self.advise(self.user)
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('ai_rate_limit_decisions_total{endpoint="ai_advice",outcome="allowed"} 2', body)
+        self.assertIn('ai_rate_limit_decisions_total{endpoint="ai_advice",outcome="limited"} 1', body)
+        self.assertIn('ai_rate_limit_tokens{bucket="ai_advice"} 1.0', body)
+
+
+class AdviceJobTests(APITestCase):
+    def setUp(self):
+        rate_limiter.reset()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+        self.ai_client = StubAIClient('Drink more water.')
+        patcher = mock.patch('tracker.ai.get_ai_client', return_value=self.ai_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self, meal_type='daily'):
+        return self.client.post('/advicejobs/', {'meal_type': meal_type}, format='json')
+
+    def test_job_runs_and_can_be_polled(self):
+        response = self.submit()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], AdviceJob.PENDING)
+
+        self.assertEqual(process_available_jobs(), 1)
+        job = self.client.get(f"/advicejobs/{response.data['id']}/").data
+        self.assertEqual(job['status'], AdviceJob.DONE)
+        self.assertEqual(job['result'], 'Drink more water.')
+
+    def test_identical_jobs_are_coalesced(self):
+        first = self.submit().data['id']
+        self.assertEqual(self.submit().data['id'], first)
+        self.assertNotEqual(self.submit('lunch').data['id'], first)
+        process_available_jobs()
+        self.assertEqual(len(self.ai_client.prompts), 2)
+
+    def test_job_advises_on_the_day_in_its_timezone(self):
+        response = self.client.post('/advicejobs/', {'meal_type': 'daily', 'tz': 'Europe/Kyiv'}, format='json')
+        self.assertEqual(response.data['tz'], 'Europe/Kyiv')
+        with mock.patch('tracker.jobs.advise', return_value='Eat breakfast.') as advise:
+            process_available_jobs()
+        advise.assert_called_once_with(self.user, 'daily', ZoneInfo('Europe/Kyiv'))
+        self.assertNotEqual(self.submit().data['id'], response.data['id'])
+        response = self.client.post('/advicejobs/', {'meal_type': 'daily', 'tz': 'Mars/Olympus'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_jobs_when_queue_is_full(self):
+        with self.settings(AI_JOBS={**settings.AI_JOBS, 'MAX_PENDING': 1}):
+            self.submit('lunch')
+            response = self.submit('dinner')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+    def test_submitting_is_rate_limited_like_ai_advice(self):
+        limits = {**settings.RATE_LIMITS, 'ENDPOINTS': {'ai_advice': {'user': (1, 60)}}, 'GLOBAL': None}
+        with self.settings(RATE_LIMITS=limits):
+            self.assertEqual(self.submit().status_code, 202)
+            response = self.submit()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        job_id = self.submit().data['id']
+        with mock.patch.object(self.ai_client, 'create', side_effect=RuntimeError('upstream down')):
+            process_available_jobs()
+            job = AdviceJob.objects.get(pk=job_id)
+            self.assertEqual((job.status, job.attempts), (AdviceJob.PENDING, 1))
+            self.assertGreater(job.run_after, timezone.now())
+
+            for _ in range(2):
+                AdviceJob.objects.filter(pk=job_id).update(run_after=timezone.now())
+                process_available_jobs()
+        job = AdviceJob.objects.get(pk=job_id)
+        self.assertEqual((job.status, job.attempts, job.error), (AdviceJob.FAILED, 3, 'upstream down'))
+
+    def test_jobs_are_private(self):
+        job_id = self.submit().data['id']
+        self.client.force_authenticate(create_user('other'))
+        self.assertEqual(self.client.get(f'/advicejobs/{job_id}/').status_code, 404)
+
+
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        metrics.registry.clear()
+        self.user = create_user()
+        authenticate_with_jwt(self.client, self.user)
+        create_meal(self.user, create_food_item(self.user, 'Porridge'))
+
+    def test_records_latency_queries_and_render_time_per_route(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/usermeals/').status_code, 200)
+        self.assertEqual(metrics.REQUEST_DURATION.snapshot(route='usermeal-list', method='GET', status=200)[1], 1)
+        self.assertEqual(metrics.REQUEST_QUERIES.snapshot(route='usermeal-list'), (len(queries), 1))
+        self.assertEqual(metrics.REQUEST_DB_DURATION.snapshot(route='usermeal-list')[1], 1)
+        self.assertEqual(metrics.RESPONSE_RENDER_DURATION.snapshot(route='usermeal-list')[1], 1)
+
+    def test_metrics_endpoint_serves_prometheus_text(self):
+        self.client.get('/usermeals/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn(
+            'http_request_duration_seconds_bucket{route="usermeal-list",method="GET",status="200",le="+Inf"} 1', body,
+        )
+        self.assertIn('ai_cache_lookups_total{cache="nutrition",result="hits"}', body)
+
+    def test_metrics_endpoint_is_local_only(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.7').status_code, 404)
+
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with self.settings(METRICS={**settings.METRICS, 'SLOW_REQUEST_SECONDS': 0}):
+            with self.assertLogs('tracker.slow_requests', 'WARNING') as logs:
+                self.client.get('/usermeals/')
+        self.assertIn('usermeal-list', logs.output[0])
+        self.assertIn('tracker_usermeal', logs.output[0])
+        self.assertEqual(metrics.SLOW_REQUESTS.value(route='usermeal-list'), 1)
+
+    def test_async_views_count_queries_and_time_ai_calls(self):
+        use_stub_ai(self, 'Add some vegetables.')
+        self.client.post('/usermeals/ai_advice/', {'meal_type': 'daily'}, format='json')
+        self.assertEqual(metrics.UPSTREAM_DURATION.snapshot(service='ai21', outcome='ok')[1], 1)
+        self.assertGreater(metrics.REQUEST_QUERIES.snapshot(route='usermeal-ai-advice')[0], 0)
+
+
+@skipUnless(connection.settings_dict['OPTIONS'] is settings.SQLITE_PROFILES['tuned'], 'needs the tuned SQLite profile')
+class SQLiteProfileTests(APITransactionTestCase):
+    def query(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchone()[0]
+
+    def test_connections_get_the_profile_pragmas(self):
+        self.assertEqual(self.query('PRAGMA busy_timeout'), 5000)
+        # NORMAL
+        self.assertEqual(self.query('PRAGMA synchronous'), 1)
+
+    def test_transactions_take_the_write_lock_when_they_begin(self):
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            UserProfile.objects.exists()
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
@@ -0,0 +1,93 @@
+"""
+Array math and caching for /usermeals/trends/. Days are rows of a
+(days, nutrients) array; days without meals are not logged and are left out
+of averages rather than counted as zero intake.
+
+Cached trends are keyed by the user's generation, which forget_trends()
+replaces whenever their daily totals or targets change, so one call drops
+every cached range and period of the user.
+"""
+import uuid
+
+import numpy as np
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+# Rolling window in days and the calendar periods the days are grouped by.
+PERIODS = {'week': 7, 'month': 30}
+
+# Day 1 of the proleptic Gregorian calendar, as date.toordinal() counts.
+EPOCH = np.datetime64('0001-01-01')
+
+
+def rolling_means(totals, logged, window):
+    """Mean of the logged days among each day and the ``window - 1`` before it; NaN if none was logged."""
+    days = len(totals)
+    sums = np.vstack([np.zeros((1, totals.shape[1])), np.cumsum(totals, axis=0)])
+    counts = np.concatenate([[0], np.cumsum(logged)])
+    ends = np.arange(1, days + 1)
+    starts = np.maximum(ends - window, 0)
+    window_counts = counts[ends] - counts[starts]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums[ends] - sums[starts]) / window_counts[:, None]
+
+
+def period_starts(ordinals, period):
+    """The ordinal of the Monday or the first of the month starting each day's period."""
+    if period == 'week':
+        # date.fromordinal(1) is a Monday.
+        return ordinals - (ordinals - 1) % 7
+    dates = (ordinals - 1).astype('timedelta64[D]') + EPOCH
+    return (dates.astype('datetime64[M]').astype('datetime64[D]') - EPOCH).astype(np.int64) + 1
+
+
+def group_sums(index, groups, values):
+    """Sum the rows of ``values`` (days, columns) into ``groups`` rows by each day's group ``index``."""
+    return np.column_stack([np.bincount(index, values[:, column], groups) for column in range(values.shape[1])])
+
+
+def generation_key(user_id):
+    return f'trends-generation:{user_id}'
+
+
+def cache_key(user_id, generation, *parts):
+    return ':'.join(['trends', str(user_id), generation or '0', *map(str, parts)])
+
+
+def cached(user_id, parts, build):
+    """The trends of ``user_id`` cached under ``parts``, or ``build()`` stored there."""
+    config = settings.TRENDS
+    if config['TIMEOUT'] is None:
+        return build()
+    cache = caches[config['CACHE']]
+    key = cache_key(user_id, cache.get(generation_key(user_id)), *parts)
+    trends = cache.get(key)
+    if trends is None:
+        trends = build()
+        cache.set(key, trends, config['TIMEOUT'])
+    return trends
+
+
+def forget_trends(user_ids):
+    """
+    Drop the cached trends of ``user_ids``; call after changing their daily
+    summaries or targets. They are dropped again once the current transaction
+    commits, since a request may cache the old totals until then.
+    """
+    if settings.TRENDS['TIMEOUT'] is None:
+        return
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    _forget(user_ids)
+    transaction.on_commit(lambda: _forget(user_ids))
+
+
+def _forget(user_ids):
+    config = settings.TRENDS
+    # Outlives any entry stored before it, so those entries can never be read again.
+    caches[config['CACHE']].set_many(
+        {generation_key(user_id): uuid.uuid4().hex for user_id in user_ids}, config['TIMEOUT'],
+    )
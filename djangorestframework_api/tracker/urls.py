@@ -1,15 +1,20 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from tracker import views
+from tracker import async_views, metrics, views
 
 router = DefaultRouter()
 router.register(r'fooditems', views.FoodItemViewSet, basename='fooditem')
 router.register(r'usermeals', views.UserMealViewSet, basename='usermeal')
 router.register(r'userprofile', views.UserProfileViewSet, basename='userprofile')
+router.register(r'advicejobs', views.AdviceJobViewSet, basename='advicejob')
 
 
 urlpatterns = [
+    path('fooditems/calculate_nutritional_value/', async_views.calculate_nutritional_value,
+         name='fooditem-calculate-nutritional-value'),
+    path('usermeals/ai_advice/', async_views.ai_advice, name='usermeal-ai-advice'),
+    path('metrics', metrics.metrics_view, name='metrics'),
     path('', include(router.urls)),
     path('usermeals/today/', views.UserMealViewSet.as_view({'get': 'today'}), name='usermeals-today'),
 ]
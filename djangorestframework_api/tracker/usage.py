@@ -0,0 +1,34 @@
+"""
+Recency-weighted use counts for the "recent & frequent foods" ranking. A
+use at time t counts 2 ** ((t - EPOCH) / half-life), so all scores decay at
+the same rate and a ranking never has to be rewritten as time passes; only
+the order matters. Scores are stored as natural logarithms to stay finite.
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+
+# Scores are logs of sums; removing nearly all of a sum bottoms out here.
+MIN_REMAINDER = 1e-12
+
+
+def use_weight(moment):
+    """Log of the weight of one use at ``moment``."""
+    days = (moment - EPOCH).total_seconds() / 86400
+    return math.log(2) * days / settings.FREQUENT_FOODS['HALF_LIFE_DAYS']
+
+
+def add_weights(score, weight):
+    """Log of exp(score) + exp(weight)."""
+    high, low = max(score, weight), min(score, weight)
+    return high + math.log1p(math.exp(low - high))
+
+
+def combined_weight(moments):
+    """Log of the summed weights of uses at ``moments``."""
+    weights = [use_weight(moment) for moment in moments]
+    high = max(weights)
+    return high + math.log(sum(math.exp(weight - high) for weight in weights))
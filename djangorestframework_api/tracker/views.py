@@ -1,20 +1,65 @@
 from django.shortcuts import render
-from rest_framework import viewsets, permissions, filters
+from rest_framework import mixins, viewsets, permissions, status
 from .permissions import IsOwnerOrReadOnly
-from .models import FoodItem, UserMeal, UserProfile
-from .serializers import FoodItemSerializer, UserMealSerializer, UserProfileSerializer
+from .models import AdviceJob, FoodItem, FoodUsage, UserMeal, UserProfile
+from .serializers import AdviceJobSerializer, FoodItemSerializer, FoodUsageSerializer, UserMealBatchItemSerializer, UserMealSerializer, UserProfileSerializer
+from .jobs import QueueFull, enqueue_advice
+from .ratelimit import rate_limiter
+from .search import FoodSearchFilter, search_food_items
+from .autocomplete import autocomplete_index
+from .catalog_sync import FIELDS, changes as catalog_changes, get_snapshot
+from .pagination import FoodItemPagination, RankedPagination, UserMealPagination
+from .summaries import MAX_SUMMARY_DAYS, NUTRIENTS, build_summary, build_trends, empty_totals
+from .trends import PERIODS
+from .dates import day_bounds, get_timezone, start_of_day
+from .exports import CONTENT_TYPES, STREAMERS
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified, StreamingHttpResponse
 from django.utils import timezone
-from django.utils.dateparse import parse_datetime
-from datetime import datetime, timedelta
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import timedelta
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError, Throttled
 from rest_framework.response import Response
-from ai21 import AI21Client
-from ai21.models.chat import ChatMessage
-import os
-from dotenv import load_dotenv
-import re
 import json
-from django.db.models import Q
+import math
+
+def date_param(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        date = parse_date(value)
+    except ValueError:
+        date = None
+    if date is None:
+        raise ParseError(f"'{name}' must be a valid YYYY-MM-DD date.")
+    return date
+
+def limit_param(request, config):
+    try:
+        limit = int(request.query_params.get('limit', config['LIMIT']))
+    except ValueError:
+        raise ParseError("'limit' must be an integer.")
+    return max(1, min(limit, config['MAX_LIMIT']))
+
+def timezone_param(request):
+    try:
+        return get_timezone(request.query_params.get('tz'))
+    except ValueError as error:
+        raise ParseError(f"'tz' must be an IANA timezone name. {error}")
+
+def summary_timezone_param(request):
+    """
+    The daily rollups are kept in the server's TIME_ZONE days, so a ?tz= whose
+    days differ is refused rather than answered with another day's totals.
+    """
+    tz = timezone.get_default_timezone()
+    if request.query_params.get('tz') and str(timezone_param(request)) != str(tz):
+        raise ParseError(
+            f"Summaries are kept per {tz} day; 'tz' must be {tz} or omitted. "
+            "Use /usermeals/range/?tz= for totals per local day.")
+    return tz
 
 class UserProfileViewSet(viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
@@ -24,187 +69,267 @@ class UserProfileViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return UserProfile.objects.filter(id=self.request.user.id)
 
+    def get_object(self):
+        # Reading your own profile needs no query beyond authentication.
+        if self.request.method in permissions.SAFE_METHODS and self.kwargs.get('pk') == str(self.request.user.pk):
+            self.check_object_permissions(self.request, self.request.user)
+            return self.request.user
+        return super().get_object()
+
     def perform_update(self, serializer):
         serializer.save(user=self.request.user)
     
 class FoodItemViewSet(viewsets.ModelViewSet):
-    queryset = FoodItem.objects.all()
+    queryset = FoodItem.objects.select_related('owner')
     serializer_class = FoodItemSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly,)
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ["name", "producer"]
+    filter_backends = (FoodSearchFilter,)
 
-    def get_queryset(self):
-        queryset = super().get_queryset()
-        search_query = self.request.query_params.get('search', None)
-        if search_query:
-            query = Q()
-            for term in search_query.split():
-                query |= Q(name__icontains=term) | Q(producer__icontains=term)
-            queryset = queryset.filter(query)
-        return queryset
+    @property
+    def paginator(self):
+        # Search results keep their relevance order, everything else pages by name.
+        if not hasattr(self, '_paginator'):
+            searching = self.request.query_params.get(FoodSearchFilter.search_param, '').strip()
+            self._paginator = RankedPagination() if searching else FoodItemPagination()
+        return self._paginator
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
-    @action(detail=False, methods=['post'])
-    def calculate_nutritional_value(self, request):
-        load_dotenv()
-        api_key = os.getenv("AI21_API_KEY")
-
-        client = AI21Client(api_key=api_key)
-
-        description = request.data.get('description')
-
-        pre_prompt = (
-            "You are an AI used for calculations in a mobile calorie counting app. "
-            "Your task is to generate only a JSON response based on the input description. "
-            "I will provide you with a description of a dish. Extract the ingredients and their amounts from the description. "
-            "First, calculate the total nutritional values (calories, protein, fat, carbohydrates, weight) for the entire dish by summing the values of each ingredient. "
-            "Next, determine the total weight of the dish by summing the weight of all ingredients. "
-            "Return only the nutritional values in JSON format with the following keys: 'calories', 'protein', 'fat', 'carbohydrates', 'weight'. "
-            "Do not include any explanations, calculation steps, or text outside of the JSON. "
-            "If any value cannot be calculated, return an empty JSON object."
-        )
-
-
-        prompt_input = f"Dish description: {description}"
-
-        full_prompt = f"{pre_prompt}\n{prompt_input}"
-
-        messages = [
-            ChatMessage(role="user", content=full_prompt)
-        ]
-
-        response = client.chat.completions.create(
-            model="jamba-instruct-preview",
-            messages=messages,
-            top_p=0.8,  # Налаштування для гнучкості відповідей
-            temperature=0.1  # Трохи знижено для більшої точності
-        )
-
-        full_response = response.dict()
-        assistant_content = full_response["choices"][0]["message"]["content"]
-
-        nutritional_data = {}
-        patterns = {
-            'calories': r'"calories":\s*(\d+(?:\.\d+)?)',
-            'protein': r'"protein":\s*(\d+(?:\.\d+)?)',
-            'fat': r'"fat":\s*(\d+(?:\.\d+)?)',
-            'carbohydrates': r'"carbohydrates":\s*(\d+(?:\.\d+)?)',
-            'weight': r'"weight":\s*(\d+(?:\.\d+)?)'
-        }
-
-        for key, pattern in patterns.items():
-            match = re.search(pattern, assistant_content)
-            if match:
-                nutritional_data[key] = float(match.group(1))
-
-
-        if len(nutritional_data) == 5:
-            weight = nutritional_data['weight']
-            for nutrient in nutritional_data:
-                if nutrient != 'weight':
-                    nutritional_data[nutrient] = round((nutritional_data[nutrient] / (weight / 100)), 2)
-            nutritional_data['weight'] = 100 
+    @action(detail=False, methods=['get'], authentication_classes=[], permission_classes=[permissions.AllowAny])
+    def autocomplete(self, request):
+        """
+        Typeahead matches for ?q= as id, name, producer and calories only.
+        The catalog is public, so the request skips authentication, and once
+        the index is loaded it does not touch the database at all.
+        """
+        limit = limit_param(request, settings.AUTOCOMPLETE)
+        query = request.query_params.get('q', '')
+        results = autocomplete_index.lookup(query, limit)
+        if results is None:
+            # The index is still loading; answer from the search index meanwhile.
+            results = search_food_items(FoodItem.objects.all(), query).values('id', 'name', 'producer', 'calories')[:limit]
+        return Response(results)
+
+    @action(detail=False, methods=['get'], authentication_classes=[], permission_classes=[permissions.AllowAny])
+    def snapshot(self, request):
+        """
+        The whole catalog as gzip'd NDJSON for offline use, see catalog_sync.
+        The ETag is the catalog version; continue from it with changes/.
+        """
+        version, file = get_snapshot()
+        etag = f'"catalog-{version}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            file.close()
+            response = HttpResponseNotModified()
         else:
-            nutritional_data = {}
+            response = FileResponse(file, content_type='application/x-ndjson')
+            response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        response['X-Catalog-Version'] = str(version)
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    @action(detail=False, methods=['get'], authentication_classes=[], permission_classes=[permissions.AllowAny])
+    def changes(self, request):
+        """
+        Items changed and ids deleted after catalog version ?since=, oldest
+        first, as rows of the snapshot's fields. Ask again from 'version'
+        while 'more' is true.
+        """
+        try:
+            since = int(request.query_params.get('since', ''))
+        except ValueError:
+            raise ParseError("'since' must be a catalog version.")
+        items, deleted, version, more = catalog_changes(since, limit_param(request, settings.CATALOG_SYNC))
+        return Response({'version': version, 'more': more, 'fields': FIELDS, 'items': items, 'deleted': deleted})
 
-        return Response(nutritional_data)
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def frequent(self, request):
+        """
+        The user's foods for ?meal_type=, most used first with recent uses
+        weighing more, read from the precomputed FoodUsage ranking.
+        """
+        meal_type = request.query_params.get('meal_type')
+        if meal_type not in dict(UserMeal.MEAL_TYPES):
+            raise ParseError(f"'meal_type' must be one of: {', '.join(dict(UserMeal.MEAL_TYPES))}.")
+        usages = (
+            FoodUsage.objects
+            .filter(owner=request.user, meal_type=meal_type)
+            .select_related('food_item__owner')[:limit_param(request, settings.FREQUENT_FOODS)]
+        )
+        return Response(FoodUsageSerializer(usages, many=True).data)
 
 class UserMealViewSet(viewsets.ModelViewSet):
     queryset = UserMeal.objects.all()
     serializer_class = UserMealSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,
                           IsOwnerOrReadOnly,)
+    pagination_class = UserMealPagination
+    max_batch_size = 500
+    max_range_days = 31
     
     def get_queryset(self):
-        return UserMeal.objects.filter(owner=self.request.user)
+        return UserMeal.objects.filter(owner=self.request.user).select_related('owner', 'food_item__owner')
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def batch(self, request):
+        if not isinstance(request.data, list) or not request.data:
+            return Response({'detail': 'Expected a non-empty list of meals.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > self.max_batch_size:
+            return Response({'detail': f'A batch is limited to {self.max_batch_size} meals.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = [UserMealBatchItemSerializer(data=item) for item in request.data]
+        errors = [{} if item.is_valid() else dict(item.errors) for item in items]
+
+        food_item_ids = {item.validated_data['food_item'] for item, error in zip(items, errors) if not error}
+        food_items = FoodItem.objects.select_related('owner').in_bulk(food_item_ids)
+        for item, error in zip(items, errors):
+            if not error and item.validated_data['food_item'] not in food_items:
+                error['food_item'] = [f"Invalid pk \"{item.validated_data['food_item']}\" - object does not exist."]
+
+        if any(errors):
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        meals = UserMeal.bulk_log([
+            UserMeal(
+                owner=request.user,
+                food_item=food_items[item.validated_data['food_item']],
+                meal_type=item.validated_data['meal_type'],
+                quantity=item.validated_data['quantity'],
+            )
+            for item in items
+        ])
+        serializer = self.get_serializer(meals, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def today(self, request):
-        now = timezone.now()
-        today_start = datetime.combine(now, datetime.min.time())
-        today_end = today_start + timedelta(days=1)
+        tz = timezone_param(request)
+        today_start, today_end = day_bounds(timezone.localdate(timezone=tz), tz=tz)
 
-        queryset = self.get_queryset().filter(datetime__range=(today_start, today_end))
+        queryset = self.get_queryset().filter(datetime__gte=today_start, datetime__lt=today_end)
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
-    
-    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
-    def ai_advice(self, request):
-        load_dotenv()
-        api_key = os.getenv("AI21_API_KEY")
 
-        client = AI21Client(api_key=api_key)
-
-        meal_type = request.data.get('meal_type')
-
-        now = timezone.now()
-        today_start = datetime.combine(now, datetime.min.time())
-        today_end = today_start + timedelta(days=1)
-        
-        meal_food = self.get_queryset().filter(
-            datetime__range=(today_start, today_end)
-        )
-
-        if meal_type != "daily":
-            meal_food = meal_food.filter(meal_type=meal_type)
-
-        meal_descriptions = [
-            f"{meal.food_item.name} at {meal.datetime.strftime('%H:%M')} ({meal.portion_fat}g fat, {meal.portion_proteins}g protein, {meal.portion_carbohydrates}g carbs) {meal.quantity} {meal.food_item.quantity_unit}"
-            for meal in meal_food
-        ]
-
-        food_description = "; ".join(meal_descriptions)
-
-        user_profile = UserProfile.objects.get(id=request.user.id)
-        
-        user_intakes = (
-            f"User intakes:\n"
-            f"Calorie intake: {user_profile.calorie_intake}\n"
-            f"Carbohydrates intake: {user_profile.carbohydrate_intake}\n"
-            f"Protein intake: {user_profile.protein_intake}\n"
-            f"Fat intake: {user_profile.fat_intake}\n"
-        )
-
-        current_time_of_day = now.strftime("%H:%M")
-        
-        full_prompt = (
-            "You are an AI nutritionist. Based on the following user intakes, the meals consumed at the current meal, and the current time of day, "
-            "provide a brief summary and advice on how to balance nutrition and optimize the user's diet for the current meal:\n"
-            f"Current meal: {meal_type}. "
-            f"Current time of day: {current_time_of_day}\n"
-            f"{user_intakes}\n"
-            f"Food consumed during the meal: {food_description}\n"
-            "Your answer must containt only concise summary in 5-6 sentences about how to improve this meal and overall diet balance."
-        ) if meal_type != "daily" else (
-            "You are an AI nutritionist. Based on the following user intakes, and the current time of day, "
-            "provide a brief summary and advice on how to balance nutrition and optimize the user's diet for the current day:\n"
-            f"Current time of day: {current_time_of_day}\n"
-            f"{user_intakes}\n"
-            f"Food consumed during the day: {food_description}\n"
-            "Your answer must containt only concise summary in 5-6 sentences about how to improve this meal and overall diet balance."
-        )
-        
-        messages = [
-            ChatMessage(role="user", content=full_prompt)
-        ]
-
-        response = client.chat.completions.create(
-            model="jamba-instruct-preview",
-            messages=messages,
-            top_p=0.8,
-            temperature=0.1
-        )
-
-        full_response = response.dict()
-        assistant_content = full_response["choices"][0]["message"]["content"]
-        
-        return Response(assistant_content)
+    @action(detail=False, methods=['get'], url_path='range', permission_classes=[permissions.IsAuthenticated])
+    def date_range(self, request):
+        """
+        Meals and totals for the local days ?date= (or ?from= to ?to=) in the
+        client's ?tz=, served by the (owner, datetime) index.
+        """
+        tz = timezone_param(request)
+        date_from = date_param(request, 'date') or date_param(request, 'from') or timezone.localdate(timezone=tz)
+        date_to = date_param(request, 'to') or date_from
+
+        if date_to < date_from:
+            return Response({'detail': "'to' must not be before 'from'."}, status=status.HTTP_400_BAD_REQUEST)
+        if (date_to - date_from).days >= self.max_range_days:
+            return Response({'detail': f'Date range is limited to {self.max_range_days} days.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        range_start, range_end = day_bounds(date_from, date_to, tz)
+        meals = list(self.get_queryset().filter(datetime__gte=range_start, datetime__lt=range_end))
+
+        totals = empty_totals()
+        for meal in meals:
+            for nutrient in NUTRIENTS:
+                totals[nutrient] += getattr(meal, f'portion_{nutrient}')
+
+        return Response({
+            'from': date_from,
+            'to': date_to,
+            'tz': str(tz),
+            'meal_count': len(meals),
+            'totals': {nutrient: round(value, 2) for nutrient, value in totals.items()},
+            'meals': self.get_serializer(meals, many=True).data,
+        })
+    
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def summary(self, request):
+        """
+        Per-day totals and remaining budget from ?from= to ?to=, read from the
+        daily rollups and so reported in server-timezone (?tz=) days.
+        """
+        tz = summary_timezone_param(request)
+        date_from = date_param(request, 'from') or timezone.localdate(timezone=tz)
+        date_to = date_param(request, 'to') or date_from
+
+        if date_to < date_from:
+            return Response({'detail': "'to' must not be before 'from'."}, status=status.HTTP_400_BAD_REQUEST)
+        if (date_to - date_from).days >= MAX_SUMMARY_DAYS:
+            return Response({'detail': f'Date range is limited to {MAX_SUMMARY_DAYS} days.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({**build_summary(request.user, date_from, date_to), 'tz': str(tz)})
 
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def trends(self, request):
+        """
+        Daily totals from ?from= to ?to= with rolling averages over the last 7
+        (?period=week) or 30 (?period=month) days, deviations from the user's
+        targets and per-week or per-month averages, in the server-timezone
+        (?tz=) days of the daily rollups.
+        """
+        tz = summary_timezone_param(request)
+        period = request.query_params.get('period', 'week')
+        if period not in PERIODS:
+            return Response({'detail': f"'period' must be one of: {', '.join(PERIODS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        date_to = date_param(request, 'to') or timezone.localdate(timezone=tz)
+        date_from = date_param(request, 'from') or date_to - timedelta(days=settings.TRENDS['DEFAULT_DAYS'] - 1)
+
+        if date_to < date_from:
+            return Response({'detail': "'to' must not be before 'from'."}, status=status.HTTP_400_BAD_REQUEST)
+        if (date_to - date_from).days >= settings.TRENDS['MAX_DAYS']:
+            return Response({'detail': f"Date range is limited to {settings.TRENDS['MAX_DAYS']} days."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({**build_trends(request.user, period, date_from, date_to), 'tz': str(tz)})
 
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def export(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in STREAMERS:
+            return Response({'detail': f"'output' must be one of: {', '.join(STREAMERS)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = UserMeal.objects.filter(owner=request.user)
+        tz = timezone_param(request)
+        date_from = date_param(request, 'from')
+        date_to = date_param(request, 'to')
+        if date_from:
+            queryset = queryset.filter(datetime__gte=start_of_day(date_from, tz))
+        if date_to:
+            queryset = queryset.filter(datetime__lt=start_of_day(date_to + timedelta(days=1), tz))
+
+        response = StreamingHttpResponse(STREAMERS[output](queryset), content_type=CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="meals.{output}"'
+        return response
+
+class AdviceJobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    POST queues an ai_advice job and answers 202 with its id; poll GET
+    /advicejobs/<id>/ until status is done or failed. Submitting takes from
+    the same rate limit buckets as ai_advice.
+    """
+    serializer_class = AdviceJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        return AdviceJob.objects.filter(owner=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        wait = rate_limiter.check('ai_advice', request.user)
+        if wait:
+            raise Throttled(wait=math.ceil(wait))
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            job, _ = enqueue_advice(
+                request.user, serializer.validated_data['meal_type'], serializer.validated_data.get('tz', ''),
+            )
+        except QueueFull:
+            response = Response({'detail': 'Too many advice jobs are queued, try again later.'},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = str(settings.AI_JOBS['QUEUE_FULL_RETRY_AFTER'])
+            return response
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)